@@ -110,9 +110,39 @@ class R2Storage:
     def download_file(self, *, key: str, path: str) -> None:
         self.client.download_file(self.bucket, key, path)
 
+    def copy(self, *, src_key: str, dest_key: str) -> None:
+        """Server-side copy within the bucket (S3 CopyObject); the bytes never leave R2."""
+        self.client.copy_object(Bucket=self.bucket, Key=dest_key, CopySource={"Bucket": self.bucket, "Key": src_key})
+
     def delete(self, *, key: str) -> None:
         self.client.delete_object(Bucket=self.bucket, Key=key)
 
+    def delete_many(self, *, keys: Iterable[str]) -> list[str]:
+        """Delete keys with S3 DeleteObjects, 1000 per request; returns the keys that failed."""
+        failed: list[str] = []
+        batch: list[str] = []
+
+        def _flush() -> None:
+            try:
+                resp = self.client.delete_objects(
+                    Bucket=self.bucket,
+                    Delete={"Objects": [{"Key": k} for k in batch], "Quiet": True},
+                )
+            except Exception:
+                failed.extend(batch)
+                return
+            # Quiet mode only reports errors; a missing key counts as deleted.
+            failed.extend(str(e.get("Key")) for e in resp.get("Errors") or [] if e.get("Key"))
+
+        for key in keys:
+            batch.append(key)
+            if len(batch) >= 1000:
+                _flush()
+                batch = []
+        if batch:
+            _flush()
+        return failed
+
     def exists(self, *, key: str) -> bool:
         try:
             self.client.head_object(Bucket=self.bucket, Key=key)
@@ -0,0 +1,321 @@
+from __future__ import annotations
+
+import argparse
+import json
+import platform
+import shutil
+import sys
+import tempfile
+import time
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Iterator
+
+import numpy as np
+
+from app.domains.image_search.vectordb import ImageRecord, VectorliteVectorIndex
+
+# CPU-only recall/latency benchmark for VectorliteVectorIndex.
+#
+# Synthetic CLIP-like data: unit vectors drawn around a fixed set of cluster centres,
+# spread round-robin over projects. Vectors are generated chunk by chunk from per-chunk
+# seeds, so the 1M case never holds the whole matrix; ground truth is brute-forced over
+# the same chunks. Results are JSON so runs can be diffed across releases:
+#
+#   python -m app.domains.image_search.benchmark --sizes 10000,100000 --out bench.json
+
+
+@dataclass
+class SearchStats:
+    filtered: bool
+    ef: int | None
+    queries: int
+    p50_ms: float
+    p99_ms: float
+    mean_ms: float
+    recall: float
+
+
+@dataclass
+class SizeResult:
+    vectors: int
+    projects: int
+    insert_seconds: float
+    insert_per_second: float
+    rebuild_seconds: float
+    rebuild_per_second: float
+    db_bytes: int
+    searches: list[SearchStats] = field(default_factory=list)
+
+
+class SyntheticVectors:
+    """Deterministic clustered unit vectors; row i belongs to project i % projects."""
+
+    def __init__(self, *, dim: int, clusters: int, spread: float, projects: int, seed: int, chunk: int = 8192) -> None:
+        self.dim = int(dim)
+        self.projects = max(1, int(projects))
+        self.spread = float(spread)
+        self.seed = int(seed)
+        self.chunk = int(chunk)
+        rng = np.random.default_rng([self.seed, 0])
+        self.centres = _unit(rng.standard_normal((max(1, int(clusters)), self.dim)).astype(np.float32))
+
+    def _sample(self, rng: np.random.Generator, n: int) -> np.ndarray:
+        centres = self.centres[rng.integers(0, len(self.centres), size=n)]
+        noise = rng.standard_normal((n, self.dim)).astype(np.float32) * (self.spread / np.sqrt(self.dim))
+        return _unit(centres + noise)
+
+    def chunks(self, n: int) -> Iterator[tuple[int, np.ndarray]]:
+        """(first row, vectors) for rows [0, n)."""
+        for start in range(0, n, self.chunk):
+            rng = np.random.default_rng([self.seed, 1, start // self.chunk])
+            yield start, self._sample(rng, min(self.chunk, n - start))
+
+    def queries(self, count: int) -> np.ndarray:
+        return self._sample(np.random.default_rng([self.seed, 2]), int(count))
+
+    def project_of(self, row: int) -> str:
+        return f"bench-{row % self.projects}"
+
+
+def _unit(matrix: np.ndarray) -> np.ndarray:
+    return (matrix / (np.linalg.norm(matrix, axis=1, keepdims=True) + 1e-8)).astype(np.float32)
+
+
+def _image_id(row: int) -> str:
+    return f"{row:09d}"
+
+
+def _ground_truth(
+    data: SyntheticVectors, n: int, queries: np.ndarray, *, k: int, query_projects: list[int] | None
+) -> list[set[int]]:
+    """Exact top-k rows per query (restricted to the query's project when given)."""
+    best_sims = np.full((len(queries), k), -np.inf, dtype=np.float32)
+    best_rows = np.full((len(queries), k), -1, dtype=np.int64)
+    for start, chunk in data.chunks(n):
+        sims = queries @ chunk.T
+        rows = np.arange(start, start + len(chunk))
+        if query_projects is not None:
+            owner = rows % data.projects
+            sims[owner[None, :] != np.asarray(query_projects)[:, None]] = -np.inf
+        all_sims = np.concatenate([best_sims, sims], axis=1)
+        all_rows = np.concatenate([best_rows, np.broadcast_to(rows, sims.shape)], axis=1)
+        top = np.argpartition(-all_sims, k - 1, axis=1)[:, :k]
+        best_sims = np.take_along_axis(all_sims, top, axis=1)
+        best_rows = np.take_along_axis(all_rows, top, axis=1)
+    return [{int(r) for r, s in zip(rows, sims) if s > -np.inf} for rows, sims in zip(best_rows, best_sims)]
+
+
+def _percentile(values: list[float], q: float) -> float:
+    return round(float(np.percentile(values, q)), 3) if values else 0.0
+
+
+def _run_searches(
+    index: VectorliteVectorIndex,
+    data: SyntheticVectors,
+    queries: np.ndarray,
+    truth: list[set[int]],
+    *,
+    k: int,
+    ef: int | None,
+    filtered: bool,
+) -> SearchStats:
+    latencies: list[float] = []
+    hits = 0
+    wanted = 0
+    for i, query in enumerate(queries):
+        started = time.perf_counter()
+        if filtered:
+            found = index.search_records(project_id=data.project_of(i), vector=query, limit=k, ef=ef)
+            rows = {int(record.id) for record, _ in found}
+        else:
+            # Plain kNN over the whole graph (no project pre-filter).
+            ef_arg = "" if ef is None else f", {max(int(ef), k)}"
+            result = index.conn.execute(
+                f"""
+                SELECT ids.image_id
+                FROM {index._vtable} v
+                JOIN image_ids ids ON ids.internal_id = v.rowid
+                WHERE knn_search(v.embedding, knn_param(?, ?{ef_arg}))
+                """,
+                (query.tobytes(), k),
+            ).fetchall()
+            rows = {int(r[0]) for r in result}
+        latencies.append((time.perf_counter() - started) * 1000.0)
+        hits += len(rows & truth[i])
+        wanted += len(truth[i])
+    return SearchStats(
+        filtered=filtered,
+        ef=ef,
+        queries=len(queries),
+        p50_ms=_percentile(latencies, 50),
+        p99_ms=_percentile(latencies, 99),
+        mean_ms=round(float(np.mean(latencies)), 3) if latencies else 0.0,
+        recall=round(hits / max(1, wanted), 4),
+    )
+
+
+def run_size(
+    *,
+    n: int,
+    data: SyntheticVectors,
+    workdir: Path,
+    k: int,
+    query_count: int,
+    efs: list[int | None],
+    batch_size: int,
+    hnsw_m: int,
+    hnsw_ef_construction: int,
+    log=print,
+) -> SizeResult:
+    db_path = workdir / f"bench_{n}.db"
+    for stale in workdir.glob(f"{db_path.name}*"):
+        stale.unlink()
+    # Room for every vector up front: growth swaps would be timed as insert cost.
+    index = VectorliteVectorIndex(
+        db_path=db_path,
+        vector_dim=data.dim,
+        max_elements=int(n / 0.8) + 1,
+        exact_search_max_project_size=0,
+        hnsw_m=hnsw_m,
+        hnsw_ef_construction=hnsw_ef_construction,
+    )
+    try:
+        started = time.perf_counter()
+        for start, chunk in data.chunks(n):
+            for offset in range(0, len(chunk), batch_size):
+                rows = range(start + offset, start + min(offset + batch_size, len(chunk)))
+                index.upsert_images(
+                    items=[
+                        (
+                            ImageRecord(
+                                project_id=data.project_of(row),
+                                id=_image_id(row),
+                                r2_key=f"bench/{row}",
+                                content_type="image/jpeg",
+                                original_filename=None,
+                                size_bytes=0,
+                            ),
+                            chunk[row - start],
+                        )
+                        for row in rows
+                    ]
+                )
+            log(f"  inserted {min(start + len(chunk), n)}/{n}")
+        insert_seconds = time.perf_counter() - started
+
+        started = time.perf_counter()
+        index.rebuild_vector_index_from_vectors()
+        rebuild_seconds = time.perf_counter() - started
+        log(f"  insert {insert_seconds:.1f}s, rebuild {rebuild_seconds:.1f}s")
+
+        result = SizeResult(
+            vectors=n,
+            projects=data.projects,
+            insert_seconds=round(insert_seconds, 3),
+            insert_per_second=round(n / max(insert_seconds, 1e-9), 1),
+            rebuild_seconds=round(rebuild_seconds, 3),
+            rebuild_per_second=round(n / max(rebuild_seconds, 1e-9), 1),
+            db_bytes=db_path.stat().st_size,
+        )
+
+        queries = data.queries(query_count)
+        query_projects = [i % data.projects for i in range(len(queries))]
+        truths = {
+            False: _ground_truth(data, n, queries, k=k, query_projects=None),
+            True: _ground_truth(data, n, queries, k=k, query_projects=query_projects),
+        }
+        for filtered in (False, True):
+            for ef in efs:
+                stats = _run_searches(index, data, queries, truths[filtered], k=k, ef=ef, filtered=filtered)
+                result.searches.append(stats)
+                log(
+                    f"  filtered={filtered} ef={ef}: p50={stats.p50_ms}ms p99={stats.p99_ms}ms "
+                    f"recall@{k}={stats.recall}"
+                )
+        return result
+    finally:
+        index.close()
+
+
+def _parse_efs(raw: str) -> list[int | None]:
+    out: list[int | None] = []
+    for part in raw.split(","):
+        part = part.strip().lower()
+        if part:
+            out.append(None if part in {"default", "none"} else int(part))
+    return out
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="CPU recall/latency benchmark for the image search vector index.")
+    parser.add_argument("--sizes", default="10000,100000", help="comma-separated vector counts, e.g. 10000,100000,1000000")
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--clusters", type=int, default=256)
+    parser.add_argument("--spread", type=float, default=1.0, help="noise norm around each cluster centre")
+    parser.add_argument("--projects", type=int, default=16)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("-k", type=int, default=10)
+    parser.add_argument("--ef", default="default,64,256", help="ef_search values; 'default' = vectorlite's")
+    parser.add_argument("--batch-size", type=int, default=1000, help="images per upsert_images call")
+    parser.add_argument("--hnsw-m", type=int, default=16)
+    parser.add_argument("--hnsw-ef-construction", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workdir", help="where the benchmark DBs go (default: a temp dir, removed afterwards)")
+    parser.add_argument("--out", help="write the JSON report here as well as to stdout")
+    args = parser.parse_args(argv)
+
+    import vectorlite_py
+
+    data = SyntheticVectors(
+        dim=args.dim, clusters=args.clusters, spread=args.spread, projects=args.projects, seed=args.seed
+    )
+    workdir = Path(args.workdir) if args.workdir else Path(tempfile.mkdtemp(prefix="image_search_bench_"))
+    workdir.mkdir(parents=True, exist_ok=True)
+    report: dict = {
+        "meta": {
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "numpy": np.__version__,
+            "vectorlite": getattr(vectorlite_py, "__version__", None),
+            "dim": args.dim,
+            "clusters": args.clusters,
+            "spread": args.spread,
+            "projects": args.projects,
+            "queries": args.queries,
+            "k": args.k,
+            "hnsw_m": args.hnsw_m,
+            "hnsw_ef_construction": args.hnsw_ef_construction,
+            "seed": args.seed,
+        },
+        "results": [],
+    }
+    try:
+        for n in [int(s) for s in args.sizes.split(",") if s.strip()]:
+            print(f"{n} vectors:", file=sys.stderr)
+            result = run_size(
+                n=n,
+                data=data,
+                workdir=workdir,
+                k=args.k,
+                query_count=args.queries,
+                efs=_parse_efs(args.ef),
+                batch_size=max(1, args.batch_size),
+                hnsw_m=args.hnsw_m,
+                hnsw_ef_construction=args.hnsw_ef_construction,
+                log=lambda msg: print(msg, file=sys.stderr),
+            )
+            report["results"].append(asdict(result))
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    text = json.dumps(report, indent=2)
+    if args.out:
+        Path(args.out).write_text(text + "\n", encoding="utf-8")
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
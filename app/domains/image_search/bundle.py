@@ -0,0 +1,327 @@
+from __future__ import annotations
+
+import argparse
+import io
+import itertools
+import json
+import os
+import sys
+import tarfile
+import tempfile
+import time
+from dataclasses import replace
+from pathlib import Path, PurePosixPath
+from typing import Any, BinaryIO, Iterator
+
+import numpy as np
+
+from app.domains.image_search.vectordb import ImageRecord, decode_matrix
+
+# Project export/import bundles: move a project between servers without re-uploading the
+# images or re-running CLIP.
+#
+# A bundle is an uncompressed tar holding
+# - manifest.json: format/version, source project_id, count, vector_dim, model_name
+# - records.jsonl: one image record per line
+# - vectors.npy: (count, vector_dim) float32; row i is the embedding of line i
+# Float32-coded vectors are copied into vectors.npy as the raw stored bytes. R2 objects are
+# referenced by key, not included. An import never reuses those keys: every object is
+# copied server-side (CopyObject) to a key of the target project, so deleting the source
+# project or one of its images can't remove what the imported project serves. The
+# importing server therefore needs the source objects in its own bucket.
+#
+# Offline seeding (the server must not have the DB open: its HNSW lives in its process):
+#
+#   python -m app.domains.image_search.bundle export my_project --out my_project.tar
+#   python -m app.domains.image_search.bundle import my_project.tar --project my_project
+
+BUNDLE_FORMAT = "image-search-bundle"
+BUNDLE_VERSION = 1
+
+_RECORD_FIELDS = ("id", "r2_key", "content_type", "original_filename", "size_bytes", "sha256")
+
+
+class BundleError(ValueError):
+    pass
+
+
+class _ChainReader(io.RawIOBase):
+    """Read a bytes prefix followed by a file, as one stream (npy header + raw rows)."""
+
+    def __init__(self, prefix: bytes, tail: BinaryIO) -> None:
+        self._prefix = io.BytesIO(prefix)
+        self._tail = tail
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        n = self._prefix.readinto(buffer)
+        if n:
+            return n
+        return self._tail.readinto(buffer)
+
+
+def _add_member(tar: tarfile.TarFile, name: str, size: int, fileobj: BinaryIO) -> None:
+    info = tarfile.TarInfo(name)
+    info.size = int(size)
+    info.mtime = int(time.time())
+    info.mode = 0o644
+    tar.addfile(info, fileobj)
+
+
+def write_bundle(
+    index: Any, *, project_id: str, out: BinaryIO, model_name: str | None = None, chunk_size: int = 4096
+) -> int:
+    """Write the project's bundle to `out` (one read snapshot of the DB); returns the image count."""
+    dim = int(index.vector_dim)
+    count = 0
+    with tempfile.TemporaryDirectory(prefix="image_search_export_") as tmp:
+        records_path = Path(tmp) / "records.jsonl"
+        vectors_path = Path(tmp) / "vectors.raw"
+        with records_path.open("wb") as records_f, vectors_path.open("wb") as vectors_f:
+            for page in index.iter_project_export(project_id=project_id, chunk_size=chunk_size):
+                lines = [
+                    json.dumps({field: getattr(record, field) for field in _RECORD_FIELDS}, ensure_ascii=False)
+                    for record, _ in page
+                ]
+                records_f.write(("\n".join(lines) + "\n").encode("utf-8"))
+                blobs = [blob for _, blob in page]
+                if all(len(blob) == 4 * dim for blob in blobs):
+                    vectors_f.write(b"".join(blobs))
+                else:
+                    vectors_f.write(decode_matrix(blobs, dim=dim).tobytes())
+                count += len(page)
+
+        header = io.BytesIO()
+        np.lib.format.write_array_header_1_0(
+            header, {"descr": np.dtype("<f4").str, "fortran_order": False, "shape": (count, dim)}
+        )
+        manifest = json.dumps(
+            {
+                "format": BUNDLE_FORMAT,
+                "version": BUNDLE_VERSION,
+                "project_id": project_id,
+                "count": count,
+                "vector_dim": dim,
+                "model_name": model_name,
+                "exported_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            }
+        ).encode("utf-8")
+
+        with tarfile.open(fileobj=out, mode="w|") as tar:
+            _add_member(tar, "manifest.json", len(manifest), io.BytesIO(manifest))
+            with records_path.open("rb") as f:
+                _add_member(tar, "records.jsonl", records_path.stat().st_size, f)
+            with vectors_path.open("rb") as f:
+                size = len(header.getvalue()) + vectors_path.stat().st_size
+                _add_member(tar, "vectors.npy", size, io.BufferedReader(_ChainReader(header.getvalue(), f)))
+    return count
+
+
+class Bundle:
+    """A bundle opened for import (`fileobj` must be seekable)."""
+
+    def __init__(self, fileobj: BinaryIO, *, vector_dim: int | None = None, model_name: str | None = None) -> None:
+        try:
+            self._tar = tarfile.open(fileobj=fileobj, mode="r:")
+        except tarfile.TarError as exc:
+            raise BundleError(f"Not a bundle (tar) file: {exc}") from exc
+        try:
+            self.manifest = json.loads(self._member("manifest.json").read())
+        except BundleError:
+            raise
+        except Exception as exc:
+            raise BundleError(f"Invalid bundle manifest: {exc}") from exc
+        if self.manifest.get("format") != BUNDLE_FORMAT or self.manifest.get("version") != BUNDLE_VERSION:
+            raise BundleError(
+                f"Unsupported bundle format: {self.manifest.get('format')} v{self.manifest.get('version')}"
+            )
+        self.count = int(self.manifest.get("count", 0))
+        self.vector_dim = int(self.manifest.get("vector_dim", 0))
+        if vector_dim is not None and self.vector_dim != int(vector_dim):
+            raise BundleError(f"Bundle vectors have dim {self.vector_dim}, this server uses {vector_dim}")
+        exported_model = self.manifest.get("model_name")
+        if exported_model and model_name and exported_model != model_name:
+            raise BundleError(f"Bundle vectors come from model {exported_model}, this server uses {model_name}")
+
+    def _member(self, name: str) -> BinaryIO:
+        try:
+            f = self._tar.extractfile(name)
+        except KeyError:
+            f = None
+        if f is None:
+            raise BundleError(f"Bundle is missing {name}")
+        return f
+
+    def chunks(self, *, project_id: str, chunk_size: int = 2048) -> Iterator[list[tuple[ImageRecord, np.ndarray]]]:
+        """(record, vector) pages, with every record moved into `project_id`."""
+        vectors = self._member("vectors.npy")
+        try:
+            version = np.lib.format.read_magic(vectors)
+            shape, fortran_order, dtype = (
+                np.lib.format.read_array_header_1_0(vectors)
+                if version == (1, 0)
+                else np.lib.format.read_array_header_2_0(vectors)
+            )
+        except Exception as exc:
+            raise BundleError(f"Invalid vectors.npy: {exc}") from exc
+        if fortran_order or dtype.kind != "f" or tuple(shape) != (self.count, self.vector_dim):
+            raise BundleError(
+                f"vectors.npy has shape {tuple(shape)} / {dtype}, expected ({self.count}, {self.vector_dim})"
+            )
+        row_bytes = self.vector_dim * dtype.itemsize
+
+        records = io.TextIOWrapper(self._member("records.jsonl"), encoding="utf-8")
+        lines = (line for line in records if line.strip())
+        done = 0
+        while True:
+            page = list(itertools.islice(lines, chunk_size))
+            if not page:
+                break
+            raw = vectors.read(row_bytes * len(page))
+            if len(raw) != row_bytes * len(page):
+                raise BundleError("vectors.npy has fewer rows than records.jsonl")
+            matrix = np.frombuffer(raw, dtype=dtype).reshape(len(page), self.vector_dim).astype(np.float32)
+            yield [(_record_from_line(line, project_id=project_id), matrix[i]) for i, line in enumerate(page)]
+            done += len(page)
+        if done != self.count:
+            raise BundleError(f"records.jsonl has {done} records, manifest says {self.count}")
+
+    def close(self) -> None:
+        self._tar.close()
+
+
+def _record_from_line(line: str, *, project_id: str) -> ImageRecord:
+    try:
+        data = json.loads(line)
+        return ImageRecord(
+            project_id=project_id,
+            id=str(data["id"]),
+            r2_key=str(data["r2_key"]),
+            content_type=str(data["content_type"]),
+            original_filename=data.get("original_filename"),
+            size_bytes=int(data["size_bytes"]),
+            sha256=data.get("sha256"),
+        )
+    except Exception as exc:
+        raise BundleError(f"Invalid bundle record: {exc}") from exc
+
+
+def rekey_items(
+    items: list[tuple[ImageRecord, np.ndarray]], *, r2_prefix: str
+) -> tuple[list[tuple[ImageRecord, np.ndarray]], list[tuple[str, str]]]:
+    """Point imported records at keys of their own project; returns (items, (src, dest) copies).
+
+    Keys follow the upload scheme `{prefix}{project_id}/{image_id}{suffix}`. A record whose
+    key already is that (a bundle imported back into its own project) needs no copy.
+    """
+    out: list[tuple[ImageRecord, np.ndarray]] = []
+    copies: list[tuple[str, str]] = []
+    for record, vector in items:
+        dest = f"{r2_prefix}{record.project_id}/{record.id}{PurePosixPath(record.r2_key).suffix}"
+        if dest != record.r2_key:
+            copies.append((record.r2_key, dest))
+            record = replace(record, r2_key=dest)
+        out.append((record, vector))
+    return out, copies
+
+
+def import_bundle(
+    index: Any, bundle: Bundle, *, project_id: str, r2: Any, r2_prefix: str, chunk_size: int = 2048
+) -> int:
+    """Copy a bundle's R2 objects and bulk-insert it into `index` (same ids overwrite); returns the count."""
+    imported = 0
+    for items in bundle.chunks(project_id=project_id, chunk_size=chunk_size):
+        items, copies = rekey_items(items, r2_prefix=r2_prefix)
+        for src, dest in copies:
+            r2.copy(src_key=src, dest_key=dest)
+        index.upsert_images(items=items)
+        imported += len(items)
+    return imported
+
+
+def _open_index(*, db_path: Path, project_id: str, vector_dim: int):
+    from app.domains.image_search.sharding import shard_db_path, shard_of
+    from app.domains.image_search.vectordb import VectorliteVectorIndex
+
+    def env_int(name: str, default: str) -> int:
+        return int((os.getenv(name) or default).strip())
+
+    shards = max(1, env_int("IMAGE_SEARCH_SHARDS", "1"))
+    persist = (os.getenv("IMAGE_SEARCH_HNSW_PERSIST", "1") or "").strip().lower() in {"1", "true", "yes", "y", "on"}
+    return VectorliteVectorIndex(
+        db_path=shard_db_path(db_path, shard_of(project_id, shards), shards),
+        vector_dim=vector_dim,
+        max_elements=env_int("IMAGE_SEARCH_MAX_ELEMENTS", "50000"),
+        vector_codec=(os.getenv("IMAGE_SEARCH_VECTOR_CODEC") or "float32").strip().lower(),
+        index_file=persist,
+        hnsw_m=env_int("IMAGE_SEARCH_HNSW_M", "16"),
+        hnsw_ef_construction=env_int("IMAGE_SEARCH_HNSW_EF_CONSTRUCTION", "200"),
+    )
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Export/import image search project bundles.")
+    parser.add_argument("--db", help="image search DB path (default: IMAGE_SEARCH_DB_PATH)")
+    sub = parser.add_subparsers(dest="command", required=True)
+    export = sub.add_parser("export", help="write a project's bundle")
+    export.add_argument("project_id")
+    export.add_argument("--out", required=True, help="bundle path ('-' for stdout)")
+    export.add_argument("--dim", type=int, default=768, help="vector dim of the DB")
+    imp = sub.add_parser("import", help="load a bundle into a project")
+    imp.add_argument("bundle")
+    imp.add_argument("--project", help="target project_id (default: the exported project)")
+    args = parser.parse_args(argv)
+
+    if args.db:
+        db_path = Path(args.db)
+    else:
+        from app.domains.image_search.model import resolve_db_path_from_env
+
+        db_path = resolve_db_path_from_env()
+
+    if args.command == "export":
+        index = _open_index(db_path=db_path, project_id=args.project_id, vector_dim=args.dim)
+        try:
+            if not index.project_exists(project_id=args.project_id):
+                raise SystemExit(f"Project not found: {args.project_id}")
+            if args.out == "-":
+                count = write_bundle(index, project_id=args.project_id, out=sys.stdout.buffer)
+            else:
+                with open(args.out, "wb") as out:
+                    count = write_bundle(index, project_id=args.project_id, out=out)
+        finally:
+            index.close()
+        print(f"Exported {count} images of {args.project_id}", file=sys.stderr)
+        return
+
+    from app.core.storage.r2 import R2Storage, r2_enabled_from_env
+
+    if not r2_enabled_from_env():
+        raise SystemExit("R2 must be enabled (R2_ENABLED=1): import copies the bundle's objects to the project")
+    r2 = R2Storage.from_env()
+    r2_prefix = (os.getenv("IMAGE_SEARCH_REMOTE_PREFIX", "AI/SEARCH/") or "").strip()
+    if r2_prefix and not r2_prefix.endswith("/"):
+        r2_prefix += "/"
+
+    with open(args.bundle, "rb") as f:
+        try:
+            bundle = Bundle(f)
+        except BundleError as exc:
+            raise SystemExit(str(exc)) from exc
+        project_id = args.project or str(bundle.manifest.get("project_id") or "")
+        if not project_id:
+            raise SystemExit("--project is required: the bundle doesn't name its project")
+        index = _open_index(db_path=db_path, project_id=project_id, vector_dim=bundle.vector_dim)
+        try:
+            count = import_bundle(index, bundle, project_id=project_id, r2=r2, r2_prefix=r2_prefix)
+        except BundleError as exc:
+            raise SystemExit(str(exc)) from exc
+        finally:
+            index.close()
+    print(f"Imported {count} images into {project_id}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
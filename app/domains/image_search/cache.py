@@ -0,0 +1,281 @@
+from __future__ import annotations
+
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Hashable
+
+import numpy as np
+
+from app.domains.image_search.vectordb import ImageRecord
+
+SearchResults = list[tuple[ImageRecord, float]]
+
+
+class SearchResultCache:
+    """In-process LRU + TTL cache of search results, keyed by (project, mode, query, limit, ef).
+
+    Every write to a project bumps its generation. Entries remember the generation they
+    were computed under and only hit while it is still current, so a search that raced a
+    write can never serve pre-write results after the write returned. Only used from the
+    event loop, so no locking.
+    """
+
+    def __init__(self, *, max_entries: int = 1024, ttl_seconds: float = 60.0) -> None:
+        self.max_entries = max(0, int(max_entries))
+        self.ttl_seconds = float(ttl_seconds)
+        self._entries: OrderedDict[Hashable, tuple[int, float, SearchResults]] = OrderedDict()
+        self._generations: dict[str, int] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0 and self.ttl_seconds > 0
+
+    def generation(self, project_id: str) -> int:
+        return self._generations.get(project_id, 0)
+
+    def invalidate(self, project_id: str) -> None:
+        """Bump the project's write generation; its cached results stop matching."""
+        self._generations[project_id] = self.generation(project_id) + 1
+        self.invalidations += 1
+
+    def get(
+        self, *, project_id: str, query: str, limit: int, mode: str = "vector", ef: int | None = None
+    ) -> SearchResults | None:
+        if not self.enabled:
+            return None
+        key = (project_id, mode, query, int(limit), ef)
+        entry = self._entries.get(key)
+        if entry is not None:
+            generation, expires_at, results = entry
+            if generation == self.generation(project_id) and expires_at > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return list(results)
+            del self._entries[key]
+        self.misses += 1
+        return None
+
+    def put(
+        self,
+        *,
+        project_id: str,
+        query: str,
+        limit: int,
+        generation: int,
+        results: SearchResults,
+        mode: str = "vector",
+        ef: int | None = None,
+    ) -> None:
+        """Store results computed while `generation` was current (read it before searching)."""
+        if not self.enabled or generation != self.generation(project_id):
+            return
+        key = (project_id, mode, query, int(limit), ef)
+        self._entries[key] = (generation, time.monotonic() + self.ttl_seconds, list(results))
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self) -> dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
+
+
+class TextEmbeddingCache:
+    """Two-level cache of query text embeddings: an in-memory LRU over an SQLite store.
+
+    Keyed by (model_name, normalized text), so switching CLIP models never serves vectors
+    from the old one. The store survives restarts and counts hits per query, which makes
+    it the query log `warm` loads the most used queries from. Called from worker threads.
+    """
+
+    FLUSH_HITS_EVERY = 256
+
+    def __init__(self, *, path: Path | None, max_entries: int = 4096, max_disk_entries: int = 200_000) -> None:
+        self.path = path
+        self.max_entries = max(0, int(max_entries))
+        self.max_disk_entries = max(1, int(max_disk_entries))
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[tuple[str, str], np.ndarray] = OrderedDict()
+        self._pending_hits: dict[tuple[str, str], int] = {}
+        self._puts = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        self._conn: sqlite3.Connection | None = None
+        if path is not None:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(str(path), check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS text_embeddings (
+                    model_name TEXT NOT NULL,
+                    text TEXT NOT NULL,
+                    embedding BLOB NOT NULL,
+                    hits INTEGER NOT NULL DEFAULT 0,
+                    last_used_at REAL NOT NULL,
+                    PRIMARY KEY (model_name, text)
+                )
+                """
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS text_embeddings_hits ON text_embeddings(hits)")
+            self._conn.commit()
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        # Only changes that can't change the tokenization: NFC + collapsed/stripped whitespace.
+        return re.sub(r"\s+", " ", unicodedata.normalize("NFC", text or "")).strip()
+
+    def _remember(self, key: tuple[str, str], vector: np.ndarray) -> None:
+        if self.max_entries <= 0:
+            return
+        self._entries[key] = vector
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _count_hit(self, key: tuple[str, str]) -> None:
+        if self._conn is None:
+            return
+        self._pending_hits[key] = self._pending_hits.get(key, 0) + 1
+        if sum(self._pending_hits.values()) >= self.FLUSH_HITS_EVERY:
+            self._flush_hits()
+
+    def _flush_hits(self) -> None:
+        if self._conn is None or not self._pending_hits:
+            return
+        now = time.time()
+        with self._conn:
+            self._conn.executemany(
+                "UPDATE text_embeddings SET hits = hits + ?, last_used_at = ? WHERE model_name = ? AND text = ?",
+                [(n, now, model_name, text) for (model_name, text), n in self._pending_hits.items()],
+            )
+        self._pending_hits.clear()
+
+    def get(self, *, model_name: str, text: str) -> np.ndarray | None:
+        key = (model_name, self.normalize(text))
+        with self._lock:
+            vector = self._entries.get(key)
+            if vector is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                self._count_hit(key)
+                return vector
+            if self._conn is not None:
+                row = self._conn.execute(
+                    "SELECT embedding FROM text_embeddings WHERE model_name = ? AND text = ?", key
+                ).fetchone()
+                if row is not None:
+                    vector = np.frombuffer(row[0], dtype=np.float32)
+                    self._remember(key, vector)
+                    self.disk_hits += 1
+                    self._count_hit(key)
+                    return vector
+            self.misses += 1
+            return None
+
+    def put(self, *, model_name: str, text: str, vector: np.ndarray) -> np.ndarray:
+        """Cache `vector` for `text`; returns the (read-only, float32) cached copy."""
+        key = (model_name, self.normalize(text))
+        vector = np.array(vector, dtype=np.float32, copy=True)
+        vector.setflags(write=False)
+        with self._lock:
+            self._remember(key, vector)
+            if self._conn is not None:
+                with self._conn:
+                    self._conn.execute(
+                        """
+                        INSERT INTO text_embeddings(model_name, text, embedding, hits, last_used_at)
+                        VALUES (?, ?, ?, 1, ?)
+                        ON CONFLICT(model_name, text) DO UPDATE SET embedding = excluded.embedding
+                        """,
+                        (*key, vector.tobytes(), time.time()),
+                    )
+                self._puts += 1
+                if self._puts % 1000 == 0:
+                    self._prune()
+        return vector
+
+    def _prune(self) -> None:
+        # Drop the least used entries once the store outgrows max_disk_entries.
+        row = self._conn.execute("SELECT COUNT(*) FROM text_embeddings").fetchone()
+        excess = int(row[0]) - self.max_disk_entries
+        if excess > 0:
+            with self._conn:
+                self._conn.execute(
+                    """
+                    DELETE FROM text_embeddings WHERE rowid IN (
+                        SELECT rowid FROM text_embeddings ORDER BY hits, last_used_at LIMIT ?
+                    )
+                    """,
+                    (excess,),
+                )
+
+    def warm(self, *, model_name: str, limit: int) -> list[str]:
+        """Load the `limit` most used queries of `model_name` into memory.
+
+        Returns the most used queries that have no embedding for `model_name` yet (e.g.
+        right after a model change), for the caller to embed in the background.
+        """
+        if self._conn is None or limit <= 0:
+            return []
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT text, embedding FROM text_embeddings WHERE model_name = ? ORDER BY hits DESC LIMIT ?",
+                (model_name, min(int(limit), self.max_entries)),
+            ).fetchall()
+            for text, blob in reversed(rows):
+                vector = np.frombuffer(blob, dtype=np.float32)
+                self._remember((model_name, str(text)), vector)
+            missing = self._conn.execute(
+                """
+                SELECT text FROM text_embeddings
+                WHERE model_name != ?
+                  AND text NOT IN (SELECT text FROM text_embeddings WHERE model_name = ?)
+                GROUP BY text ORDER BY SUM(hits) DESC LIMIT ?
+                """,
+                (model_name, model_name, int(limit)),
+            ).fetchall()
+        return [str(r[0]) for r in missing]
+
+    def stats(self) -> dict[str, Any]:
+        lookups = self.hits + self.disk_hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_ratio": round((self.hits + self.disk_hits) / lookups, 4) if lookups else 0.0,
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is None:
+                return
+            try:
+                self._flush_hits()
+            finally:
+                self._conn.close()
+                self._conn = None
@@ -0,0 +1,347 @@
+from __future__ import annotations
+
+import time
+from dataclasses import dataclass
+from functools import partial
+from pathlib import Path
+from typing import Any, BinaryIO, Callable, TypeVar
+
+import anyio
+import numpy as np
+
+from app.core.errors.exceptions import AppError
+from app.domains.image_search.bundle import write_bundle
+from app.domains.image_search.cache import SearchResultCache
+from app.domains.image_search.vectordb import ImageRecord
+
+T = TypeVar("T")
+
+
+@dataclass
+class CallStats:
+    calls: int = 0
+    errors: int = 0
+    rejected: int = 0
+    wait_ms_total: float = 0.0
+    wait_ms_max: float = 0.0
+    run_ms_total: float = 0.0
+    run_ms_max: float = 0.0
+
+    def to_dict(self) -> dict[str, Any]:
+        calls = max(1, self.calls)
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "rejected": self.rejected,
+            "wait_ms_avg": round(self.wait_ms_total / calls, 3),
+            "wait_ms_max": round(self.wait_ms_max, 3),
+            "run_ms_avg": round(self.run_ms_total / calls, 3),
+            "run_ms_max": round(self.run_ms_max, 3),
+        }
+
+
+class DBExecutor:
+    """Async front for the image-search DB.
+
+    Every call runs on a worker thread so SQLite work never blocks the event loop. Reads,
+    searches and writes have separate thread limiters: reads up to the read-pool size in
+    total, searches up to `search_concurrency` per shard, writes one at a time per shard
+    (matching each shard's single writer connection). Searches get their own limiter
+    because HNSW kNN runs on the writer connection and waits behind writes; queued
+    searches must not use up the threads of metadata reads. At
+    most `max_queue` calls of a kind may be in flight (queued or running); beyond that
+    callers get DB_BUSY (503) instead of piling up. Each call is timed (queue wait and run
+    time) per method name. Image writes bump the project's generation in `search_cache`,
+    invalidating its cached results.
+    """
+
+    def __init__(
+        self,
+        *,
+        vector_index: Any,
+        record_store: Any | None = None,
+        read_concurrency: int = 4,
+        search_concurrency: int | None = None,
+        max_queue: int = 256,
+        slow_ms: float = 1000.0,
+        search_cache: SearchResultCache | None = None,
+    ) -> None:
+        self.vector_index = vector_index
+        self.record_store = record_store if record_store is not None else vector_index
+        self.max_queue = max(1, int(max_queue))
+        self.slow_ms = float(slow_ms)
+        self.shard_count = len(getattr(vector_index, "shards", None) or [vector_index])
+        self._read_limiter = anyio.CapacityLimiter(max(1, int(read_concurrency)) * self.shard_count)
+        search_concurrency = read_concurrency if search_concurrency is None else search_concurrency
+        self._search_limiters = [
+            anyio.CapacityLimiter(max(1, int(search_concurrency))) for _ in range(self.shard_count)
+        ]
+        self._write_limiters = [anyio.CapacityLimiter(1) for _ in range(self.shard_count)]
+        self._waiting = {"read": 0, "search": 0, "write": 0}
+        self._stats: dict[str, CallStats] = {}
+        self.search_cache = search_cache
+
+    def shard_of(self, project_id: str) -> int:
+        shard_of = getattr(self.vector_index, "shard_of", None)
+        return shard_of(project_id) if callable(shard_of) else 0
+
+    def index(self, shard: int = 0) -> Any:
+        """The VectorliteVectorIndex of one shard (the index itself when unsharded)."""
+        shards = getattr(self.vector_index, "shards", None)
+        return shards[shard] if shards else self.vector_index
+
+    async def _call(self, kind: str, name: str, fn: Callable[[], T], *, shard: int = 0) -> T:
+        stats = self._stats.setdefault(name, CallStats())
+        if self._waiting[kind] >= self.max_queue:
+            stats.rejected += 1
+            raise AppError(
+                code="DB_BUSY",
+                message="Image search DB is busy, retry later",
+                http_status=503,
+                detail={"kind": kind, "queued": self._waiting[kind]},
+            )
+
+        queued_at = time.perf_counter()
+        started_at = queued_at
+
+        def _run() -> T:
+            nonlocal started_at
+            started_at = time.perf_counter()
+            return fn()
+
+        self._waiting[kind] += 1
+        try:
+            if kind == "read":
+                limiter = self._read_limiter
+            elif kind == "search":
+                limiter = self._search_limiters[shard]
+            else:
+                limiter = self._write_limiters[shard]
+            return await anyio.to_thread.run_sync(_run, limiter=limiter)
+        except BaseException:
+            stats.errors += 1
+            raise
+        finally:
+            self._waiting[kind] -= 1
+            finished_at = time.perf_counter()
+            wait_ms = (started_at - queued_at) * 1000.0
+            run_ms = (finished_at - started_at) * 1000.0
+            stats.calls += 1
+            stats.wait_ms_total += wait_ms
+            stats.wait_ms_max = max(stats.wait_ms_max, wait_ms)
+            stats.run_ms_total += run_ms
+            stats.run_ms_max = max(stats.run_ms_max, run_ms)
+            if run_ms + wait_ms >= self.slow_ms:
+                print(f"WARNING: slow image search DB call: {name} wait_ms={wait_ms:.1f} run_ms={run_ms:.1f}")
+
+    async def read(self, name: str, fn: Callable[[], T]) -> T:
+        return await self._call("read", name, fn)
+
+    async def search(self, name: str, fn: Callable[[], T], *, project_id: str) -> T:
+        return await self._call("search", name, fn, shard=self.shard_of(project_id))
+
+    async def write(self, name: str, fn: Callable[[], T], *, shard: int = 0) -> T:
+        return await self._call("write", name, fn, shard=shard)
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "queued": dict(self._waiting),
+            "calls": {name: s.to_dict() for name, s in sorted(self._stats.items())},
+        }
+
+    # ----- reads -----
+
+    async def project_exists(self, *, project_id: str) -> bool:
+        exists = getattr(self.record_store, "project_exists", None)
+        if not callable(exists):
+            return True
+        return await self.read("project_exists", partial(exists, project_id=project_id))
+
+    async def get_record(self, *, project_id: str, image_id: str) -> ImageRecord | None:
+        return await self.read(
+            "get_record", partial(self.record_store.get_record, project_id=project_id, image_id=image_id)
+        )
+
+    async def list_records(
+        self, *, project_id: str, limit: int | None = None, after: str | None = None
+    ) -> list[ImageRecord]:
+        return await self.read(
+            "list_records",
+            partial(self.record_store.list_records, project_id=project_id, limit=limit, after=after),
+        )
+
+    async def find_records_by_sha256(self, *, project_id: str, sha256s: list[str]) -> dict[str, ImageRecord]:
+        find = getattr(self.record_store, "find_records_by_sha256", None)
+        if not callable(find):
+            return {}
+        return await self.read("find_records_by_sha256", partial(find, project_id=project_id, sha256s=sha256s))
+
+    async def get_vector(self, *, project_id: str, image_id: str) -> np.ndarray | None:
+        return await self.read(
+            "get_vector", partial(self.vector_index.get_vector, project_id=project_id, image_id=image_id)
+        )
+
+    async def vectors_by_sha256(self, *, sha256s: list[str]) -> dict[str, np.ndarray]:
+        vectors = getattr(self.vector_index, "vectors_by_sha256", None)
+        if not callable(vectors):
+            return {}
+        return await self.read("vectors_by_sha256", partial(vectors, sha256s))
+
+    async def search_records(
+        self, *, project_id: str, vector: np.ndarray, limit: int, ef: int | None = None
+    ) -> list[tuple[ImageRecord, float]]:
+        return await self.search(
+            "search_records",
+            partial(self._search_records, project_id=project_id, vector=vector, limit=limit, ef=ef),
+            project_id=project_id,
+        )
+
+    def _search_records(
+        self, *, project_id: str, vector: np.ndarray, limit: int, ef: int | None = None
+    ) -> list[tuple[ImageRecord, float]]:
+        # Prefer a single DB query that also returns metadata.
+        search_records = getattr(self.vector_index, "search_records", None)
+        if callable(search_records):
+            if ef is None:
+                return search_records(project_id=project_id, vector=vector, limit=limit)
+            return search_records(project_id=project_id, vector=vector, limit=limit, ef=ef)
+
+        # Fallback: resolve ids to records (older interface).
+        ids = self.vector_index.search(vector=vector, limit=limit)
+        out: list[tuple[ImageRecord, float]] = []
+        for image_id, score in ids:
+            rec = self.record_store.get_record(project_id=project_id, image_id=image_id)
+            if rec is not None:
+                out.append((rec, score))
+        return out
+
+    async def search_records_text(self, *, project_id: str, query: str, limit: int) -> list[tuple[ImageRecord, float]]:
+        return await self.search(
+            "search_records_text",
+            partial(self.vector_index.search_records_text, project_id=project_id, query=query, limit=limit),
+            project_id=project_id,
+        )
+
+    async def search_records_hybrid(
+        self,
+        *,
+        project_id: str,
+        query: str,
+        vector: np.ndarray,
+        limit: int,
+        candidates: int,
+        rrf_k: int,
+        ef: int | None = None,
+    ) -> list[tuple[ImageRecord, float]]:
+        return await self.search(
+            "search_records_hybrid",
+            partial(
+                self.vector_index.search_records_hybrid,
+                project_id=project_id,
+                query=query,
+                vector=vector,
+                limit=limit,
+                candidates=candidates,
+                rrf_k=rrf_k,
+                ef=ef,
+            ),
+            project_id=project_id,
+        )
+
+    async def search_records_many(
+        self, *, project_id: str, vectors: list[np.ndarray], limit: int, ef: int | None = None
+    ) -> list[list[tuple[ImageRecord, float]]]:
+        return await self.search(
+            "search_records_many",
+            partial(self._search_records_many, project_id=project_id, vectors=vectors, limit=limit, ef=ef),
+            project_id=project_id,
+        )
+
+    def _search_records_many(
+        self, *, project_id: str, vectors: list[np.ndarray], limit: int, ef: int | None = None
+    ) -> list[list[tuple[ImageRecord, float]]]:
+        search_many = getattr(self.vector_index, "search_records_many", None)
+        if callable(search_many):
+            return search_many(project_id=project_id, vectors=vectors, limit=limit, ef=ef)
+        return [self._search_records(project_id=project_id, vector=v, limit=limit, ef=ef) for v in vectors]
+
+    async def export_bundle(self, *, project_id: str, out: BinaryIO, model_name: str | None = None) -> int:
+        return await self.read(
+            "export_bundle",
+            partial(write_bundle, self.vector_index, project_id=project_id, out=out, model_name=model_name),
+        )
+
+    async def backup_to_path(self, *, dest_path: Path, compact: bool = True, shard: int = 0) -> None:
+        await self.read(
+            "backup_to_path", partial(self.index(shard).backup_to_path, dest_path=dest_path, compact=compact)
+        )
+
+    # ----- writes -----
+
+    def _invalidate(self, project_ids: set[str]) -> None:
+        # Also after a failed write: it may have been committed before the error surfaced.
+        if self.search_cache is not None:
+            for project_id in project_ids:
+                self.search_cache.invalidate(project_id)
+
+    async def upsert_image(self, *, record: ImageRecord, vector: np.ndarray) -> None:
+        try:
+            await self.write(
+                "upsert_image",
+                partial(self.vector_index.upsert_image, record=record, vector=vector),
+                shard=self.shard_of(record.project_id),
+            )
+        finally:
+            self._invalidate({record.project_id})
+
+    async def upsert_images(self, *, items: list[tuple[ImageRecord, np.ndarray]]) -> None:
+        groups: dict[int, list[tuple[ImageRecord, np.ndarray]]] = {}
+        for record, vector in items:
+            groups.setdefault(self.shard_of(record.project_id), []).append((record, vector))
+        try:
+            for shard, group in groups.items():
+                await self.write("upsert_images", partial(self.index(shard).upsert_images, items=group), shard=shard)
+        finally:
+            self._invalidate({record.project_id for record, _ in items})
+
+    async def delete_image(self, *, project_id: str, image_id: str) -> None:
+        try:
+            await self.write(
+                "delete_image",
+                partial(self.vector_index.delete_image, project_id=project_id, image_id=image_id),
+                shard=self.shard_of(project_id),
+            )
+        finally:
+            self._invalidate({project_id})
+
+    async def delete_project(self, *, project_id: str) -> int | None:
+        try:
+            return await self.write(
+                "delete_project",
+                partial(self.vector_index.delete_project, project_id=project_id),
+                shard=self.shard_of(project_id),
+            )
+        finally:
+            self._invalidate({project_id})
+
+    async def purge_batch(self, *, shard: int, limit: int) -> list[tuple[int, str]]:
+        return await self.read("purge_batch", partial(self.index(shard).purge_batch, limit=limit))
+
+    async def purge_done(self, *, shard: int, purged: list[int], failed: list[int]) -> None:
+        await self.write(
+            "purge_done", partial(self.index(shard).purge_done, purged=purged, failed=failed), shard=shard
+        )
+
+    async def r2_keys_in_use(self, *, r2_keys: list[str]) -> set[str]:
+        """Keys still referenced by a record on any shard."""
+        return await self.read("r2_keys_in_use", partial(self.vector_index.r2_keys_in_use, r2_keys))
+
+    async def purge_pending(self, *, project_id: str | None = None) -> int:
+        return await self.read("purge_pending", partial(self.vector_index.purge_pending, project_id=project_id))
+
+    async def step(self, name: str, steps: Any, *, shard: int = 0) -> Any:
+        """Advance a chunked index job (rebuild/grow/recode) by one step; None when done."""
+        return await self.write(name, partial(next, steps, None), shard=shard)
+
+    async def close_steps(self, name: str, steps: Any, *, shard: int = 0) -> None:
+        await self.write(name, steps.close, shard=shard)
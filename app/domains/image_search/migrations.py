@@ -0,0 +1,334 @@
+from __future__ import annotations
+
+import argparse
+import sqlite3
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable
+
+# Versioned, in-place schema migrations for the image-search DB.
+#
+# A fresh DB gets the baseline schema (BASELINE_VERSION) and is then upgraded through
+# MIGRATIONS like any existing DB. Each migration upgrades `version - 1` -> `version`
+# inside its own transaction and must keep existing rows (in particular image_vectors:
+# re-embedding every image is days of GPU time). To change the schema, append a
+# Migration here; never edit one that has shipped.
+
+BASELINE_VERSION = 4
+
+
+class SchemaMigrationError(RuntimeError):
+    pass
+
+
+@dataclass(frozen=True)
+class Migration:
+    version: int
+    description: str
+    apply: Callable[[sqlite3.Connection], None]
+
+
+@dataclass(frozen=True)
+class MigrationResult:
+    version: int
+    description: str
+    seconds: float
+    dry_run: bool
+
+
+def _create_baseline(conn: sqlite3.Connection) -> None:
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS projects (
+            project_id TEXT PRIMARY KEY,
+            created_at TEXT NOT NULL DEFAULT (CURRENT_TIMESTAMP)
+        )
+        """
+    )
+
+    # NOTE: We use a surrogate integer primary key as the stable rowid for v_images.
+    # This allows (project_id, image_id) to be unique while keeping an integer rowid
+    # that vectorlite can use.
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS image_ids (
+            internal_id INTEGER PRIMARY KEY,
+            project_id TEXT NOT NULL,
+            image_id TEXT NOT NULL,
+            UNIQUE(project_id, image_id)
+        )
+        """
+    )
+
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS image_records (
+            internal_id INTEGER PRIMARY KEY,
+            r2_key TEXT NOT NULL,
+            content_type TEXT NOT NULL,
+            original_filename TEXT,
+            size_bytes INTEGER NOT NULL
+        )
+        """
+    )
+
+    # Persist embeddings in a normal table so backups capture vectors reliably.
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS image_vectors (
+            internal_id INTEGER PRIMARY KEY,
+            embedding BLOB NOT NULL
+        )
+        """
+    )
+
+
+def _add_vector_change_log(conn: sqlite3.Connection) -> None:
+    # Every write to image_vectors appends its rowid here, so a persisted HNSW file that
+    # is behind the DB (crash, or a restore pairing an older index with a newer DB) can be
+    # caught up by replaying the rows changed after the file's seq instead of rebuilt.
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS vector_changes (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            internal_id INTEGER NOT NULL
+        )
+        """
+    )
+    conn.execute(
+        """
+        CREATE TRIGGER IF NOT EXISTS image_vectors_log_insert AFTER INSERT ON image_vectors
+        BEGIN
+            INSERT INTO vector_changes(internal_id) VALUES (NEW.internal_id);
+        END
+        """
+    )
+    conn.execute(
+        """
+        CREATE TRIGGER IF NOT EXISTS image_vectors_log_update AFTER UPDATE OF embedding ON image_vectors
+        BEGIN
+            INSERT INTO vector_changes(internal_id) VALUES (NEW.internal_id);
+        END
+        """
+    )
+    conn.execute(
+        """
+        CREATE TRIGGER IF NOT EXISTS image_vectors_log_delete AFTER DELETE ON image_vectors
+        BEGIN
+            INSERT INTO vector_changes(internal_id) VALUES (OLD.internal_id);
+        END
+        """
+    )
+
+
+def _add_content_hash(conn: sqlite3.Connection) -> None:
+    # sha256 of the uploaded bytes, for upload dedup; NULL for images stored before v6.
+    conn.execute("ALTER TABLE image_records ADD COLUMN sha256 TEXT")
+    conn.execute("CREATE INDEX IF NOT EXISTS image_records_sha256 ON image_records(sha256)")
+
+
+def _add_metadata_fts(conn: sqlite3.Connection) -> None:
+    # Full-text index over record metadata for lexical / hybrid search. External content:
+    # the text lives only in image_records; triggers keep the index in step with it.
+    conn.execute(
+        """
+        CREATE VIRTUAL TABLE IF NOT EXISTS image_records_fts USING fts5(
+            original_filename,
+            content_type,
+            content='image_records',
+            content_rowid='internal_id',
+            tokenize='unicode61 remove_diacritics 2',
+            prefix='2 3'
+        )
+        """
+    )
+    conn.execute(
+        """
+        CREATE TRIGGER IF NOT EXISTS image_records_fts_insert AFTER INSERT ON image_records
+        BEGIN
+            INSERT INTO image_records_fts(rowid, original_filename, content_type)
+            VALUES (NEW.internal_id, NEW.original_filename, NEW.content_type);
+        END
+        """
+    )
+    conn.execute(
+        """
+        CREATE TRIGGER IF NOT EXISTS image_records_fts_delete AFTER DELETE ON image_records
+        BEGIN
+            INSERT INTO image_records_fts(image_records_fts, rowid, original_filename, content_type)
+            VALUES ('delete', OLD.internal_id, OLD.original_filename, OLD.content_type);
+        END
+        """
+    )
+    conn.execute(
+        """
+        CREATE TRIGGER IF NOT EXISTS image_records_fts_update AFTER UPDATE ON image_records
+        BEGIN
+            INSERT INTO image_records_fts(image_records_fts, rowid, original_filename, content_type)
+            VALUES ('delete', OLD.internal_id, OLD.original_filename, OLD.content_type);
+            INSERT INTO image_records_fts(rowid, original_filename, content_type)
+            VALUES (NEW.internal_id, NEW.original_filename, NEW.content_type);
+        END
+        """
+    )
+    conn.execute("INSERT INTO image_records_fts(image_records_fts) VALUES ('rebuild')")
+
+
+def _add_r2_purge_queue(conn: sqlite3.Connection) -> None:
+    # R2 objects of deleted projects, queued in the same transaction that drops the rows
+    # and removed in the background; rows leave the queue once R2 confirmed the delete, so
+    # an interrupted purge resumes after a restart (or a restore of this DB).
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS r2_purge_queue (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            project_id TEXT NOT NULL,
+            r2_key TEXT NOT NULL,
+            attempts INTEGER NOT NULL DEFAULT 0
+        )
+        """
+    )
+
+
+def _add_r2_key_index(conn: sqlite3.Connection) -> None:
+    # Before an R2 object is deleted, the purge checks that no remaining record still
+    # points at its key (records imported before keys were copied may share one).
+    conn.execute("CREATE INDEX IF NOT EXISTS image_records_r2_key ON image_records(r2_key)")
+
+
+MIGRATIONS: tuple[Migration, ...] = (
+    Migration(5, "vector change log for persisted HNSW index files", _add_vector_change_log),
+    Migration(6, "image_records.sha256 content hash for upload dedup", _add_content_hash),
+    Migration(7, "image_records_fts full-text index over record metadata", _add_metadata_fts),
+    Migration(8, "r2_purge_queue for background removal of deleted projects' objects", _add_r2_purge_queue),
+    Migration(9, "image_records.r2_key index for shared-key checks before R2 deletes", _add_r2_key_index),
+)
+
+LATEST_VERSION = MIGRATIONS[-1].version if MIGRATIONS else BASELINE_VERSION
+
+
+def _ensure_version_table(conn: sqlite3.Connection) -> None:
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS schema_version (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            version INTEGER NOT NULL
+        )
+        """
+    )
+
+
+def _has_tables(conn: sqlite3.Connection) -> bool:
+    row = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name IN "
+        "('projects', 'image_ids', 'image_records', 'image_vectors') LIMIT 1"
+    ).fetchone()
+    return row is not None
+
+
+def schema_version(conn: sqlite3.Connection) -> int:
+    """Stored schema version; 0 for a DB without a version row."""
+    try:
+        row = conn.execute("SELECT version FROM schema_version WHERE id = 1").fetchone()
+    except sqlite3.OperationalError:
+        return 0
+    return int(row[0]) if row else 0
+
+
+def pending_migrations(conn: sqlite3.Connection, *, target: int = LATEST_VERSION) -> list[Migration]:
+    current = schema_version(conn)
+    if current == 0 and not _has_tables(conn):
+        current = BASELINE_VERSION
+    if current > target:
+        raise SchemaMigrationError(
+            f"image search DB schema v{current} is newer than this build (v{target}); refusing to downgrade"
+        )
+    if current < BASELINE_VERSION:
+        raise SchemaMigrationError(
+            f"image search DB schema v{current} predates v{BASELINE_VERSION} and cannot be migrated in place"
+        )
+    return [m for m in MIGRATIONS if current < m.version <= target]
+
+
+def migrate(
+    conn: sqlite3.Connection,
+    *,
+    target: int = LATEST_VERSION,
+    dry_run: bool = False,
+) -> list[MigrationResult]:
+    """Bring the DB schema to `target` in place; returns one timed result per migration.
+
+    Every migration runs in its own transaction. With dry_run the migrations are still
+    executed (so the timings are real) but rolled back at the end.
+    """
+    conn.commit()
+    results: list[MigrationResult] = []
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        _ensure_version_table(conn)
+        if schema_version(conn) == 0 and not _has_tables(conn):
+            _create_baseline(conn)
+            conn.execute("INSERT OR REPLACE INTO schema_version(id, version) VALUES (1, ?)", (BASELINE_VERSION,))
+
+        for migration in pending_migrations(conn, target=target):
+            started = time.perf_counter()
+            migration.apply(conn)
+            conn.execute("UPDATE schema_version SET version = ? WHERE id = 1", (migration.version,))
+            results.append(
+                MigrationResult(
+                    version=migration.version,
+                    description=migration.description,
+                    seconds=time.perf_counter() - started,
+                    dry_run=dry_run,
+                )
+            )
+            if not dry_run:
+                # Commit each step so a failure later on keeps the earlier upgrades.
+                conn.commit()
+                conn.execute("BEGIN IMMEDIATE")
+    except BaseException:
+        conn.rollback()
+        raise
+
+    if dry_run:
+        conn.rollback()
+    else:
+        conn.commit()
+    return results
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Migrate the image search SQLite DB schema in place.")
+    parser.add_argument("--db", help="DB path (default: IMAGE_SEARCH_DB_PATH)")
+    parser.add_argument("--target", type=int, default=LATEST_VERSION)
+    parser.add_argument("--dry-run", action="store_true", help="run the migrations, report timing, roll back")
+    args = parser.parse_args(argv)
+
+    if args.db:
+        db_path = Path(args.db)
+    else:
+        from app.domains.image_search.model import resolve_db_path_from_env
+
+        db_path = resolve_db_path_from_env()
+
+    import vectorlite_py
+
+    conn = sqlite3.connect(str(db_path))
+    conn.enable_load_extension(True)
+    conn.load_extension(vectorlite_py.vectorlite_path())
+    try:
+        print(f"{db_path}: schema v{schema_version(conn)} -> v{args.target}")
+        results = migrate(conn, target=args.target, dry_run=args.dry_run)
+        for result in results:
+            print(f"  v{result.version}: {result.description} ({result.seconds:.3f}s)")
+        if not results:
+            print("  up to date")
+        elif args.dry_run:
+            print("  dry run: rolled back")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
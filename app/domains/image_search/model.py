@@ -1,17 +1,27 @@
 from __future__ import annotations
 
 import asyncio
+import io
 import os
 import uuid
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from pathlib import Path
+from typing import Union
 
 import numpy as np
 import torch
 from PIL import Image
 from transformers import AutoModel, AutoProcessor
 
-from app.domains.image_search.vectordb import ImageRecordStore, VectorliteVectorIndex
+from app.domains.image_search.cache import SearchResultCache, TextEmbeddingCache
+from app.domains.image_search.executor import DBExecutor
+from app.domains.image_search.sharding import ShardedVectorIndex, check_shard_layout, shard_db_path
+from app.domains.image_search.vectordb import (
+    VECTOR_CODECS,
+    ImageRecordStore,
+    NumpyVectorIndex,
+    VectorliteVectorIndex,
+)
 
 IMAGE_SEARCH_KEY = "image_search"
 
@@ -21,6 +31,25 @@ def _env_truthy(name: str, default: str = "0") -> bool:
     return value in {"1", "true", "yes", "y", "on"}
 
 
+def _env_int(name: str, default: str, *, minimum: int = 1) -> int:
+    raw = (os.getenv(name) or default).strip()
+    try:
+        value = int(raw)
+    except Exception as exc:
+        raise RuntimeError(f"{name} must be an integer") from exc
+    if value < minimum:
+        raise RuntimeError(f"{name} must be >= {minimum}")
+    return value
+
+
+def _env_float(name: str, default: str) -> float:
+    raw = (os.getenv(name) or default).strip()
+    try:
+        return float(raw)
+    except Exception as exc:
+        raise RuntimeError(f"{name} must be a number") from exc
+
+
 def _safe_suffix(filename: str | None) -> str:
     if not filename:
         return ".bin"
@@ -30,6 +59,17 @@ def _safe_suffix(filename: str | None) -> str:
     return suffix
 
 
+ImageSource = Union[bytes, str, Image.Image]
+
+
+def _load_image(image: ImageSource) -> Image.Image:
+    if isinstance(image, Image.Image):
+        return image.convert("RGB")
+    if isinstance(image, (bytes, bytearray, memoryview)):
+        return Image.open(io.BytesIO(image)).convert("RGB")
+    return Image.open(image).convert("RGB")
+
+
 class ClipEmbedder:
     def __init__(self, *, model_name: str, device: str) -> None:
         self.device = device
@@ -48,15 +88,37 @@ class ClipEmbedder:
         return cls(model_name=model_name, device=device)
 
     def embed_image_path(self, image_path: str) -> np.ndarray:
-        image = Image.open(image_path).convert("RGB")
-        inputs = self.processor(images=image, return_tensors="pt", padding=True)
-        for k in list(inputs.keys()):
-            if isinstance(inputs[k], torch.Tensor):
-                inputs[k] = inputs[k].to(self.device)
-
-        with torch.inference_mode():
-            outputs = self.model.get_image_features(**inputs)
-        return outputs[0].detach().cpu().numpy()
+        return self.embed_images([image_path])[0]
+
+    def embed_image_paths(self, image_paths: list[str], *, batch_size: int = 16) -> np.ndarray:
+        return self.embed_images(image_paths, batch_size=batch_size)
+
+    def embed_image_bytes(self, raw: bytes) -> np.ndarray:
+        return self.embed_images([raw])[0]
+
+    def embed_images_bytes(self, raws: list[bytes], *, batch_size: int = 16) -> np.ndarray:
+        return self.embed_images(raws, batch_size=batch_size)
+
+    def embed_images(self, images: list[ImageSource], *, batch_size: int = 16) -> np.ndarray:
+        """Embed images (encoded bytes, PIL images or paths) with batched forward passes; returns (n, d).
+
+        Bytes are decoded in memory, so uploads never touch disk. Images are decoded one
+        batch at a time.
+        """
+        chunks: list[np.ndarray] = []
+        for start in range(0, len(images), max(1, int(batch_size))):
+            batch = [_load_image(image) for image in images[start : start + batch_size]]
+            inputs = self.processor(images=batch, return_tensors="pt", padding=True)
+            for k in list(inputs.keys()):
+                if isinstance(inputs[k], torch.Tensor):
+                    inputs[k] = inputs[k].to(self.device)
+
+            with torch.inference_mode():
+                outputs = self.model.get_image_features(**inputs)
+            chunks.append(outputs.detach().cpu().numpy())
+        if not chunks:
+            return np.zeros((0, 0), dtype=np.float32)
+        return np.concatenate(chunks, axis=0)
 
     def embed_text(self, text: str) -> np.ndarray:
         inputs = self.processor(text=[text], return_tensors="pt", padding=True)
@@ -68,6 +130,22 @@ class ClipEmbedder:
             outputs = self.model.get_text_features(**inputs)
         return outputs[0].detach().cpu().numpy()
 
+    def embed_texts(self, texts: list[str], *, batch_size: int = 64) -> np.ndarray:
+        """Embed many texts with batched text-tower passes; returns an (n, d) array."""
+        chunks: list[np.ndarray] = []
+        for start in range(0, len(texts), max(1, int(batch_size))):
+            inputs = self.processor(text=list(texts[start : start + batch_size]), return_tensors="pt", padding=True)
+            for k in list(inputs.keys()):
+                if isinstance(inputs[k], torch.Tensor):
+                    inputs[k] = inputs[k].to(self.device)
+
+            with torch.inference_mode():
+                outputs = self.model.get_text_features(**inputs)
+            chunks.append(outputs.detach().cpu().numpy())
+        if not chunks:
+            return np.zeros((0, 0), dtype=np.float32)
+        return np.concatenate(chunks, axis=0)
+
     def close(self) -> None:
         try:
             if self.device == "cuda" and torch.cuda.is_available():
@@ -78,10 +156,40 @@ class ClipEmbedder:
 
 @dataclass
 class ImageSearchState:
-    vector_index: VectorliteVectorIndex
+    vector_index: VectorliteVectorIndex | ShardedVectorIndex
     record_store: ImageRecordStore
     embedder: ClipEmbedder
+    # Writer lock: uploads/deletes/index maintenance. Reads use the index's read pool instead.
     lock: asyncio.Lock
+    # All DB calls go through the executor (worker threads, bounded queue, per-call timing).
+    db: DBExecutor | None = None
+    # Search results per (project, query, limit); the executor invalidates it on writes.
+    search_cache: SearchResultCache | None = None
+    # Query text -> embedding (memory LRU + on-disk store); None disables it.
+    text_cache: TextEmbeddingCache | None = None
+    # One writer lock per shard (shard_locks[0] is `lock`); see lock_for.
+    shard_locks: list[asyncio.Lock] | None = None
+    # Shards with an admin-requested index compaction; the maintenance task runs them.
+    compact_requested: set[int] = field(default_factory=set)
+    # Wakes the R2 purge task after a project delete; purge progress since startup.
+    purge_event: asyncio.Event = field(default_factory=asyncio.Event)
+    purge_stats: dict[str, int] = field(default_factory=lambda: {"purged": 0, "failed": 0})
+
+    def __post_init__(self) -> None:
+        if self.search_cache is None:
+            self.search_cache = SearchResultCache()
+        if self.db is None:
+            self.db = DBExecutor(
+                vector_index=self.vector_index, record_store=self.record_store, search_cache=self.search_cache
+            )
+        elif self.db.search_cache is None:
+            self.db.search_cache = self.search_cache
+        if self.shard_locks is None:
+            self.shard_locks = [self.lock] + [asyncio.Lock() for _ in range(self.db.shard_count - 1)]
+
+    def lock_for(self, project_id: str) -> asyncio.Lock:
+        """Writer lock of the project's shard: writes to projects on other shards don't wait on it."""
+        return self.shard_locks[self.db.shard_of(project_id)]
 
     def new_id(self) -> str:
         return str(uuid.uuid4())
@@ -92,6 +200,12 @@ class ImageSearchState:
         except Exception:
             pass
 
+        try:
+            if self.text_cache is not None:
+                self.text_cache.close()
+        except Exception:
+            pass
+
         try:
             if self.record_store is not self.vector_index:
                 close_fn = getattr(self.record_store, "close", None)
@@ -110,23 +224,103 @@ def create_state_from_env() -> ImageSearchState:
 
     embedder = ClipEmbedder.load_from_env()
 
-    max_elements_raw = (os.getenv("IMAGE_SEARCH_MAX_ELEMENTS") or "50000").strip()
-    try:
-        max_elements = int(max_elements_raw)
-    except Exception as exc:
-        raise RuntimeError("IMAGE_SEARCH_MAX_ELEMENTS must be an integer") from exc
-    if max_elements <= 0:
-        raise RuntimeError("IMAGE_SEARCH_MAX_ELEMENTS must be > 0")
+    max_elements = _env_int("IMAGE_SEARCH_MAX_ELEMENTS", "50000")
+    exact_search_max_project_size = _env_int("IMAGE_SEARCH_EXACT_MAX_PROJECT_SIZE", "2048", minimum=0)
     # Derive embedding dim from the model.
     dim_probe = embedder.embed_text("dim")
     vector_dim = int(dim_probe.shape[0])
 
-    vector_index = VectorliteVectorIndex(
-        db_path=db_path,
-        vector_dim=vector_dim,
-        max_elements=max_elements,
+    vector_codec = (os.getenv("IMAGE_SEARCH_VECTOR_CODEC") or "float32").strip().lower()
+    if vector_codec not in VECTOR_CODECS:
+        raise RuntimeError(f"IMAGE_SEARCH_VECTOR_CODEC must be one of {', '.join(VECTOR_CODECS)}")
+
+    # Optional exact (NumPy, memory-mapped) search backend, globally or for selected projects.
+    backend = (os.getenv("IMAGE_SEARCH_BACKEND") or "vectorlite").strip().lower()
+    if backend not in {"vectorlite", "numpy"}:
+        raise RuntimeError("IMAGE_SEARCH_BACKEND must be 'vectorlite' or 'numpy'")
+    numpy_projects_raw = (os.getenv("IMAGE_SEARCH_NUMPY_PROJECTS") or "").strip()
+    numpy_projects = frozenset(p.strip() for p in numpy_projects_raw.split(",") if p.strip())
+    numpy_index: NumpyVectorIndex | None = None
+    if backend == "numpy" or numpy_projects:
+        numpy_index = NumpyVectorIndex(root_dir=resolve_numpy_dir_from_env(db_path=db_path), vector_dim=vector_dim)
+
+    read_pool_size = _env_int("IMAGE_SEARCH_READ_POOL_SIZE", "4", minimum=0)
+    shards = _env_int("IMAGE_SEARCH_SHARDS", "1")
+    check_shard_layout(db_path, shards)
+
+    def _open_shard(shard: int) -> VectorliteVectorIndex:
+        shard_numpy_index = numpy_index
+        if numpy_index is not None and shards > 1:
+            shard_numpy_index = NumpyVectorIndex(
+                root_dir=numpy_index.root_dir / f"shard-{shard}", vector_dim=vector_dim
+            )
+        return VectorliteVectorIndex(
+            db_path=shard_db_path(db_path, shard, shards),
+            vector_dim=vector_dim,
+            max_elements=max_elements,
+            exact_search_max_project_size=exact_search_max_project_size,
+            numpy_index=shard_numpy_index,
+            numpy_projects=(None if backend == "numpy" else numpy_projects),
+            # When enabled, the HNSW rebuild (if needed) runs in the background after startup.
+            defer_rebuild=_env_truthy("IMAGE_SEARCH_BACKGROUND_REBUILD", "1"),
+            rebuild_chunk_size=_env_int("IMAGE_SEARCH_REBUILD_CHUNK_SIZE", "2048"),
+            grow_threshold=_env_float("IMAGE_SEARCH_GROW_THRESHOLD", "0.8"),
+            vector_codec=vector_codec,
+            read_pool_size=read_pool_size,
+            # Persist the HNSW graph next to the DB so restarts load it instead of rebuilding.
+            index_file=_env_truthy("IMAGE_SEARCH_HNSW_PERSIST", "1"),
+            hnsw_m=_env_int("IMAGE_SEARCH_HNSW_M", "16", minimum=2),
+            hnsw_ef_construction=_env_int("IMAGE_SEARCH_HNSW_EF_CONSTRUCTION", "200"),
+            ef_search=_env_int("IMAGE_SEARCH_HNSW_EF_SEARCH", "0", minimum=0) or None,
+            max_ef_search=_env_int("IMAGE_SEARCH_HNSW_MAX_EF", "1000"),
+            # Scheduled compaction once this share of the HNSW is deleted nodes (0 = admin-triggered only).
+            compact_threshold=_env_float("IMAGE_SEARCH_COMPACT_THRESHOLD", "0.2"),
+            compact_min_tombstones=_env_int("IMAGE_SEARCH_COMPACT_MIN_DELETES", "1000"),
+        )
+
+    vector_index: VectorliteVectorIndex | ShardedVectorIndex
+    if shards == 1:
+        vector_index = _open_shard(0)
+    else:
+        opened: list[VectorliteVectorIndex] = []
+        try:
+            for shard in range(shards):
+                opened.append(_open_shard(shard))
+        except BaseException:
+            for index in opened:
+                index.close()
+            raise
+        vector_index = ShardedVectorIndex(opened)
+    search_cache = SearchResultCache(
+        max_entries=_env_int("IMAGE_SEARCH_RESULT_CACHE_SIZE", "1024", minimum=0),
+        ttl_seconds=_env_float("IMAGE_SEARCH_RESULT_CACHE_TTL_SECONDS", "60"),
+    )
+    db = DBExecutor(
+        vector_index=vector_index,
+        read_concurrency=max(1, read_pool_size),
+        search_concurrency=_env_int("IMAGE_SEARCH_SEARCH_CONCURRENCY", str(max(1, read_pool_size))),
+        max_queue=_env_int("IMAGE_SEARCH_DB_MAX_QUEUE", "256"),
+        slow_ms=_env_float("IMAGE_SEARCH_DB_SLOW_MS", "1000"),
+        search_cache=search_cache,
+    )
+    text_cache: TextEmbeddingCache | None = None
+    text_cache_size = _env_int("IMAGE_SEARCH_TEXT_CACHE_SIZE", "4096", minimum=0)
+    text_cache_persist = _env_truthy("IMAGE_SEARCH_TEXT_CACHE_PERSIST", "1")
+    if text_cache_size > 0 or text_cache_persist:
+        text_cache = TextEmbeddingCache(
+            path=resolve_text_cache_path_from_env(db_path=db_path) if text_cache_persist else None,
+            max_entries=text_cache_size,
+            max_disk_entries=_env_int("IMAGE_SEARCH_TEXT_CACHE_MAX_DISK_ENTRIES", "200000"),
+        )
+    return ImageSearchState(
+        vector_index=vector_index,
+        record_store=vector_index,
+        embedder=embedder,
+        lock=asyncio.Lock(),
+        db=db,
+        search_cache=search_cache,
+        text_cache=text_cache,
     )
-    return ImageSearchState(vector_index=vector_index, record_store=vector_index, embedder=embedder, lock=asyncio.Lock())
 
 
 def enabled_from_env() -> bool:
@@ -153,3 +347,27 @@ def resolve_db_path_from_env(*, project_root: Path | None = None) -> Path:
     return db_path
 
 
+def resolve_numpy_dir_from_env(*, db_path: Path) -> Path:
+    raw = (os.getenv("IMAGE_SEARCH_NUMPY_DIR") or "").strip()
+    if raw:
+        path = Path(raw)
+        if not path.is_absolute():
+            path = resolve_project_root() / path
+    else:
+        path = db_path.with_name(f"{db_path.stem}_vectors")
+
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def resolve_text_cache_path_from_env(*, db_path: Path) -> Path:
+    raw = (os.getenv("IMAGE_SEARCH_TEXT_CACHE_PATH") or "").strip()
+    if raw:
+        path = Path(raw)
+        if not path.is_absolute():
+            path = resolve_project_root() / path
+    else:
+        path = db_path.with_name(f"{db_path.stem}_text_cache.db")
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    return path
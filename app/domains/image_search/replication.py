@@ -0,0 +1,321 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import struct
+import tempfile
+import uuid
+import zlib
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Any, Iterator
+
+# Incremental replication of the image-search SQLite DB to R2.
+#
+# Instead of uploading the whole DB every interval, each sync takes a page-for-page
+# snapshot (SQLite online backup API), hashes its pages and ships only the pages that
+# changed since the previous sync. Objects live under a generation prefix:
+#
+#   {prefix}CURRENT                               -> id of the active generation
+#   {prefix}generations/{gen}/base.db.z           -> zlib-compressed full snapshot
+#   {prefix}generations/{gen}/{seq:010d}.delta.z  -> pages changed since seq - 1
+#
+# After `compact_every` deltas (or once the deltas outgrow the base) the next sync starts
+# a new generation with a fresh base snapshot and drops the generations before the one it
+# replaced: the replaced generation stays until the next base, so a restore that read
+# CURRENT just before the flip can still finish. Restore downloads the base of the CURRENT
+# generation and replays its deltas in order.
+
+DELTA_MAGIC = b"ISPGDLT1"
+_DELTA_HEADER = struct.Struct(">8sIII")  # magic, page_size, page_count, n_pages
+_PAGE_NO = struct.Struct(">I")
+_DIGEST_SIZE = 16
+_IO_CHUNK = 1 << 20
+
+
+@dataclass
+class ReplicaState:
+    generation: str
+    seq: int
+    page_size: int
+    base_bytes: int
+    delta_bytes: int = 0
+
+
+def _sqlite_page_size(path: Path) -> int:
+    with path.open("rb") as f:
+        header = f.read(100)
+    if len(header) < 100 or not header.startswith(b"SQLite format 3\x00"):
+        raise ValueError(f"not a SQLite database: {path}")
+    (page_size,) = struct.unpack(">H", header[16:18])
+    return 65536 if page_size == 1 else int(page_size)
+
+
+def _iter_pages(path: Path, page_size: int) -> Iterator[bytes]:
+    with path.open("rb") as f:
+        while True:
+            page = f.read(page_size)
+            if not page:
+                return
+            yield page
+
+
+def _page_hashes(path: Path, page_size: int) -> list[bytes]:
+    return [hashlib.blake2b(page, digest_size=_DIGEST_SIZE).digest() for page in _iter_pages(path, page_size)]
+
+
+def _compress_to(dest: Path, chunks: Iterator[bytes]) -> int:
+    comp = zlib.compressobj(6)
+    size = 0
+    with dest.open("wb") as f:
+        for chunk in chunks:
+            out = comp.compress(chunk)
+            size += len(out)
+            f.write(out)
+        out = comp.flush()
+        size += len(out)
+        f.write(out)
+    return size
+
+
+def _decompress_to(src: Path, dest: Path) -> None:
+    decomp = zlib.decompressobj()
+    with src.open("rb") as fin, dest.open("wb") as fout:
+        while True:
+            chunk = fin.read(_IO_CHUNK)
+            if not chunk:
+                break
+            fout.write(decomp.decompress(chunk))
+        fout.write(decomp.flush())
+
+
+def _file_chunks(path: Path) -> Iterator[bytes]:
+    with path.open("rb") as f:
+        while True:
+            chunk = f.read(_IO_CHUNK)
+            if not chunk:
+                return
+            yield chunk
+
+
+class R2PageReplica:
+    """Ships page deltas of a SQLite DB to R2 and restores them (base + deltas)."""
+
+    def __init__(
+        self,
+        *,
+        r2: Any,
+        prefix: str,
+        state_dir: Path,
+        compact_every: int = 360,
+    ) -> None:
+        self.r2 = r2
+        self.prefix = prefix if prefix.endswith("/") else f"{prefix}/"
+        self.state_dir = state_dir
+        self.compact_every = max(1, int(compact_every))
+
+    # ----- local state -----
+
+    @property
+    def _state_path(self) -> Path:
+        return self.state_dir / "state.json"
+
+    @property
+    def _hashes_path(self) -> Path:
+        return self.state_dir / "pages.bin"
+
+    def _load(self) -> tuple[ReplicaState, list[bytes]] | None:
+        try:
+            state = ReplicaState(**json.loads(self._state_path.read_text(encoding="utf-8")))
+            raw = self._hashes_path.read_bytes()
+        except Exception:
+            return None
+        if len(raw) % _DIGEST_SIZE:
+            return None
+        return state, [raw[i : i + _DIGEST_SIZE] for i in range(0, len(raw), _DIGEST_SIZE)]
+
+    def _save(self, state: ReplicaState, hashes: list[bytes]) -> None:
+        self.state_dir.mkdir(parents=True, exist_ok=True)
+        tmp_hashes = self._hashes_path.with_suffix(".tmp")
+        tmp_hashes.write_bytes(b"".join(hashes))
+        tmp_hashes.replace(self._hashes_path)
+        tmp_state = self._state_path.with_suffix(".tmp")
+        tmp_state.write_text(json.dumps(asdict(state)), encoding="utf-8")
+        tmp_state.replace(self._state_path)
+
+    def reset(self) -> None:
+        """Forget local replication state; the next sync starts a new generation."""
+        self._state_path.unlink(missing_ok=True)
+        self._hashes_path.unlink(missing_ok=True)
+
+    # ----- keys -----
+
+    def _generation_prefix(self, generation: str) -> str:
+        return f"{self.prefix}generations/{generation}/"
+
+    def _base_key(self, generation: str) -> str:
+        return f"{self._generation_prefix(generation)}base.db.z"
+
+    def _delta_key(self, generation: str, seq: int) -> str:
+        return f"{self._generation_prefix(generation)}{seq:010d}.delta.z"
+
+    def current_generation(self) -> str | None:
+        try:
+            value = self.r2.download_bytes(key=f"{self.prefix}CURRENT").decode("utf-8").strip()
+        except Exception:
+            return None
+        return value or None
+
+    # ----- sync -----
+
+    def sync(self, snapshot_path: Path) -> dict[str, Any]:
+        """Upload the pages of `snapshot_path` that changed since the last sync.
+
+        `snapshot_path` must be a page-for-page copy of the live DB (online backup API,
+        not VACUUM INTO, which renumbers pages).
+        """
+        page_size = _sqlite_page_size(snapshot_path)
+        hashes = _page_hashes(snapshot_path, page_size)
+
+        loaded = self._load()
+        if loaded is None:
+            return self._sync_base(snapshot_path, hashes, page_size)
+
+        state, previous = loaded
+        if (
+            state.page_size != page_size
+            or state.seq >= self.compact_every
+            or state.delta_bytes > state.base_bytes
+        ):
+            return self._sync_base(snapshot_path, hashes, page_size)
+
+        changed = [i for i, h in enumerate(hashes) if i >= len(previous) or previous[i] != h]
+        if not changed and len(hashes) == len(previous):
+            return {"kind": "noop", "generation": state.generation, "seq": state.seq}
+
+        def payload() -> Iterator[bytes]:
+            yield _DELTA_HEADER.pack(DELTA_MAGIC, page_size, len(hashes), len(changed))
+            with snapshot_path.open("rb") as f:
+                for page_no in changed:
+                    f.seek(page_no * page_size)
+                    yield _PAGE_NO.pack(page_no) + f.read(page_size)
+
+        seq = state.seq + 1
+        with tempfile.TemporaryDirectory(prefix="image_search_replica_") as tmp_dir:
+            delta_path = Path(tmp_dir) / "delta.z"
+            size = _compress_to(delta_path, payload())
+            self.r2.upload_file(path=str(delta_path), key=self._delta_key(state.generation, seq))
+
+        state.seq = seq
+        state.delta_bytes += size
+        self._save(state, hashes)
+        return {"kind": "delta", "generation": state.generation, "seq": seq, "pages": len(changed), "bytes": size}
+
+    def _sync_base(self, snapshot_path: Path, hashes: list[bytes], page_size: int) -> dict[str, Any]:
+        generation = uuid.uuid4().hex
+        with tempfile.TemporaryDirectory(prefix="image_search_replica_") as tmp_dir:
+            base_path = Path(tmp_dir) / "base.db.z"
+            size = _compress_to(base_path, _file_chunks(snapshot_path))
+            self.r2.upload_file(path=str(base_path), key=self._base_key(generation))
+
+        # Flip CURRENT only once the base is in place, then drop the generations older than
+        # the one being replaced (in-flight restores may still be reading that one). If
+        # CURRENT can't be read, skip the purge rather than guess which one that is.
+        previous = self.current_generation()
+        self.r2.upload_bytes(key=f"{self.prefix}CURRENT", data=generation.encode("utf-8"), content_type="text/plain")
+        self._save(ReplicaState(generation=generation, seq=0, page_size=page_size, base_bytes=size), hashes)
+        if previous is not None:
+            self._purge_generations(keep={generation, previous})
+        return {"kind": "base", "generation": generation, "seq": 0, "pages": len(hashes), "bytes": size}
+
+    def _purge_generations(self, *, keep: set[str]) -> None:
+        keep_prefixes = tuple(self._generation_prefix(generation) for generation in keep)
+        try:
+            keys = self.r2.list_keys(prefix=f"{self.prefix}generations/", limit=100_000)
+        except Exception:
+            return
+        for key in keys:
+            if key.startswith(keep_prefixes):
+                continue
+            try:
+                self.r2.delete(key=key)
+            except Exception:
+                pass
+
+    # ----- restore -----
+
+    def restore(self, dest_path: Path) -> dict[str, Any] | None:
+        """Rebuild the DB at `dest_path` from the CURRENT generation (base + deltas).
+
+        Returns None when no replica exists. On success the local replication state is
+        primed so the next sync continues the same generation with deltas.
+        """
+        generation = self.current_generation()
+        if generation is None:
+            return None
+
+        gen_prefix = self._generation_prefix(generation)
+        delta_keys = sorted(
+            k for k in self.r2.list_keys(prefix=gen_prefix, limit=100_000) if k.endswith(".delta.z")
+        )
+
+        dest_path.parent.mkdir(parents=True, exist_ok=True)
+        with tempfile.TemporaryDirectory(prefix="image_search_replica_") as tmp_dir:
+            base_z = Path(tmp_dir) / "base.db.z"
+            db_tmp = Path(tmp_dir) / "restore.db"
+            self.r2.download_file(key=self._base_key(generation), path=str(base_z))
+            base_bytes = base_z.stat().st_size
+            _decompress_to(base_z, db_tmp)
+            base_z.unlink(missing_ok=True)
+
+            page_size = _sqlite_page_size(db_tmp)
+            seq = 0
+            delta_bytes = 0
+            complete = True
+            for key in delta_keys:
+                try:
+                    key_seq = int(key[len(gen_prefix) :].split(".", 1)[0])
+                except ValueError:
+                    continue
+                if key_seq != seq + 1:
+                    # A gap means the chain after it is not trustworthy; stop here.
+                    complete = False
+                    break
+                blob = self.r2.download_bytes(key=key)
+                self._apply_delta(db_tmp, zlib.decompress(blob), page_size=page_size)
+                seq = key_seq
+                delta_bytes += len(blob)
+
+            hashes = _page_hashes(db_tmp, page_size)
+            db_tmp.replace(dest_path)
+
+        if complete:
+            self._save(
+                ReplicaState(
+                    generation=generation,
+                    seq=seq,
+                    page_size=page_size,
+                    base_bytes=base_bytes,
+                    delta_bytes=delta_bytes,
+                ),
+                hashes,
+            )
+        else:
+            self.reset()
+        return {"generation": generation, "seq": seq, "complete": complete}
+
+    @staticmethod
+    def _apply_delta(db_path: Path, data: bytes, *, page_size: int) -> None:
+        magic, delta_page_size, page_count, n_pages = _DELTA_HEADER.unpack_from(data, 0)
+        if magic != DELTA_MAGIC or delta_page_size != page_size:
+            raise ValueError("invalid image search replica delta")
+
+        offset = _DELTA_HEADER.size
+        record = _PAGE_NO.size + page_size
+        with db_path.open("r+b") as f:
+            for _ in range(n_pages):
+                (page_no,) = _PAGE_NO.unpack_from(data, offset)
+                f.seek(page_no * page_size)
+                f.write(data[offset + _PAGE_NO.size : offset + record])
+                offset += record
+            f.truncate(page_count * page_size)
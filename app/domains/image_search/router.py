@@ -1,27 +1,50 @@
 from __future__ import annotations
 
 import uuid
+from pathlib import Path
+from typing import AsyncIterator, Literal
 
-from fastapi import APIRouter, File, Request, UploadFile
-from fastapi.responses import RedirectResponse
+import anyio
+from fastapi import APIRouter, File, Query, Request, UploadFile
+from fastapi.responses import RedirectResponse, StreamingResponse
 
 from app.core.errors.exceptions import AppError
 from app.domains.image_search.schemas import (
+    CompactIndexResponse,
+    DeleteProjectResponse,
     ImageInfo,
+    ImportProjectResponse,
     ListImagesResponse,
+    PurgeStatusResponse,
+    SearchImagesBatchRequest,
+    SearchImagesBatchResponse,
     SearchImagesRequest,
     SearchImagesResponse,
     SearchResult,
+    SimilarImagesRequest,
     UploadImageResponse,
+    UploadImagesResponse,
 )
 from app.domains.image_search.service import (
     delete_image,
+    delete_project,
+    export_project,
     get_image_record,
     get_image_presigned_url,
+    import_project,
+    index_status,
     list_images,
+    purge_status,
     register_image,
+    register_images,
+    request_index_compaction,
     search_images,
+    search_images_batch,
+    search_images_by_image,
+    search_similar_images,
+    stream_images,
 )
+from app.domains.image_search.vectordb import ImageRecord
 
 router = APIRouter(tags=["image-search"])
 
@@ -61,54 +84,138 @@ async def upload_image_endpoint(request: Request, project_id: str, file: UploadF
         original_filename=record.original_filename,
         content_type=record.content_type,
         size_bytes=record.size_bytes,
+        sha256=record.sha256,
     )
 
 
-@router.delete("/projects/{project_id}/images/{image_id}", status_code=204)
-async def delete_image_endpoint(request: Request, project_id: str, image_id: str):
-    project_id = _validate_project_id(project_id)
-    image_id = _validate_uuid(image_id)
-    await delete_image(request, project_id=project_id, image_id=image_id)
-    return None
-
-
-@router.get("/projects/{project_id}/images", response_model=ListImagesResponse)
-async def list_images_endpoint(request: Request, project_id: str):
+@router.post("/projects/{project_id}/images:batch", response_model=UploadImagesResponse)
+async def upload_images_batch_endpoint(request: Request, project_id: str, files: list[UploadFile] = File(...)):
     project_id = _validate_project_id(project_id)
-    records = await list_images(request, project_id=project_id)
-    return ListImagesResponse(
+    records = await register_images(request, project_id=project_id, files=files)
+    return UploadImagesResponse(
         images=[
-            ImageInfo(
+            UploadImageResponse(
                 project_id=r.project_id,
                 id=r.id,
                 r2_key=r.r2_key,
                 original_filename=r.original_filename,
                 content_type=r.content_type,
                 size_bytes=r.size_bytes,
+                sha256=r.sha256,
             )
             for r in records
         ]
     )
 
 
+@router.delete("/projects/{project_id}/images/{image_id}", status_code=204)
+async def delete_image_endpoint(request: Request, project_id: str, image_id: str):
+    project_id = _validate_project_id(project_id)
+    image_id = _validate_uuid(image_id)
+    await delete_image(request, project_id=project_id, image_id=image_id)
+    return None
+
+
+def _image_info(r: ImageRecord) -> ImageInfo:
+    return ImageInfo(
+        project_id=r.project_id,
+        id=r.id,
+        r2_key=r.r2_key,
+        original_filename=r.original_filename,
+        content_type=r.content_type,
+        size_bytes=r.size_bytes,
+        sha256=r.sha256,
+    )
+
+
+async def _ndjson_lines(pages: AsyncIterator[list[ImageRecord]]) -> AsyncIterator[bytes]:
+    async for page in pages:
+        yield "".join(_image_info(r).model_dump_json() + "\n" for r in page).encode("utf-8")
+
+
+async def _json_list_body(pages: AsyncIterator[list[ImageRecord]]) -> AsyncIterator[bytes]:
+    # Same body as ListImagesResponse, written one page at a time.
+    yield b'{"images":['
+    first = True
+    async for page in pages:
+        chunk = ",".join(_image_info(r).model_dump_json() for r in page)
+        yield (chunk if first else "," + chunk).encode("utf-8")
+        first = False
+    yield b'],"next_after":null}'
+
+
+@router.get("/projects/{project_id}/images", response_model=ListImagesResponse)
+async def list_images_endpoint(
+    request: Request,
+    project_id: str,
+    limit: int | None = Query(default=None, ge=1, le=1000),
+    after: str | None = Query(default=None, max_length=128),
+    response_format: Literal["json", "ndjson"] = Query(default="json", alias="format"),
+):
+    project_id = _validate_project_id(project_id)
+    if response_format == "ndjson":
+        pages = await stream_images(request, project_id=project_id, limit=limit, after=after)
+        return StreamingResponse(_ndjson_lines(pages), media_type="application/x-ndjson")
+
+    if limit is None:
+        # Unpaginated listing keeps its response shape but is streamed page by page.
+        pages = await stream_images(request, project_id=project_id, after=after)
+        return StreamingResponse(_json_list_body(pages), media_type="application/json")
+
+    records, next_after = await list_images(request, project_id=project_id, limit=limit, after=after)
+    return ListImagesResponse(images=[_image_info(r) for r in records], next_after=next_after)
+
+
+def _search_result(r: ImageRecord, score: float) -> SearchResult:
+    return SearchResult(
+        project_id=r.project_id,
+        id=r.id,
+        r2_key=r.r2_key,
+        score=score,
+        original_filename=r.original_filename,
+        content_type=r.content_type,
+        size_bytes=r.size_bytes,
+        sha256=r.sha256,
+    )
+
+
 @router.post("/projects/{project_id}/images/search", response_model=SearchImagesResponse)
 async def search_images_endpoint(request: Request, project_id: str, payload: SearchImagesRequest):
     project_id = _validate_project_id(project_id)
     results = await search_images(request, project_id=project_id, payload=payload)
-    return SearchImagesResponse(
-        results=[
-            SearchResult(
-                project_id=r.project_id,
-                id=r.id,
-                r2_key=r.r2_key,
-                score=s,
-                original_filename=r.original_filename,
-                content_type=r.content_type,
-                size_bytes=r.size_bytes,
-            )
-            for r, s in results
-        ]
+    return SearchImagesResponse(results=[_search_result(r, s) for r, s in results])
+
+
+@router.post("/projects/{project_id}/images/search:batch", response_model=SearchImagesBatchResponse)
+async def search_images_batch_endpoint(request: Request, project_id: str, payload: SearchImagesBatchRequest):
+    project_id = _validate_project_id(project_id)
+    results = await search_images_batch(request, project_id=project_id, payload=payload)
+    return SearchImagesBatchResponse(results=[[_search_result(r, s) for r, s in hits] for hits in results])
+
+
+@router.post("/projects/{project_id}/images/search:image", response_model=SearchImagesResponse)
+async def search_images_by_image_endpoint(
+    request: Request,
+    project_id: str,
+    file: UploadFile = File(...),
+    limit: int = Query(5, ge=1, le=100),
+    ef: int | None = Query(None, ge=1),
+):
+    project_id = _validate_project_id(project_id)
+    results = await search_images_by_image(request, project_id=project_id, file=file, limit=limit, ef=ef)
+    return SearchImagesResponse(results=[_search_result(r, s) for r, s in results])
+
+
+@router.post("/projects/{project_id}/images/{image_id}/similar", response_model=SearchImagesResponse)
+async def search_similar_images_endpoint(
+    request: Request, project_id: str, image_id: str, payload: SimilarImagesRequest | None = None
+):
+    project_id = _validate_project_id(project_id)
+    image_id = _validate_uuid(image_id)
+    results = await search_similar_images(
+        request, project_id=project_id, image_id=image_id, payload=payload or SimilarImagesRequest()
     )
+    return SearchImagesResponse(results=[_search_result(r, s) for r, s in results])
 
 
 @router.get(
@@ -121,3 +228,59 @@ async def get_image_file_endpoint(request: Request, project_id: str, image_id: s
     record = await get_image_record(request, project_id=project_id, image_id=image_id)
     url = await get_image_presigned_url(request, project_id=project_id, image_id=image_id)
     return RedirectResponse(url=url, status_code=307)
+
+
+@router.get("/image-search/index", response_model=CompactIndexResponse)
+async def index_status_endpoint(request: Request):
+    return CompactIndexResponse(shards=index_status(request))
+
+
+@router.post("/image-search/index:compact", response_model=CompactIndexResponse, status_code=202)
+async def compact_index_endpoint(request: Request):
+    return CompactIndexResponse(shards=request_index_compaction(request))
+
+
+@router.delete("/projects/{project_id}", response_model=DeleteProjectResponse, status_code=202)
+async def delete_project_endpoint(request: Request, project_id: str):
+    project_id = _validate_project_id(project_id)
+    deleted, pending = await delete_project(request, project_id=project_id)
+    return DeleteProjectResponse(project_id=project_id, deleted_images=deleted, pending_objects=pending)
+
+
+@router.get("/image-search/purge", response_model=PurgeStatusResponse)
+async def purge_status_endpoint(request: Request, project_id: str | None = Query(default=None, max_length=128)):
+    return PurgeStatusResponse(**await purge_status(request, project_id=project_id))
+
+
+async def _file_chunks(path: Path, chunk_size: int = 1024 * 1024) -> AsyncIterator[bytes]:
+    try:
+        async with await anyio.open_file(path, "rb") as f:
+            while chunk := await f.read(chunk_size):
+                yield chunk
+    finally:
+        path.unlink(missing_ok=True)
+
+
+@router.get(
+    "/projects/{project_id}/export",
+    responses={200: {"content": {"application/x-tar": {}}}},
+)
+async def export_project_endpoint(request: Request, project_id: str):
+    project_id = _validate_project_id(project_id)
+    path, count = await export_project(request, project_id=project_id)
+    return StreamingResponse(
+        _file_chunks(path),
+        media_type="application/x-tar",
+        headers={
+            "Content-Disposition": f'attachment; filename="{project_id}.tar"',
+            "Content-Length": str(path.stat().st_size),
+            "X-Image-Count": str(count),
+        },
+    )
+
+
+@router.post("/projects/{project_id}/import", response_model=ImportProjectResponse)
+async def import_project_endpoint(request: Request, project_id: str, file: UploadFile = File(...)):
+    project_id = _validate_project_id(project_id)
+    imported = await import_project(request, project_id=project_id, file=file)
+    return ImportProjectResponse(project_id=project_id, imported=imported)
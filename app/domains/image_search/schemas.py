@@ -1,5 +1,7 @@
 from __future__ import annotations
 
+from typing import Annotated, Literal
+
 from pydantic import BaseModel, Field
 
 
@@ -10,6 +12,11 @@ class UploadImageResponse(BaseModel):
     original_filename: str | None = None
     content_type: str
     size_bytes: int
+    sha256: str | None = None
+
+
+class UploadImagesResponse(BaseModel):
+    images: list[UploadImageResponse]
 
 
 class ImageInfo(BaseModel):
@@ -19,15 +26,33 @@ class ImageInfo(BaseModel):
     original_filename: str | None = None
     content_type: str
     size_bytes: int
+    sha256: str | None = None
 
 
 class ListImagesResponse(BaseModel):
     images: list[ImageInfo]
+    # Pass as `after` to fetch the next page; null on the last page.
+    next_after: str | None = None
 
 
 class SearchImagesRequest(BaseModel):
     query: str = Field(..., min_length=1, max_length=2000)
     limit: int = Field(default=5, ge=1, le=100)
+    # vector: CLIP similarity; text: BM25 over filename/metadata; hybrid: both, rank-fused.
+    mode: Literal["vector", "text", "hybrid"] = "vector"
+    # HNSW search breadth: higher = better recall, slower. Capped server-side (IMAGE_SEARCH_HNSW_MAX_EF).
+    ef: int | None = Field(default=None, ge=1)
+
+
+class SearchImagesBatchRequest(BaseModel):
+    queries: list[Annotated[str, Field(min_length=1, max_length=2000)]] = Field(..., min_length=1)
+    limit: int = Field(default=5, ge=1, le=100)
+    ef: int | None = Field(default=None, ge=1)
+
+
+class SimilarImagesRequest(BaseModel):
+    limit: int = Field(default=5, ge=1, le=100)
+    ef: int | None = Field(default=None, ge=1)
 
 
 class SearchResult(BaseModel):
@@ -38,7 +63,46 @@ class SearchResult(BaseModel):
     original_filename: str | None = None
     content_type: str
     size_bytes: int
+    sha256: str | None = None
 
 
 class SearchImagesResponse(BaseModel):
     results: list[SearchResult]
+
+
+class SearchImagesBatchResponse(BaseModel):
+    # One result list per query, in request order.
+    results: list[list[SearchResult]]
+
+
+class IndexShardStatus(BaseModel):
+    shard: int
+    vectors: int
+    # Deleted/overwritten HNSW nodes still in the graph; compaction drops them.
+    tombstones: int
+    tombstone_ratio: float
+    compaction_pending: bool
+    rebuilding: bool
+
+
+class CompactIndexResponse(BaseModel):
+    shards: list[IndexShardStatus]
+
+
+class DeleteProjectResponse(BaseModel):
+    project_id: str
+    deleted_images: int
+    # R2 objects queued for background removal (see GET /v1/image-search/purge).
+    pending_objects: int
+
+
+class PurgeStatusResponse(BaseModel):
+    # Still queued (for the given project, if any); purged/failed count R2 deletes since startup.
+    pending: int
+    purged: int
+    failed: int
+
+
+class ImportProjectResponse(BaseModel):
+    project_id: str
+    imported: int
@@ -1,18 +1,24 @@
 from __future__ import annotations
 
+import hashlib
 import os
 import tempfile
 from functools import partial
 from pathlib import Path
+from typing import AsyncIterator, Callable, TypeVar
 
 import anyio
+import numpy as np
 import torch
 from fastapi import Request, UploadFile
 
 from app.core.errors.exceptions import AppError, InferenceError, ModelLoadError, OutOfMemoryError
-from app.domains.image_search.model import IMAGE_SEARCH_KEY, _safe_suffix
+from app.domains.image_search.bundle import Bundle, BundleError, rekey_items
+from app.domains.image_search.model import IMAGE_SEARCH_KEY, _env_truthy, _safe_suffix
 from app.domains.image_search.vectordb import ImageRecord
-from app.domains.image_search.schemas import SearchImagesRequest
+from app.domains.image_search.schemas import SearchImagesBatchRequest, SearchImagesRequest, SimilarImagesRequest
+
+T = TypeVar("T")
 
 
 def _normalize_prefix(prefix: str) -> str:
@@ -57,6 +63,66 @@ def _get_r2(request: Request):
     return r2
 
 
+async def _require_project(state, *, project_id: str) -> None:
+    if not await state.db.project_exists(project_id=project_id):
+        raise AppError(code="PROJECT_NOT_FOUND", message="Project not found", http_status=404)
+
+
+async def _run_embedder(request: Request, fn: Callable[[], T]) -> T:
+    """Run a blocking embedder call on a worker thread, under the image-search model semaphore."""
+    try:
+        limit = request.app.state.limits.get(IMAGE_SEARCH_KEY)
+    except Exception:
+        limit = None
+
+    if limit is None:
+        return await anyio.to_thread.run_sync(fn)
+    async with limit.semaphore:
+        return await anyio.to_thread.run_sync(fn)
+
+
+async def _embed_query(request: Request, state, text: str) -> np.ndarray:
+    return (await _embed_queries(request, state, [text]))[0]
+
+
+def _embed_texts(embedder, texts: list[str]) -> list[np.ndarray]:
+    embed_texts = getattr(embedder, "embed_texts", None)
+    if not callable(embed_texts) or len(texts) == 1:
+        return [embedder.embed_text(t) for t in texts]
+    batch_size = max(1, int(os.getenv("IMAGE_SEARCH_TEXT_EMBED_BATCH_SIZE", "64")))
+    return list(embed_texts(texts, batch_size=batch_size))
+
+
+async def _embed_queries(request: Request, state, texts: list[str]) -> list[np.ndarray]:
+    # Cached query embeddings skip the model semaphore entirely; the rest share one
+    # semaphore acquisition and batched text-tower passes.
+    cache = state.text_cache
+    model_name = str(getattr(state.embedder, "model_name", ""))
+    if cache is not None:
+        texts = [cache.normalize(t) for t in texts]
+    vecs: dict[str, np.ndarray] = {}
+    if cache is not None:
+        for text in dict.fromkeys(texts):
+            cached = await anyio.to_thread.run_sync(partial(cache.get, model_name=model_name, text=text))
+            if cached is not None:
+                vecs[text] = cached
+
+    missing = [t for t in dict.fromkeys(texts) if t not in vecs]
+    if missing:
+        try:
+            embedded = await _run_embedder(request, partial(_embed_texts, state.embedder, missing))
+        except torch.cuda.OutOfMemoryError as exc:
+            raise OutOfMemoryError(detail=str(exc)) from exc
+        except Exception as exc:
+            raise InferenceError(detail=str(exc)) from exc
+
+        for text, vec in zip(missing, embedded):
+            if cache is not None:
+                vec = await anyio.to_thread.run_sync(partial(cache.put, model_name=model_name, text=text, vector=vec))
+            vecs[text] = vec
+    return [vecs[t] for t in texts]
+
+
 async def _best_effort_r2_delete(*, r2: object, key: str, reason: str) -> None:
     try:
         await anyio.to_thread.run_sync(partial(getattr(r2, "delete"), key=key))
@@ -65,6 +131,18 @@ async def _best_effort_r2_delete(*, r2: object, key: str, reason: str) -> None:
         print(f"WARNING: failed to delete R2 object: key={key} reason={reason} error={exc!r}")
 
 
+def _dedup_enabled() -> bool:
+    return _env_truthy("IMAGE_SEARCH_DEDUP", "1")
+
+
+def _share_vectors_enabled() -> bool:
+    return _dedup_enabled() and _env_truthy("IMAGE_SEARCH_DEDUP_SHARE_VECTORS", "1")
+
+
+def _sha256_hex(raw: bytes) -> str:
+    return hashlib.sha256(raw).hexdigest()
+
+
 async def register_image(request: Request, *, project_id: str, file: UploadFile) -> ImageRecord:
     state = _get_state(request)
     r2 = _get_r2(request)
@@ -81,6 +159,14 @@ async def register_image(request: Request, *, project_id: str, file: UploadFile)
     if len(raw) > max_bytes:
         raise AppError(code="FILE_TOO_LARGE", message="Uploaded file is too large", http_status=413)
 
+    # Identical bytes already in the project: return that image instead of storing a copy.
+    sha256 = await anyio.to_thread.run_sync(_sha256_hex, raw)
+    dedup = _dedup_enabled()
+    if dedup:
+        existing = await state.db.find_records_by_sha256(project_id=project_id, sha256s=[sha256])
+        if sha256 in existing:
+            return existing[sha256]
+
     image_id = state.new_id()
 
     suffix = _safe_suffix(file.filename)
@@ -96,35 +182,20 @@ async def register_image(request: Request, *, project_id: str, file: UploadFile)
     )
     await anyio.to_thread.run_sync(upload)
 
-    # The embedder currently operates on a local file path; use a temp file.
-    with tempfile.NamedTemporaryFile(suffix=suffix, delete=False) as tmp:
-        tmp_path = tmp.name
-    try:
-        await anyio.to_thread.run_sync(Path(tmp_path).write_bytes, raw)
-
-        # Embed in a worker thread to avoid blocking the event loop.
+    # Same bytes in another project: reuse its embedding instead of running CLIP again.
+    vec = None
+    if _share_vectors_enabled():
+        vec = (await state.db.vectors_by_sha256(sha256s=[sha256])).get(sha256)
+    if vec is None:
+        # Embed the uploaded bytes in memory, in a worker thread.
         try:
-            limit = request.app.state.limits.get(IMAGE_SEARCH_KEY)
-        except Exception:
-            limit = None
-
-        try:
-            if limit is None:
-                vec = await anyio.to_thread.run_sync(state.embedder.embed_image_path, str(tmp_path))
-            else:
-                async with limit.semaphore:
-                    vec = await anyio.to_thread.run_sync(state.embedder.embed_image_path, str(tmp_path))
+            vec = await _run_embedder(request, partial(state.embedder.embed_image_bytes, raw))
         except torch.cuda.OutOfMemoryError as exc:
             await _best_effort_r2_delete(r2=r2, key=r2_key, reason="embedding_oom")
             raise OutOfMemoryError(detail=str(exc)) from exc
         except Exception as exc:
             await _best_effort_r2_delete(r2=r2, key=r2_key, reason="embedding_error")
             raise InferenceError(detail=str(exc)) from exc
-    finally:
-        try:
-            os.remove(tmp_path)
-        except Exception:
-            pass
 
     record = ImageRecord(
         project_id=project_id,
@@ -133,33 +204,197 @@ async def register_image(request: Request, *, project_id: str, file: UploadFile)
         original_filename=file.filename,
         size_bytes=len(raw),
         r2_key=r2_key,
+        sha256=sha256,
     )
 
     try:
-        async with state.lock:
-            state.vector_index.upsert_image(record=record, vector=vec)
+        async with state.lock_for(project_id):
+            if dedup:
+                # A concurrent upload of the same bytes may have won the race.
+                existing = await state.db.find_records_by_sha256(project_id=project_id, sha256s=[sha256])
+                if sha256 in existing:
+                    record = existing[sha256]
+            if record.id == image_id:
+                await state.db.upsert_image(record=record, vector=vec)
     except Exception as exc:
         # If DB write fails, attempt to delete the blob.
         await _best_effort_r2_delete(r2=r2, key=r2_key, reason="db_write_failed")
         raise InferenceError(detail=str(exc)) from exc
 
+    if record.id != image_id:
+        await _best_effort_r2_delete(r2=r2, key=r2_key, reason="duplicate_upload")
     return record
 
 
+async def register_images(request: Request, *, project_id: str, files: list[UploadFile]) -> list[ImageRecord]:
+    state = _get_state(request)
+    r2 = _get_r2(request)
+    project_id = _validate_project_id(project_id)
+
+    if not files:
+        raise AppError(code="EMPTY_BATCH", message="At least one file is required", http_status=400)
+    max_files = int(os.getenv("IMAGE_SEARCH_MAX_BATCH_FILES", "256"))
+    if len(files) > max_files:
+        raise AppError(
+            code="BATCH_TOO_LARGE",
+            message=f"Too many files in one batch (max {max_files})",
+            http_status=413,
+        )
+
+    # Validate everything up front so a bad file doesn't leave half a batch in R2.
+    max_bytes = int(os.getenv("IMAGE_SEARCH_MAX_BYTES", str(20 * 1024 * 1024)))
+    payloads: list[tuple[UploadFile, bytes]] = []
+    for file in files:
+        if not file.content_type or not file.content_type.startswith("image/"):
+            raise AppError(
+                code="INVALID_IMAGE",
+                message="Only image/* uploads are allowed",
+                http_status=400,
+                detail={"filename": file.filename},
+            )
+        raw = await file.read()
+        if not raw:
+            raise AppError(
+                code="EMPTY_FILE", message="Uploaded file is empty", http_status=400, detail={"filename": file.filename}
+            )
+        if len(raw) > max_bytes:
+            raise AppError(
+                code="FILE_TOO_LARGE",
+                message="Uploaded file is too large",
+                http_status=413,
+                detail={"filename": file.filename},
+            )
+        payloads.append((file, raw))
+
+    hashes = [await anyio.to_thread.run_sync(_sha256_hex, raw) for _file, raw in payloads]
+
+    # With dedup, bytes already in the project resolve to the stored image and repeats
+    # within the batch to their first copy; only the rest is uploaded and embedded.
+    dedup = _dedup_enabled()
+    existing: dict[str, ImageRecord] = {}
+    if dedup:
+        existing = await state.db.find_records_by_sha256(project_id=project_id, sha256s=sorted(set(hashes)))
+
+    r2_prefix = _image_search_remote_prefix()
+    records: list[ImageRecord] = []
+    stored: list[bytes] = []
+    new_by_hash: dict[str, ImageRecord] = {}
+    for (file, raw), sha256 in zip(payloads, hashes):
+        if dedup and (sha256 in existing or sha256 in new_by_hash):
+            continue
+        image_id = state.new_id()
+        record = ImageRecord(
+            project_id=project_id,
+            id=image_id,
+            content_type=str(file.content_type),
+            original_filename=file.filename,
+            size_bytes=len(raw),
+            r2_key=f"{r2_prefix}{project_id}/{image_id}{_safe_suffix(file.filename)}",
+            sha256=sha256,
+        )
+        records.append(record)
+        stored.append(raw)
+        new_by_hash.setdefault(sha256, record)
+
+    def _results() -> list[ImageRecord]:
+        if not dedup:
+            return records
+        return [existing.get(sha256) or new_by_hash[sha256] for sha256 in hashes]
+
+    if not records:
+        return _results()
+
+    async def _cleanup(reason: str, keys: list[str]) -> None:
+        for key in keys:
+            await _best_effort_r2_delete(r2=r2, key=key, reason=reason)
+
+    # Upload originals to R2 concurrently (bounded).
+    uploaded: list[str] = []
+    failures: list[tuple[str, Exception]] = []
+    limiter = anyio.CapacityLimiter(max(1, int(os.getenv("IMAGE_SEARCH_R2_UPLOAD_CONCURRENCY", "8"))))
+
+    async def _upload(record: ImageRecord, raw: bytes) -> None:
+        upload = partial(r2.upload_bytes, key=record.r2_key, data=raw, content_type=record.content_type)
+        try:
+            await anyio.to_thread.run_sync(upload, limiter=limiter)
+        except Exception as exc:
+            failures.append((record.r2_key, exc))
+            return
+        uploaded.append(record.r2_key)
+
+    async with anyio.create_task_group() as tg:
+        for record, raw in zip(records, stored):
+            tg.start_soon(_upload, record, raw)
+
+    if failures:
+        await _cleanup("batch_upload_failed", uploaded)
+        key, exc = failures[0]
+        raise AppError(
+            code="R2_UPLOAD_FAILED",
+            message="Failed to upload image blob to R2",
+            http_status=502,
+            detail={"key": key, "failed": len(failures), "error": repr(exc)},
+        )
+
+    # Bytes already embedded in another project reuse that vector.
+    shared: dict[str, np.ndarray] = {}
+    if _share_vectors_enabled():
+        shared = await state.db.vectors_by_sha256(sha256s=sorted({r.sha256 for r in records if r.sha256}))
+    to_embed = [i for i, record in enumerate(records) if record.sha256 not in shared]
+
+    batch_size = max(1, int(os.getenv("IMAGE_SEARCH_EMBED_BATCH_SIZE", "16")))
+    vecs: list[np.ndarray | None] = [shared.get(record.sha256 or "") for record in records]
+    if to_embed:
+        embed = partial(state.embedder.embed_images_bytes, [stored[i] for i in to_embed], batch_size=batch_size)
+        try:
+            embedded = await _run_embedder(request, embed)
+        except torch.cuda.OutOfMemoryError as exc:
+            await _cleanup("embedding_oom", uploaded)
+            raise OutOfMemoryError(detail=str(exc)) from exc
+        except Exception as exc:
+            await _cleanup("embedding_error", uploaded)
+            raise InferenceError(detail=str(exc)) from exc
+        for i, vec in zip(to_embed, embedded):
+            vecs[i] = vec
+
+    items = list(zip(records, vecs))
+    try:
+        async with state.lock_for(project_id):
+            if dedup:
+                # Concurrent uploads of the same bytes may have landed meanwhile.
+                late = await state.db.find_records_by_sha256(
+                    project_id=project_id, sha256s=sorted(new_by_hash)
+                )
+                if late:
+                    existing.update(late)
+                    items = [(r, v) for r, v in items if r.sha256 not in late]
+            if items:
+                await state.db.upsert_images(items=items)
+    except Exception as exc:
+        await _cleanup("db_write_failed", uploaded)
+        raise InferenceError(detail=str(exc)) from exc
+
+    if len(items) < len(records):
+        kept = {r.r2_key for r, _ in items}
+        await _cleanup("duplicate_upload", [r.r2_key for r in records if r.r2_key not in kept])
+    return _results()
+
+
 async def delete_image(request: Request, *, project_id: str, image_id: str) -> None:
     state = _get_state(request)
     r2 = _get_r2(request)
     project_id = _validate_project_id(project_id)
-    async with state.lock:
-        exists = getattr(state.record_store, "project_exists", None)
-        if callable(exists) and not exists(project_id=project_id):
-            raise AppError(code="PROJECT_NOT_FOUND", message="Project not found", http_status=404)
-        record = state.record_store.get_record(project_id=project_id, image_id=image_id)
+    async with state.lock_for(project_id):
+        await _require_project(state, project_id=project_id)
+        record = await state.db.get_record(project_id=project_id, image_id=image_id)
         if record is not None:
-            state.vector_index.delete_image(project_id=project_id, image_id=image_id)
+            await state.db.delete_image(project_id=project_id, image_id=image_id)
 
     if record is None:
         raise AppError(code="NOT_FOUND", message="Image not found", http_status=404)
+    if record.r2_key and await state.db.r2_keys_in_use(r2_keys=[record.r2_key]):
+        # Another record still serves this object (imported before keys were copied).
+        return
 
     if not record.r2_key:
         raise AppError(code="R2_KEY_MISSING", message="Image record is missing r2_key", http_status=500)
@@ -175,14 +410,177 @@ async def delete_image(request: Request, *, project_id: str, image_id: str) -> N
         ) from exc
 
 
-async def list_images(request: Request, *, project_id: str) -> list[ImageRecord]:
+async def delete_project(request: Request, *, project_id: str) -> tuple[int, int]:
+    """Drop a project's rows in one transaction; returns (deleted images, R2 objects queued).
+
+    The R2 objects are removed in the background by the purge task (DeleteObjects batches),
+    from a queue stored in the DB itself, so an interrupted purge resumes after a restart.
+    """
+    state = _get_state(request)
+    _get_r2(request)
+    project_id = _validate_project_id(project_id)
+    async with state.lock_for(project_id):
+        deleted = await state.db.delete_project(project_id=project_id)
+    if deleted is None:
+        raise AppError(code="PROJECT_NOT_FOUND", message="Project not found", http_status=404)
+    state.purge_event.set()
+    return deleted, await state.db.purge_pending(project_id=project_id)
+
+
+async def purge_status(request: Request, *, project_id: str | None = None) -> dict:
+    state = _get_state(request)
+    if project_id is not None:
+        project_id = _validate_project_id(project_id)
+    pending = await state.db.purge_pending(project_id=project_id)
+    return {"pending": pending, **state.purge_stats}
+
+
+async def export_project(request: Request, *, project_id: str) -> tuple[Path, int]:
+    """Write the project's bundle (see bundle.py) to a temp file; returns (path, image count).
+
+    The caller streams the file and deletes it.
+    """
+    state = _get_state(request)
+    project_id = _validate_project_id(project_id)
+    await _require_project(state, project_id=project_id)
+    with tempfile.NamedTemporaryFile(prefix="image_search_export_", suffix=".tar", delete=False) as tmp:
+        path = Path(tmp.name)
+    try:
+        with path.open("wb") as out:
+            count = await state.db.export_bundle(
+                project_id=project_id, out=out, model_name=getattr(state.embedder, "model_name", None)
+            )
+    except BaseException:
+        path.unlink(missing_ok=True)
+        raise
+    return path, count
+
+
+async def import_project(request: Request, *, project_id: str, file: UploadFile) -> int:
+    """Bulk-insert a bundle's records and stored vectors into a project (no embedding).
+
+    Each R2 object is copied server-side to a key of this project first, so the imported
+    records never share objects with the source project.
+    """
+    state = _get_state(request)
+    r2 = _get_r2(request)
+    project_id = _validate_project_id(project_id)
+    try:
+        bundle = await anyio.to_thread.run_sync(
+            partial(
+                Bundle,
+                file.file,
+                vector_dim=state.vector_index.vector_dim,
+                model_name=getattr(state.embedder, "model_name", None),
+            )
+        )
+    except BundleError as exc:
+        raise AppError(code="INVALID_BUNDLE", message=str(exc), http_status=400) from exc
+
+    async def _cleanup(reason: str, keys: list[str]) -> None:
+        # A re-import may have copied over the object of an existing record with the same id.
+        in_use = await state.db.r2_keys_in_use(r2_keys=keys) if keys else set()
+        for key in keys:
+            if key not in in_use:
+                await _best_effort_r2_delete(r2=r2, key=key, reason=reason)
+
+    # One writer transaction per chunk, so uploads and searches interleave with a big import.
+    chunks = bundle.chunks(project_id=project_id, chunk_size=_list_page_size())
+    r2_prefix = _image_search_remote_prefix()
+    limiter = anyio.CapacityLimiter(max(1, int(os.getenv("IMAGE_SEARCH_R2_UPLOAD_CONCURRENCY", "8"))))
+    imported = 0
+    try:
+        while True:
+            items = await anyio.to_thread.run_sync(next, chunks, None)
+            if items is None:
+                break
+            items, copies = rekey_items(items, r2_prefix=r2_prefix)
+
+            copied: list[str] = []
+            failures: list[tuple[str, Exception]] = []
+
+            async def _copy(src: str, dest: str) -> None:
+                try:
+                    await anyio.to_thread.run_sync(partial(r2.copy, src_key=src, dest_key=dest), limiter=limiter)
+                except Exception as exc:
+                    failures.append((src, exc))
+                    return
+                copied.append(dest)
+
+            async with anyio.create_task_group() as tg:
+                for src, dest in copies:
+                    tg.start_soon(_copy, src, dest)
+            if failures:
+                await _cleanup("import_copy_failed", copied)
+                key, exc = failures[0]
+                raise AppError(
+                    code="R2_COPY_FAILED",
+                    message="Failed to copy a bundle's image blob in R2",
+                    http_status=502,
+                    detail={"key": key, "failed": len(failures), "imported": imported, "error": repr(exc)},
+                )
+
+            try:
+                async with state.lock_for(project_id):
+                    await state.db.upsert_images(items=items)
+            except Exception:
+                await _cleanup("db_write_failed", copied)
+                raise
+            imported += len(items)
+    except BundleError as exc:
+        raise AppError(
+            code="INVALID_BUNDLE", message=str(exc), http_status=400, detail={"imported": imported}
+        ) from exc
+    finally:
+        bundle.close()
+    return imported
+
+
+def _list_page_size() -> int:
+    return max(1, int(os.getenv("IMAGE_SEARCH_LIST_PAGE_SIZE", "1000")))
+
+
+async def list_images(
+    request: Request, *, project_id: str, limit: int, after: str | None = None
+) -> tuple[list[ImageRecord], str | None]:
+    """One keyset page (ordered by image id) plus the `after` cursor of the next page, if any."""
+    # Reads don't take state.lock (the writer lock): they run on pooled read connections.
     state = _get_state(request)
     project_id = _validate_project_id(project_id)
-    async with state.lock:
-        exists = getattr(state.record_store, "project_exists", None)
-        if callable(exists) and not exists(project_id=project_id):
-            raise AppError(code="PROJECT_NOT_FOUND", message="Project not found", http_status=404)
-        return state.record_store.list_records(project_id=project_id)
+    await _require_project(state, project_id=project_id)
+    records = await state.db.list_records(project_id=project_id, limit=limit + 1, after=after)
+    next_after = records[limit - 1].id if len(records) > limit else None
+    return records[:limit], next_after
+
+
+async def stream_images(
+    request: Request, *, project_id: str, limit: int | None = None, after: str | None = None
+) -> AsyncIterator[list[ImageRecord]]:
+    """Pages of a project's records for streaming responses; memory stays at one page.
+
+    The project is checked before returning, so a missing project is still a 404 rather
+    than an error in the middle of a stream.
+    """
+    state = _get_state(request)
+    project_id = _validate_project_id(project_id)
+    await _require_project(state, project_id=project_id)
+    page_size = _list_page_size()
+
+    async def _pages() -> AsyncIterator[list[ImageRecord]]:
+        cursor = after
+        remaining = limit
+        while remaining is None or remaining > 0:
+            n = page_size if remaining is None else min(page_size, remaining)
+            page = await state.db.list_records(project_id=project_id, limit=n, after=cursor)
+            if page:
+                yield page
+            if len(page) < n:
+                return
+            cursor = page[-1].id
+            if remaining is not None:
+                remaining -= len(page)
+
+    return _pages()
 
 
 async def search_images(
@@ -191,56 +589,183 @@ async def search_images(
     state = _get_state(request)
     project_id = _validate_project_id(project_id)
 
-    try:
-        limit = request.app.state.limits.get(IMAGE_SEARCH_KEY)
-    except Exception:
-        limit = None
-
-    try:
-        if limit is None:
-            vec = await anyio.to_thread.run_sync(state.embedder.embed_text, payload.query)
+    # Repeated dashboard queries skip both the CLIP forward pass and the kNN query.
+    cache = state.search_cache
+    mode = payload.mode
+    generation = cache.generation(project_id)
+    cached = cache.get(project_id=project_id, query=payload.query, limit=payload.limit, mode=mode, ef=payload.ef)
+    if cached is not None:
+        return cached
+
+    if mode == "text":
+        await _require_project(state, project_id=project_id)
+        results = await state.db.search_records_text(project_id=project_id, query=payload.query, limit=payload.limit)
+    else:
+        vec = await _embed_query(request, state, payload.query)
+        await _require_project(state, project_id=project_id)
+        if mode == "hybrid":
+            results = await state.db.search_records_hybrid(
+                project_id=project_id,
+                query=payload.query,
+                vector=vec,
+                limit=payload.limit,
+                candidates=int(os.getenv("IMAGE_SEARCH_HYBRID_CANDIDATES", "100")),
+                rrf_k=int(os.getenv("IMAGE_SEARCH_HYBRID_RRF_K", "60")),
+                ef=payload.ef,
+            )
         else:
-            async with limit.semaphore:
-                vec = await anyio.to_thread.run_sync(state.embedder.embed_text, payload.query)
-    except torch.cuda.OutOfMemoryError as exc:
-        raise OutOfMemoryError(detail=str(exc)) from exc
-    except Exception as exc:
-        raise InferenceError(detail=str(exc)) from exc
+            results = await state.db.search_records(
+                project_id=project_id, vector=vec, limit=payload.limit, ef=payload.ef
+            )
+    cache.put(
+        project_id=project_id,
+        query=payload.query,
+        limit=payload.limit,
+        generation=generation,
+        results=results,
+        mode=mode,
+        ef=payload.ef,
+    )
+    return results
+
+
+async def search_images_batch(
+    request: Request, *, project_id: str, payload: SearchImagesBatchRequest
+) -> list[list[tuple[ImageRecord, float]]]:
+    state = _get_state(request)
+    project_id = _validate_project_id(project_id)
+
+    max_queries = int(os.getenv("IMAGE_SEARCH_MAX_BATCH_QUERIES", "256"))
+    if len(payload.queries) > max_queries:
+        raise AppError(
+            code="BATCH_TOO_LARGE",
+            message=f"Too many queries in one batch (max {max_queries})",
+            http_status=413,
+        )
+
+    cache = state.search_cache
+    generation = cache.generation(project_id)
+    results: dict[str, list[tuple[ImageRecord, float]]] = {}
+    for query in dict.fromkeys(payload.queries):
+        cached = cache.get(project_id=project_id, query=query, limit=payload.limit, ef=payload.ef)
+        if cached is not None:
+            results[query] = cached
+
+    missing = [q for q in dict.fromkeys(payload.queries) if q not in results]
+    if missing:
+        vecs = await _embed_queries(request, state, missing)
+        await _require_project(state, project_id=project_id)
+        found = await state.db.search_records_many(
+            project_id=project_id, vectors=vecs, limit=payload.limit, ef=payload.ef
+        )
+        for query, hits in zip(missing, found):
+            cache.put(
+                project_id=project_id,
+                query=query,
+                limit=payload.limit,
+                generation=generation,
+                results=hits,
+                ef=payload.ef,
+            )
+            results[query] = hits
+    else:
+        await _require_project(state, project_id=project_id)
+    return [list(results[q]) for q in payload.queries]
+
+
+async def search_images_by_image(
+    request: Request, *, project_id: str, file: UploadFile, limit: int = 5, ef: int | None = None
+) -> list[tuple[ImageRecord, float]]:
+    """Search with an uploaded image as the query; nothing is stored (no R2 upload, no DB row)."""
+    state = _get_state(request)
+    project_id = _validate_project_id(project_id)
+
+    if not file.content_type or not file.content_type.startswith("image/"):
+        raise AppError(code="INVALID_IMAGE", message="Only image/* uploads are allowed", http_status=400)
+    raw = await file.read()
+    if not raw:
+        raise AppError(code="EMPTY_FILE", message="Uploaded file is empty", http_status=400)
+    max_bytes = int(os.getenv("IMAGE_SEARCH_MAX_BYTES", str(20 * 1024 * 1024)))
+    if len(raw) > max_bytes:
+        raise AppError(code="FILE_TOO_LARGE", message="Uploaded file is too large", http_status=413)
+
+    # Results are keyed by the content hash, so re-sent query images hit the cache.
+    sha256 = await anyio.to_thread.run_sync(_sha256_hex, raw)
+    cache = state.search_cache
+    generation = cache.generation(project_id)
+    cached = cache.get(project_id=project_id, query=sha256, limit=limit, mode="image", ef=ef)
+    if cached is not None:
+        return cached
+
+    await _require_project(state, project_id=project_id)
+    # Bytes already stored (in any project) reuse their vector instead of running CLIP.
+    vec = None
+    if _share_vectors_enabled():
+        vec = (await state.db.vectors_by_sha256(sha256s=[sha256])).get(sha256)
+    if vec is None:
+        try:
+            vec = await _run_embedder(request, partial(state.embedder.embed_image_bytes, raw))
+        except torch.cuda.OutOfMemoryError as exc:
+            raise OutOfMemoryError(detail=str(exc)) from exc
+        except Exception as exc:
+            raise InferenceError(detail=str(exc)) from exc
+
+    results = await state.db.search_records(project_id=project_id, vector=vec, limit=limit, ef=ef)
+    cache.put(
+        project_id=project_id,
+        query=sha256,
+        limit=limit,
+        generation=generation,
+        results=results,
+        mode="image",
+        ef=ef,
+    )
+    return results
 
-    async with state.lock:
-        exists = getattr(state.record_store, "project_exists", None)
-        if callable(exists) and not exists(project_id=project_id):
-            raise AppError(code="PROJECT_NOT_FOUND", message="Project not found", http_status=404)
-        # Prefer a single DB query that also returns metadata.
-        search_records = getattr(state.vector_index, "search_records", None)
-        if callable(search_records):
-            return search_records(project_id=project_id, vector=vec, limit=payload.limit)
-
-        # Fallback: resolve ids to records (older interface).
-        ids = state.vector_index.search(vector=vec, limit=payload.limit)
-        out: list[tuple[ImageRecord, float]] = []
-        for image_id, score in ids:
-            rec = state.record_store.get_record(project_id=project_id, image_id=image_id)
-            if rec is not None:
-                out.append((rec, score))
-        return out
+
+async def search_similar_images(
+    request: Request, *, project_id: str, image_id: str, payload: SimilarImagesRequest
+) -> list[tuple[ImageRecord, float]]:
+    """"More like this": kNN from the image's stored vector (no embedding, no R2), excluding itself."""
+    state = _get_state(request)
+    project_id = _validate_project_id(project_id)
+
+    cache = state.search_cache
+    generation = cache.generation(project_id)
+    cached = cache.get(project_id=project_id, query=image_id, limit=payload.limit, mode="similar", ef=payload.ef)
+    if cached is not None:
+        return cached
+
+    await _require_project(state, project_id=project_id)
+    vec = await state.db.get_vector(project_id=project_id, image_id=image_id)
+    if vec is None:
+        raise AppError(code="NOT_FOUND", message="Image not found", http_status=404)
+    hits = await state.db.search_records(project_id=project_id, vector=vec, limit=payload.limit + 1, ef=payload.ef)
+    results = [(r, s) for r, s in hits if r.id != image_id][: payload.limit]
+    cache.put(
+        project_id=project_id,
+        query=image_id,
+        limit=payload.limit,
+        generation=generation,
+        results=results,
+        mode="similar",
+        ef=payload.ef,
+    )
+    return results
 
 
 async def get_image_record(request: Request, *, project_id: str, image_id: str) -> ImageRecord:
     state = _get_state(request)
     project_id = _validate_project_id(project_id)
-    async with state.lock:
-        exists = getattr(state.record_store, "project_exists", None)
-        if callable(exists) and not exists(project_id=project_id):
-            raise AppError(code="PROJECT_NOT_FOUND", message="Project not found", http_status=404)
-        record = state.record_store.get_record(project_id=project_id, image_id=image_id)
-        if record is None:
-            raise AppError(code="NOT_FOUND", message="Image not found", http_status=404)
+    await _require_project(state, project_id=project_id)
+    record = await state.db.get_record(project_id=project_id, image_id=image_id)
+    if record is None:
+        raise AppError(code="NOT_FOUND", message="Image not found", http_status=404)
 
-        if not record.r2_key:
-            raise AppError(code="R2_KEY_MISSING", message="Image record is missing r2_key", http_status=500)
+    if not record.r2_key:
+        raise AppError(code="R2_KEY_MISSING", message="Image record is missing r2_key", http_status=500)
 
-        return record
+    return record
 
 
 async def get_image_presigned_url(
@@ -250,19 +775,45 @@ async def get_image_presigned_url(
     r2 = _get_r2(request)
     project_id = _validate_project_id(project_id)
 
-    async with state.lock:
-        exists = getattr(state.record_store, "project_exists", None)
-        if callable(exists) and not exists(project_id=project_id):
-            raise AppError(code="PROJECT_NOT_FOUND", message="Project not found", http_status=404)
-        record = state.record_store.get_record(project_id=project_id, image_id=image_id)
-        if record is None:
-            raise AppError(code="NOT_FOUND", message="Image not found", http_status=404)
-        if not record.r2_key:
-            raise AppError(
-                code="R2_KEY_MISSING",
-                message="Image is not stored in R2",
-                http_status=409,
-            )
+    await _require_project(state, project_id=project_id)
+    record = await state.db.get_record(project_id=project_id, image_id=image_id)
+    if record is None:
+        raise AppError(code="NOT_FOUND", message="Image not found", http_status=404)
+    if not record.r2_key:
+        raise AppError(
+            code="R2_KEY_MISSING",
+            message="Image is not stored in R2",
+            http_status=409,
+        )
+
+    url = await anyio.to_thread.run_sync(partial(r2.presigned_get_url, key=record.r2_key, expires_in=expires_in))
+    return url
+
 
-        url = await anyio.to_thread.run_sync(partial(r2.presigned_get_url, key=record.r2_key, expires_in=expires_in))
-        return url
+def index_status(request: Request) -> list[dict]:
+    state = _get_state(request)
+    out: list[dict] = []
+    for shard in range(state.db.shard_count):
+        index = state.db.index(shard)
+        out.append(
+            {
+                "shard": shard,
+                "vectors": int(getattr(index, "index_elements", 0)),
+                "tombstones": int(getattr(index, "tombstones", 0)),
+                "tombstone_ratio": round(float(getattr(index, "tombstone_ratio", 0.0)), 4),
+                "compaction_pending": shard in state.compact_requested,
+                "rebuilding": bool(getattr(index, "rebuilding", False) or getattr(index, "swapping", False)),
+            }
+        )
+    return out
+
+
+def request_index_compaction(request: Request) -> list[dict]:
+    """Queue an online compaction of every shard's HNSW; the maintenance task runs it.
+
+    The fresh graph is built from image_vectors in the background while searches and
+    writes continue on the current one, then swapped in under the writer lock.
+    """
+    state = _get_state(request)
+    state.compact_requested.update(range(state.db.shard_count))
+    return index_status(request)
@@ -0,0 +1,189 @@
+from __future__ import annotations
+
+import hashlib
+import re
+from pathlib import Path, PurePosixPath
+from typing import Iterator
+
+import numpy as np
+
+from app.domains.image_search.vectordb import ImageRecord, VectorliteVectorIndex
+
+# Project-hash sharding of the image-search DB.
+#
+# With IMAGE_SEARCH_SHARDS=N > 1 every project lives in exactly one of N SQLite files,
+# chosen by a stable hash of project_id. Each shard is a complete VectorliteVectorIndex
+# (own writer connection and lock, HNSW, index file, backup key), so writes to projects
+# on different shards don't serialize on one writer, and backups/restores run per shard.
+# A single shard keeps the unsharded file and R2 key names.
+#
+# The shard count is part of the layout: changing it would silently move projects to
+# other (empty) files, so startup refuses a DB directory laid out for another count.
+# Move projects with export/import instead.
+
+
+def shard_of(project_id: str, shards: int) -> int:
+    if shards <= 1:
+        return 0
+    # Not hash(): it is salted per process, and the mapping must survive restarts.
+    digest = hashlib.blake2b(project_id.encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big") % shards
+
+
+def shard_name(name: str, shard: int, shards: int) -> str:
+    """`image_search.db` -> `image_search.shard-1-of-4.db` (unchanged for a single shard)."""
+    if shards <= 1:
+        return name
+    path = PurePosixPath(name)
+    return str(path.with_name(f"{path.stem}.shard-{shard}-of-{shards}{path.suffix}"))
+
+
+def shard_db_path(db_path: Path, shard: int, shards: int) -> Path:
+    return db_path.with_name(shard_name(db_path.name, shard, shards))
+
+
+def check_shard_layout(db_path: Path, shards: int) -> None:
+    """Refuse to start when the DB directory holds data laid out for another shard count."""
+    pattern = re.compile(re.escape(db_path.stem) + r"\.shard-\d+-of-(\d+)" + re.escape(db_path.suffix) + r"$")
+    counts: set[int] = set()
+    if db_path.exists() and db_path.stat().st_size > 0:
+        counts.add(1)
+    if not db_path.parent.is_dir():
+        return
+    for path in db_path.parent.iterdir():
+        match = pattern.match(path.name)
+        if match and path.stat().st_size > 0:
+            counts.add(int(match.group(1)))
+    other = sorted(counts - {max(1, int(shards))})
+    if other:
+        raise RuntimeError(
+            f"Image search DB at {db_path} is laid out for IMAGE_SEARCH_SHARDS={other[0]}, "
+            f"not {shards}; resharding in place is not supported (export and import the projects instead)"
+        )
+
+
+class ShardedVectorIndex:
+    """VectorliteVectorIndex-compatible facade that routes each call to its project's shard.
+
+    Calls that are not project-scoped fan out over all shards (vectors_by_sha256) or
+    aggregate them (rebuilding, change_counter). Index maintenance (rebuild, growth,
+    persistence, backups) is driven per shard through `shards`.
+    """
+
+    def __init__(self, shards: list[VectorliteVectorIndex]) -> None:
+        if not shards:
+            raise ValueError("at least one shard is required")
+        self.shards = list(shards)
+        self.vector_dim = self.shards[0].vector_dim
+        self.vector_codec = self.shards[0].vector_codec
+
+    def shard_of(self, project_id: str) -> int:
+        return shard_of(project_id, len(self.shards))
+
+    def shard(self, project_id: str) -> VectorliteVectorIndex:
+        return self.shards[self.shard_of(project_id)]
+
+    # ----- project-scoped -----
+
+    def ensure_project(self, *, project_id: str) -> None:
+        self.shard(project_id).ensure_project(project_id=project_id)
+
+    def project_exists(self, *, project_id: str) -> bool:
+        return self.shard(project_id).project_exists(project_id=project_id)
+
+    def get_record(self, *, project_id: str, image_id: str) -> ImageRecord | None:
+        return self.shard(project_id).get_record(project_id=project_id, image_id=image_id)
+
+    def list_records(
+        self, *, project_id: str, limit: int | None = None, after: str | None = None
+    ) -> list[ImageRecord]:
+        return self.shard(project_id).list_records(project_id=project_id, limit=limit, after=after)
+
+    def find_records_by_sha256(self, *, project_id: str, sha256s: list[str]) -> dict[str, ImageRecord]:
+        return self.shard(project_id).find_records_by_sha256(project_id=project_id, sha256s=sha256s)
+
+    def get_vector(self, *, project_id: str, image_id: str) -> np.ndarray | None:
+        return self.shard(project_id).get_vector(project_id=project_id, image_id=image_id)
+
+    def search_records(
+        self, *, project_id: str, vector: np.ndarray, limit: int, ef: int | None = None
+    ) -> list[tuple[ImageRecord, float]]:
+        return self.shard(project_id).search_records(project_id=project_id, vector=vector, limit=limit, ef=ef)
+
+    def search_records_many(
+        self, *, project_id: str, vectors: list[np.ndarray], limit: int, ef: int | None = None
+    ) -> list[list[tuple[ImageRecord, float]]]:
+        return self.shard(project_id).search_records_many(project_id=project_id, vectors=vectors, limit=limit, ef=ef)
+
+    def search_records_text(self, *, project_id: str, query: str, limit: int) -> list[tuple[ImageRecord, float]]:
+        return self.shard(project_id).search_records_text(project_id=project_id, query=query, limit=limit)
+
+    def search_records_hybrid(self, *, project_id: str, **kwargs) -> list[tuple[ImageRecord, float]]:
+        return self.shard(project_id).search_records_hybrid(project_id=project_id, **kwargs)
+
+    def upsert_image(self, *, record: ImageRecord, vector: np.ndarray) -> None:
+        self.shard(record.project_id).upsert_image(record=record, vector=vector)
+
+    def upsert_images(self, *, items: list[tuple[ImageRecord, np.ndarray]]) -> None:
+        # One transaction per shard; callers batch a single project, i.e. a single shard.
+        groups: dict[int, list[tuple[ImageRecord, np.ndarray]]] = {}
+        for record, vector in items:
+            groups.setdefault(self.shard_of(record.project_id), []).append((record, vector))
+        for shard, group in groups.items():
+            self.shards[shard].upsert_images(items=group)
+
+    def delete_image(self, *, project_id: str, image_id: str) -> None:
+        self.shard(project_id).delete_image(project_id=project_id, image_id=image_id)
+
+    def iter_project_export(
+        self, *, project_id: str, chunk_size: int | None = None
+    ) -> Iterator[list[tuple[ImageRecord, bytes]]]:
+        return self.shard(project_id).iter_project_export(project_id=project_id, chunk_size=chunk_size)
+
+    def delete_project(self, *, project_id: str) -> int | None:
+        return self.shard(project_id).delete_project(project_id=project_id)
+
+    # ----- all shards -----
+
+    def vectors_by_sha256(self, sha256s: list[str]) -> dict[str, np.ndarray]:
+        out: dict[str, np.ndarray] = {}
+        for shard in self.shards:
+            missing = [h for h in sha256s if h not in out]
+            if not missing:
+                break
+            out.update(shard.vectors_by_sha256(missing))
+        return out
+
+    @property
+    def rebuilding(self) -> bool:
+        return any(shard.rebuilding for shard in self.shards)
+
+    @property
+    def rebuild_progress(self) -> tuple[int, int]:
+        done = sum(shard.rebuild_progress[0] for shard in self.shards if shard.rebuilding)
+        total = sum(shard.rebuild_progress[1] for shard in self.shards if shard.rebuilding)
+        return done, total
+
+    def change_counter(self) -> int:
+        return sum(shard.change_counter() for shard in self.shards)
+
+    def r2_keys_in_use(self, r2_keys: list[str]) -> set[str]:
+        out: set[str] = set()
+        for shard in self.shards:
+            out.update(shard.r2_keys_in_use(r2_keys))
+        return out
+
+    def purge_pending(self, *, project_id: str | None = None) -> int:
+        if project_id is not None:
+            return self.shard(project_id).purge_pending(project_id=project_id)
+        return sum(shard.purge_pending() for shard in self.shards)
+
+    def close(self) -> None:
+        errors: list[BaseException] = []
+        for shard in self.shards:
+            try:
+                shard.close()
+            except BaseException as exc:
+                errors.append(exc)
+        if errors:
+            raise errors[0]
@@ -1,14 +1,24 @@
 from __future__ import annotations
 
+import hashlib
+import json
 import os
+import queue
+import random
+import re
 import sqlite3
+import threading
+from contextlib import contextmanager
 from dataclasses import dataclass
+from functools import wraps
 from pathlib import Path
-from typing import Protocol
+from typing import Callable, Iterator, Protocol
 
 import numpy as np
 import vectorlite_py
 
+from app.domains.image_search.migrations import LATEST_VERSION, migrate
+
 
 def _normalize(vec: np.ndarray) -> np.ndarray:
     vec = vec.astype(np.float32, copy=False)
@@ -16,6 +26,91 @@ def _normalize(vec: np.ndarray) -> np.ndarray:
     return vec / denom
 
 
+VECTOR_CODECS = ("float32", "float16", "int8")
+
+
+def encode_vector(vec: np.ndarray, *, codec: str) -> bytes:
+    """Serialize a vector for image_vectors.
+
+    - float32: raw little-endian float32 (4*d bytes)
+    - float16: raw float16 (2*d bytes)
+    - int8: float32 scale followed by d int8 values, v ~= q * scale (d+4 bytes)
+    """
+    vec = vec.astype(np.float32, copy=False)
+    if codec == "float32":
+        return vec.tobytes()
+    if codec == "float16":
+        return vec.astype(np.float16).tobytes()
+    if codec == "int8":
+        scale = float(np.max(np.abs(vec))) / 127.0 if vec.size else 0.0
+        if scale <= 0.0:
+            scale = 1.0
+        q = np.clip(np.rint(vec / scale), -127, 127).astype(np.int8)
+        return np.float32(scale).tobytes() + q.tobytes()
+    raise ValueError(f"Unknown vector codec: {codec}")
+
+
+def decode_vector(blob: bytes, *, dim: int) -> np.ndarray:
+    # The codec is implied by the blob length, so rows written under different
+    # IMAGE_SEARCH_VECTOR_CODEC settings can coexist in one DB.
+    n = len(blob)
+    if n == 4 * dim:
+        return np.frombuffer(blob, dtype=np.float32)
+    if n == 2 * dim:
+        return np.frombuffer(blob, dtype=np.float16).astype(np.float32)
+    if n == dim + 4:
+        scale = np.frombuffer(blob[:4], dtype=np.float32)[0]
+        return np.frombuffer(blob[4:], dtype=np.int8).astype(np.float32) * scale
+    raise ValueError(f"Unexpected stored vector size: {n} bytes for dim={dim}")
+
+
+def decode_matrix(blobs: list[bytes], *, dim: int) -> np.ndarray:
+    if blobs and all(len(b) == 4 * dim for b in blobs):
+        return np.frombuffer(b"".join(blobs), dtype=np.float32).reshape(len(blobs), dim)
+    out = np.empty((len(blobs), dim), dtype=np.float32)
+    for i, blob in enumerate(blobs):
+        out[i] = decode_vector(blob, dim=dim)
+    return out
+
+
+def index_file_path(db_path: Path, table: str) -> Path:
+    """Where the HNSW graph of `table` is persisted: next to the DB, `{db name}.{table}.hnsw`."""
+    db_path = db_path.resolve()
+    return db_path.with_name(f"{db_path.name}.{table}.hnsw")
+
+
+def index_manifest_path(index_path: Path) -> Path:
+    return index_path.with_name(f"{index_path.name}.json")
+
+
+def read_index_manifest(index_path: Path) -> dict | None:
+    try:
+        manifest = json.loads(index_manifest_path(index_path).read_text(encoding="utf-8"))
+    except Exception:
+        return None
+    return manifest if isinstance(manifest, dict) else None
+
+
+def persisted_index_files(db_path: Path) -> tuple[Path, Path] | None:
+    """(index file, manifest) of the last persisted HNSW graph of the DB, if any."""
+    for table in VectorliteVectorIndex.VIRTUAL_TABLES:
+        path = index_file_path(db_path, table)
+        if path.exists() and index_manifest_path(path).exists():
+            return path, index_manifest_path(path)
+    return None
+
+
+def _file_sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with path.open("rb") as f:
+        while True:
+            chunk = f.read(1 << 20)
+            if not chunk:
+                break
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
 @dataclass(frozen=True)
 class ImageRecord:
     project_id: str
@@ -24,6 +119,34 @@ class ImageRecord:
     content_type: str
     original_filename: str | None
     size_bytes: int
+    # sha256 of the image bytes (hex); None for images stored before content hashing.
+    sha256: str | None = None
+
+
+def fts_query(text: str) -> str | None:
+    """FTS5 MATCH expression for free text: every word as a quoted prefix term, OR'ed.
+
+    Quoting keeps user input from being parsed as FTS5 syntax; BM25 ranks records that
+    match more (and rarer) words first. None when the text has no word characters.
+    """
+    words = re.findall(r"\w+", text or "")
+    if not words:
+        return None
+    return " OR ".join(f'"{w}"*' for w in dict.fromkeys(w.lower() for w in words))
+
+
+def _record_from_row(row) -> ImageRecord:
+    # (project_id, image_id, r2_key, content_type, original_filename, size_bytes, sha256)
+    project_id, image_id, r2_key, content_type, original_filename, size_bytes, sha256 = row
+    return ImageRecord(
+        project_id=str(project_id),
+        id=str(image_id),
+        r2_key=str(r2_key),
+        content_type=str(content_type),
+        original_filename=(None if original_filename is None else str(original_filename)),
+        size_bytes=int(size_bytes),
+        sha256=(None if sha256 is None else str(sha256)),
+    )
 
 
 class VectorIndex(Protocol):
@@ -47,7 +170,291 @@ class ImageRecordStore(Protocol):
 
     def delete_record(self, *, project_id: str, image_id: str) -> None: ...
 
-    def list_records(self, *, project_id: str) -> list[ImageRecord]: ...
+    def list_records(
+        self, *, project_id: str, limit: int | None = None, after: str | None = None
+    ) -> list[ImageRecord]: ...
+
+
+class NumpyVectorIndex:
+    """Exact brute-force index over memory-mapped float32 matrices, one per project.
+
+    Layout under `root_dir`:
+    - {project_id}.npy: (capacity, d) L2-normalized float32 rows
+    - {project_id}.rowids.npy: (capacity,) int64 sidebar; slot i holds the rowid of row i or -1
+    - {project_id}.state.json: {"seq": N}, the vector_changes seq the files were flushed at,
+      or {"seq": null} while a write is in flight
+
+    Live rows are kept packed in [0, n) (deletes move the last row into the hole), so a
+    search is one matrix-vector product over mat[:n] followed by argpartition.
+
+    The files are a cache of image_vectors. Writers mark a project dirty before their DB
+    commit and synced (after flushing) once the mirror write is done, so files left behind
+    by a crash in between are never trusted; VectorliteVectorIndex checks the seq against
+    the change log when it first opens a project. Writes to a project that isn't open only
+    leave it dirty: its next search rebuilds it.
+
+    Searches of open projects take a shared lock and mutations an exclusive one, so
+    searches run in parallel with each other instead of on the writer connection's lock.
+    """
+
+    MIN_CAPACITY = 1024
+
+    def __init__(self, *, root_dir: Path, vector_dim: int) -> None:
+        self.root_dir = root_dir
+        self.vector_dim = int(vector_dim)
+        self.root_dir.mkdir(parents=True, exist_ok=True)
+        # project_id -> (matrix, rowids, slot-by-rowid)
+        self._projects: dict[str, tuple[np.ndarray, np.ndarray, dict[int, int]]] = {}
+        self._lock = _SharedLock()
+
+    def _paths(self, project_id: str) -> tuple[Path, Path]:
+        return self.root_dir / f"{project_id}.npy", self.root_dir / f"{project_id}.rowids.npy"
+
+    def _state_path(self, project_id: str) -> Path:
+        return self.root_dir / f"{project_id}.state.json"
+
+    def _write_state(self, project_id: str, seq: int | None) -> None:
+        path = self._state_path(project_id)
+        tmp = path.with_name(path.name + ".tmp")
+        tmp.write_text(json.dumps({"seq": seq}), encoding="utf-8")
+        tmp.replace(path)
+
+    def synced_seq(self, *, project_id: str) -> int | None:
+        """The vector_changes seq the project's files match, or None when unknown or dirty."""
+        try:
+            seq = json.loads(self._state_path(project_id).read_text(encoding="utf-8")).get("seq")
+            return None if seq is None else int(seq)
+        except Exception:
+            return None
+
+    def is_open(self, *, project_id: str) -> bool:
+        return project_id in self._projects
+
+    def rowids(self, *, project_id: str) -> set[int]:
+        loaded = self._open(project_id)
+        return set() if loaded is None else set(loaded[2])
+
+    def mark_dirty(self, *, project_ids: list[str]) -> None:
+        for project_id in project_ids:
+            self._write_state(project_id, None)
+
+    def mark_synced(self, *, project_ids: list[str], seq: int) -> None:
+        """Flush the open projects' files and record `seq`; projects that aren't open stay dirty."""
+        with self._lock.exclusive():
+            self._mark_synced(project_ids, seq)
+
+    def _mark_synced(self, project_ids: list[str], seq: int) -> None:
+        for project_id in project_ids:
+            loaded = self._projects.get(project_id)
+            if loaded is None:
+                continue
+            loaded[0].flush()
+            loaded[1].flush()
+            self._write_state(project_id, int(seq))
+
+    def _open(self, project_id: str) -> tuple[np.ndarray, np.ndarray, dict[int, int]] | None:
+        loaded = self._projects.get(project_id)
+        if loaded is not None:
+            return loaded
+
+        mat_path, ids_path = self._paths(project_id)
+        if not mat_path.exists() or not ids_path.exists():
+            return None
+        try:
+            matrix = np.lib.format.open_memmap(str(mat_path), mode="r+")
+            rowids = np.lib.format.open_memmap(str(ids_path), mode="r+")
+        except Exception:
+            return None
+        if matrix.ndim != 2 or matrix.shape[1] != self.vector_dim or rowids.shape[0] != matrix.shape[0]:
+            return None
+
+        slots = {int(r): i for i, r in enumerate(rowids) if r >= 0}
+        loaded = (matrix, rowids, slots)
+        self._projects[project_id] = loaded
+        return loaded
+
+    def _allocate(self, project_id: str, *, capacity: int) -> tuple[np.ndarray, np.ndarray, dict[int, int]]:
+        mat_path, ids_path = self._paths(project_id)
+        old = self._projects.pop(project_id, None)
+
+        tmp_mat = mat_path.with_name(mat_path.name + ".tmp")
+        tmp_ids = ids_path.with_name(ids_path.name + ".tmp")
+        matrix = np.lib.format.open_memmap(str(tmp_mat), mode="w+", dtype=np.float32, shape=(capacity, self.vector_dim))
+        rowids = np.lib.format.open_memmap(str(tmp_ids), mode="w+", dtype=np.int64, shape=(capacity,))
+        rowids[:] = -1
+        if old is not None:
+            old_matrix, old_rowids, old_slots = old
+            n = len(old_slots)
+            matrix[:n] = old_matrix[:n]
+            rowids[:n] = old_rowids[:n]
+            del old_matrix, old_rowids
+        matrix.flush()
+        rowids.flush()
+        del matrix, rowids
+
+        tmp_mat.replace(mat_path)
+        tmp_ids.replace(ids_path)
+        self._projects.pop(project_id, None)
+        loaded = self._open(project_id)
+        if loaded is None:
+            raise RuntimeError(f"Failed to allocate vector matrix for project: {project_id}")
+        return loaded
+
+    def count(self, *, project_id: str) -> int | None:
+        """Number of live rows, or None when the project has no (valid) matrix on disk."""
+        loaded = self._open(project_id)
+        return None if loaded is None else len(loaded[2])
+
+    def rebuild_project(self, *, project_id: str, rows: list[tuple[int, np.ndarray]], seq: int) -> None:
+        """Replace the project's files with `rows`, read from image_vectors at change seq `seq`."""
+        capacity = max(self.MIN_CAPACITY, len(rows))
+        with self._lock.exclusive():
+            self._write_state(project_id, None)
+            self._projects.pop(project_id, None)
+            mat_path, ids_path = self._paths(project_id)
+            mat_path.unlink(missing_ok=True)
+            ids_path.unlink(missing_ok=True)
+
+            matrix, rowids, slots = self._allocate(project_id, capacity=capacity)
+            for i, (rowid, vector) in enumerate(rows):
+                matrix[i] = _normalize(vector)
+                rowids[i] = int(rowid)
+                slots[int(rowid)] = i
+            self._mark_synced([project_id], seq)
+
+    def upsert(self, *, project_id: str, rowid: int, vector: np.ndarray) -> None:
+        with self._lock.exclusive():
+            loaded = self._projects.get(project_id)
+            if loaded is None:
+                return
+            matrix, rowids, slots = loaded
+            slot = slots.get(int(rowid))
+            if slot is None:
+                if len(slots) >= matrix.shape[0]:
+                    matrix, rowids, slots = self._allocate(project_id, capacity=matrix.shape[0] * 2)
+                slot = len(slots)
+                rowids[slot] = int(rowid)
+                slots[int(rowid)] = slot
+            matrix[slot] = _normalize(vector)
+
+    def delete(self, *, project_id: str, rowid: int) -> None:
+        with self._lock.exclusive():
+            loaded = self._projects.get(project_id)
+            if loaded is None:
+                return
+            matrix, rowids, slots = loaded
+            slot = slots.pop(int(rowid), None)
+            if slot is None:
+                return
+            last = len(slots)
+            if slot != last:
+                # Keep live rows packed: move the last row into the hole.
+                moved = int(rowids[last])
+                matrix[slot] = matrix[last]
+                rowids[slot] = moved
+                slots[moved] = slot
+            rowids[last] = -1
+
+    def drop_project(self, *, project_id: str) -> None:
+        with self._lock.exclusive():
+            self._projects.pop(project_id, None)
+            for path in (*self._paths(project_id), self._state_path(project_id)):
+                path.unlink(missing_ok=True)
+
+    def search(self, *, project_id: str, vector: np.ndarray, limit: int) -> list[tuple[int, float]]:
+        loaded = self._open(project_id)
+        with self._lock.shared():
+            return self._search(loaded, vector, limit)
+
+    def search_open(
+        self, *, project_id: str, vector: np.ndarray, limit: int, expected_count: int
+    ) -> list[tuple[int, float]] | None:
+        """search() of an already open project holding `expected_count` rows, else None."""
+        with self._lock.shared():
+            loaded = self._projects.get(project_id)
+            if loaded is None or len(loaded[2]) != expected_count:
+                return None
+            return self._search(loaded, vector, limit)
+
+    def _search(self, loaded, vector: np.ndarray, limit: int) -> list[tuple[int, float]]:
+        if loaded is None or limit <= 0:
+            return []
+        matrix, rowids, slots = loaded
+        n = len(slots)
+        if n == 0:
+            return []
+
+        sims = matrix[:n] @ _normalize(vector)
+        k = min(int(limit), n)
+        top = np.argpartition(-sims, k - 1)[:k]
+        top = top[np.argsort(-sims[top])]
+        return [(int(rowids[i]), float(sims[i])) for i in top]
+
+    def flush(self) -> None:
+        for matrix, rowids, _slots in self._projects.values():
+            try:
+                matrix.flush()
+                rowids.flush()
+            except Exception:
+                pass
+
+    def close(self) -> None:
+        with self._lock.exclusive():
+            self.flush()
+            self._projects.clear()
+
+
+class _SharedLock:
+    """Reader-writer lock: any number of shared holders or one exclusive holder.
+
+    Waiting exclusive holders block new shared ones, so a stream of searches can't starve
+    a writer. Not reentrant.
+    """
+
+    def __init__(self) -> None:
+        self._cond = threading.Condition()
+        self._shared = 0
+        self._exclusive = False
+        self._waiting = 0
+
+    @contextmanager
+    def shared(self) -> Iterator[None]:
+        with self._cond:
+            while self._exclusive or self._waiting:
+                self._cond.wait()
+            self._shared += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._shared -= 1
+                if not self._shared:
+                    self._cond.notify_all()
+
+    @contextmanager
+    def exclusive(self) -> Iterator[None]:
+        with self._cond:
+            self._waiting += 1
+            while self._exclusive or self._shared:
+                self._cond.wait()
+            self._waiting -= 1
+            self._exclusive = True
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._exclusive = False
+                self._cond.notify_all()
+
+
+def _locked(method):
+    # Serialize a VectorliteVectorIndex method on the writer connection.
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self._write_lock:
+            return method(self, *args, **kwargs)
+
+    return wrapper
 
 
 class VectorliteVectorIndex:
@@ -55,122 +462,499 @@ class VectorliteVectorIndex:
 
     Mirrors test/vector_db.py:
     - virtual table v_images using vectorlite(embedding float32[d] cosine, hnsw(max_elements=...))
+      (alternates with v_images_next when the index is rebuilt online, e.g. to grow capacity)
     - mapping table image_ids(rowid <-> image_id)
-    - search via knn_search(v.embedding, knn_param(?, k))
+    - search via knn_search(v.embedding, knn_param(?, k, ef)), pre-filtered to the project's rowids
+
+    HNSW build parameters (M, ef_construction) are stored in the virtual table definition;
+    changing them takes effect through an online swap rebuild (see needs_reshape). ef_search
+    defaults to `ef_search` and may be overridden per query, capped at `max_ef_search`.
+
+    Deletes and overwrites only mark HNSW nodes deleted; the graph keeps routing through
+    them (and they keep taking capacity). They are counted as tombstones, and compaction
+    (see needs_compaction) swaps in a fresh graph built from image_vectors.
 
     Additionally stores image metadata in `image_records` for list/get/delete.
-    """
 
-    SCHEMA_VERSION = 4
+    With index_file=True the HNSW graph is also persisted to disk (see index_file_path).
+    vectorlite loads that file when the virtual table is first touched and writes it
+    back when the writer connection closes; a manifest (sha256, size, vector count and
+    the vector_changes seq it covers) written next to it decides whether the file is
+    trusted at startup. A trusted file is caught up by replaying vector_changes after
+    its seq; anything else is deleted *before* vectorlite can open it (vectorlite crashes
+    the process on a corrupt file) and the index is rebuilt from image_vectors.
+    """
 
-    def __init__(self, *, db_path: Path, vector_dim: int, max_elements: int) -> None:
+    SCHEMA_VERSION = LATEST_VERSION
+
+    VIRTUAL_TABLES = ("v_images", "v_images_next")
+
+    def __init__(
+        self,
+        *,
+        db_path: Path,
+        vector_dim: int,
+        max_elements: int,
+        exact_search_max_project_size: int = 2048,
+        numpy_index: NumpyVectorIndex | None = None,
+        numpy_projects: frozenset[str] | None = None,
+        defer_rebuild: bool = False,
+        rebuild_chunk_size: int = 2048,
+        grow_threshold: float = 0.8,
+        vector_codec: str = "float32",
+        read_pool_size: int = 4,
+        index_file: bool = False,
+        hnsw_m: int = 16,
+        hnsw_ef_construction: int = 200,
+        ef_search: int | None = None,
+        max_ef_search: int = 1000,
+        compact_threshold: float = 0.0,
+        compact_min_tombstones: int = 1000,
+    ) -> None:
+        if vector_codec not in VECTOR_CODECS:
+            raise ValueError(f"Unknown vector codec: {vector_codec}")
         self.db_path = db_path
         self.vector_dim = int(vector_dim)
         self.max_elements = int(max_elements)
+        # Storage codec for image_vectors (the HNSW itself always holds float32).
+        self.vector_codec = vector_codec
+        # Projects up to this size are scored exactly instead of walking the shared HNSW graph,
+        # so small-project search latency tracks the project, not the whole DB.
+        self.exact_search_max_project_size = int(exact_search_max_project_size)
+        # Optional exact backend. Writes are mirrored into it for the selected projects
+        # (all projects when numpy_projects is None); image_vectors stays the source of truth.
+        self.numpy_index = numpy_index
+        self.numpy_projects = numpy_projects
+        self.rebuild_chunk_size = max(1, int(rebuild_chunk_size))
+        # While a rebuild is running, v_images only covers rowids <= _rebuild_cursor.
+        # None means the HNSW index is complete.
+        self._rebuild_cursor: int | None = None
+        self.rebuild_progress: tuple[int, int] = (0, 0)
+        # Capacity management: the HNSW is rebuilt into the inactive virtual table with a
+        # larger max_elements once live elements reach grow_threshold * max_elements.
+        self.grow_threshold = min(max(float(grow_threshold), 0.1), 1.0)
+        self._vtable = "v_images"
+        self._index_elements = 0
+        self._shadow_table: str | None = None
+        self._shadow_cursor = -1
+        # Persisted HNSW graph: the vector_changes seq the loaded index file covers.
+        self.index_file = bool(index_file)
+        self._index_seq: int | None = None
+        self._closed_changes = 0
+        # HNSW tuning: graph degree / build breadth for newly built tables, and the query
+        # breadth (ef_search; None = vectorlite's default) with a cap for per-query overrides.
+        self.hnsw_m = max(2, int(hnsw_m))
+        self.hnsw_ef_construction = max(1, int(hnsw_ef_construction))
+        self.max_ef_search = max(1, int(max_ef_search))
+        self.ef_search = None if ef_search is None else self._clamp_ef(int(ef_search))
+        # Deleted/overwritten HNSW nodes in the active table (and in the one being built).
+        # Scheduled compaction kicks in at compact_threshold of all nodes (0 disables it).
+        self._tombstones = 0
+        self._shadow_tombstones = 0
+        self.compact_threshold = min(max(float(compact_threshold), 0.0), 1.0)
+        self.compact_min_tombstones = max(1, int(compact_min_tombstones))
+
+        # One writer connection (it also owns the in-memory HNSW graph, so HNSW kNN queries
+        # run on it and wait behind writes) guarded by _write_lock, plus a pool of read-only
+        # connections for metadata lookups, exact scans and backups. WAL lets the readers run
+        # next to the writer. NumPy mirror searches don't touch the writer connection.
+        self._write_lock = threading.RLock()
+        self.conn = self._open_writer()
+
+        self._init_schema()
+
+        self._readers: queue.Queue[sqlite3.Connection] = queue.Queue()
+        self._reader_conns: list[sqlite3.Connection] = []
+        for _ in range(max(0, int(read_pool_size))):
+            reader = self._connect()
+            reader.execute("PRAGMA query_only=ON")
+            self._reader_conns.append(reader)
+            self._readers.put(reader)
 
-        self.conn = sqlite3.connect(str(db_path), check_same_thread=False)
-        self.conn.enable_load_extension(True)
+        # Some SQLite virtual table extensions may keep index data outside the main DB file.
+        # To make R2 snapshots robust, we persist embeddings in a normal table and can
+        # rebuild the virtual index if it appears empty. With defer_rebuild the caller drives
+        # the rebuild (see iter_rebuild_vector_index_from_vectors) and we serve exact search
+        # until it finishes.
+        if self._index_seq is not None:
+            self._catch_up_index(since=self._index_seq)
+        if self.needs_rebuild():
+            if defer_rebuild:
+                self._rebuild_cursor = -1
+            else:
+                self.rebuild_vector_index_from_vectors()
+        else:
+            self._index_elements = self._vector_count()
+            self.max_elements = self._stored_max_elements(self._vtable) or self.max_elements
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        conn.enable_load_extension(True)
         try:
             ext_path = vectorlite_py.vectorlite_path()
-            self.conn.load_extension(ext_path)
+            conn.load_extension(ext_path)
         except sqlite3.OperationalError as exc:
+            conn.close()
             raise RuntimeError(
                 "Failed to load vectorlite SQLite extension. "
                 "Ensure vectorlite is installed and your SQLite build allows extensions. "
                 f"extension_path={ext_path}"
             ) from exc
+        return conn
+
+    def _open_writer(self) -> sqlite3.Connection:
+        conn = self._connect()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    @contextmanager
+    def _reader(self) -> Iterator[sqlite3.Connection]:
+        # Readers only see committed data; without a pool, reads share the writer connection.
+        if not self._reader_conns:
+            with self._write_lock:
+                yield self.conn
+            return
+        conn = self._readers.get()
+        try:
+            yield conn
+        finally:
+            self._readers.put(conn)
 
-        self._init_schema()
-
-        # Some SQLite virtual table extensions may keep index data outside the main DB file.
-        # To make R2 snapshots robust, we persist embeddings in a normal table and can
-        # rebuild the virtual index if it appears empty.
-        self._ensure_vector_index_materialized()
+    def _locked_steps(self, steps: Iterator[tuple[int, int]]) -> Iterator[tuple[int, int]]:
+        # Hold the writer lock for each step, but not in between, so searches interleave.
+        try:
+            while True:
+                with self._write_lock:
+                    try:
+                        progress = next(steps)
+                    except StopIteration:
+                        return
+                yield progress
+        finally:
+            with self._write_lock:
+                steps.close()
 
     def _init_schema(self) -> None:
-        self.conn.execute(
-            """
-            CREATE TABLE IF NOT EXISTS schema_version (
-                id INTEGER PRIMARY KEY CHECK (id = 1),
-                version INTEGER NOT NULL
+        # Upgrade in place (never drops tables, so stored embeddings survive schema bumps).
+        for result in migrate(self.conn, target=self.SCHEMA_VERSION):
+            print(
+                f"Migrated image search DB schema to v{result.version}: "
+                f"{result.description} ({result.seconds:.2f}s)"
             )
-            """
-        )
 
-        row = self.conn.execute("SELECT version FROM schema_version WHERE id = 1").fetchone()
-        current_version = int(row[0]) if row else 0
-        if current_version != self.SCHEMA_VERSION:
-            # Hard reset on incompatibility (we're intentionally dropping legacy support).
-            self.conn.execute("DROP TABLE IF EXISTS v_images")
-            self.conn.execute("DROP TABLE IF EXISTS projects")
-            self.conn.execute("DROP TABLE IF EXISTS image_ids")
-            self.conn.execute("DROP TABLE IF EXISTS image_vectors")
-            self.conn.execute("DROP TABLE IF EXISTS image_records")
-            self.conn.execute("DELETE FROM schema_version WHERE id = 1")
-            self.conn.execute("INSERT INTO schema_version(id, version) VALUES (1, ?)", (self.SCHEMA_VERSION,))
-
-        self.conn.execute(
-            """
-            CREATE TABLE IF NOT EXISTS projects (
-                project_id TEXT PRIMARY KEY,
-                created_at TEXT NOT NULL DEFAULT (CURRENT_TIMESTAMP)
-            )
-            """
-        )
+        # After an online rebuild the active index may live in v_images_next; a leftover
+        # half-built table (crash mid-build) is discarded.
+        existing = [t for t in self.VIRTUAL_TABLES if self._stored_max_elements(t) is not None]
+        if len(existing) == 1:
+            self._vtable = existing[0]
+        for table in self.VIRTUAL_TABLES:
+            if table != self._vtable:
+                # DROP makes vectorlite load the table's index file, which is never trusted here.
+                self._discard_index_file(table)
+                self.conn.execute(f"DROP TABLE IF EXISTS {table}")
+
+        stored_max = self._stored_max_elements(self._vtable)
+        if stored_max is not None and self._stored_index_path(self._vtable) != self._index_path_arg(self._vtable):
+            # Created for another index file location (DB restored on another host or copied,
+            # IMAGE_SEARCH_HNSW_PERSIST toggled). Repoint the table definition in place: a DROP
+            # would load, then delete, the file at the old location, which may belong to the
+            # DB this one was copied from.
+            self.conn.commit()
+            self.conn.execute("PRAGMA writable_schema=ON")
+            try:
+                self.conn.execute(
+                    "UPDATE sqlite_master SET sql = ? WHERE type = 'table' AND name = ?",
+                    (
+                        self._virtual_table_sql(
+                            self._vtable, max_elements=stored_max, build=self._stored_build_params(self._vtable)
+                        ),
+                        self._vtable,
+                    ),
+                )
+                self.conn.commit()
+            finally:
+                self.conn.execute("PRAGMA writable_schema=OFF")
+            # Only a new connection picks up the edited schema.
+            self.conn.close()
+            self.conn = self._open_writer()
 
-        # NOTE: We use a surrogate integer primary key as the stable rowid for v_images.
-        # This allows (project_id, image_id) to be unique while keeping an integer rowid
-        # that vectorlite can use.
-        self.conn.execute(
-            """
-            CREATE TABLE IF NOT EXISTS image_ids (
-                internal_id INTEGER PRIMARY KEY,
-                project_id TEXT NOT NULL,
-                image_id TEXT NOT NULL,
-                UNIQUE(project_id, image_id)
-            )
-            """
-        )
+        self._index_seq = self._check_index_file()
+        self._create_virtual_table_if_missing()
+        self.conn.commit()
 
-        self.conn.execute(
-            """
-            CREATE TABLE IF NOT EXISTS image_records (
-                internal_id INTEGER PRIMARY KEY,
-                r2_key TEXT NOT NULL,
-                content_type TEXT NOT NULL,
-                original_filename TEXT,
-                size_bytes INTEGER NOT NULL
-            )
-            """
+    def _index_path_arg(self, table: str) -> str | None:
+        return str(index_file_path(self.db_path, table)) if self.index_file else None
+
+    def _virtual_table_sql(
+        self,
+        table: str,
+        *,
+        max_elements: int,
+        if_not_exists: bool = False,
+        build: tuple[int, int] | None = None,
+    ) -> str:
+        path = self._index_path_arg(table)
+        file_arg = "" if path is None else ", '" + path.replace("'", "''") + "'"
+        m, ef_construction = build or (self.hnsw_m, self.hnsw_ef_construction)
+        return (
+            f"CREATE VIRTUAL TABLE {'IF NOT EXISTS ' if if_not_exists else ''}{table} USING vectorlite("
+            f"embedding float32[{self.vector_dim}] cosine, "
+            f"hnsw(max_elements={int(max_elements)}, M={int(m)}, ef_construction={int(ef_construction)}){file_arg})"
         )
 
-        # Persist embeddings in a normal table so backups capture vectors reliably.
+    def _create_virtual_table_if_missing(self, *, table: str | None = None, max_elements: int | None = None) -> None:
         self.conn.execute(
-            """
-            CREATE TABLE IF NOT EXISTS image_vectors (
-                internal_id INTEGER PRIMARY KEY,
-                embedding BLOB NOT NULL
+            self._virtual_table_sql(
+                table or self._vtable, max_elements=int(max_elements or self.max_elements), if_not_exists=True
             )
-            """
         )
 
+    def _recreate_virtual_table(self) -> None:
+        # Some vectorlite builds don't support bulk DELETEs; safest is drop+recreate.
+        self.conn.execute(f"DROP TABLE IF EXISTS {self._vtable}")
+        self._tombstones = 0
+        self._discard_index_file(self._vtable)
         self._create_virtual_table_if_missing()
-        self.conn.commit()
 
-    def _create_virtual_table_if_missing(self) -> None:
-        self.conn.execute(
-            f"""
-            CREATE VIRTUAL TABLE IF NOT EXISTS v_images USING vectorlite(
-                embedding float32[{self.vector_dim}] cosine,
-                hnsw(max_elements={self.max_elements})
+    def _stored_index_path(self, table: str) -> str | None:
+        row = self.conn.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)).fetchone()
+        if not row or not row[0]:
+            return None
+        match = re.search(r",\s*'((?:[^']|'')*)'\s*\)\s*$", str(row[0]))
+        return match.group(1).replace("''", "'") if match else None
+
+    def _discard_index_file(self, table: str) -> None:
+        path = index_file_path(self.db_path, table)
+        index_manifest_path(path).unlink(missing_ok=True)
+        path.unlink(missing_ok=True)
+
+    def _change_seq(self) -> int:
+        try:
+            row = self.conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'vector_changes'").fetchone()
+        except sqlite3.OperationalError:
+            return 0
+        return int(row[0]) if row else 0
+
+    def _check_index_file(self) -> int | None:
+        """Validate the active table's index file against its manifest; returns the seq it covers.
+
+        Runs before the virtual table is first touched. An untrusted file is deleted, so
+        vectorlite starts from an empty graph and the index gets rebuilt.
+        """
+        if not self.index_file:
+            return None
+        path = index_file_path(self.db_path, self._vtable)
+        manifest = read_index_manifest(path)
+        if manifest is None or not path.exists():
+            self._discard_index_file(self._vtable)
+            return None
+
+        # Replaying needs every change after the file's seq still in the log.
+        row = self.conn.execute("SELECT MIN(seq) FROM vector_changes").fetchone()
+        current = self._change_seq()
+        pruned = current if not row or row[0] is None else int(row[0]) - 1
+        stored_max = self._stored_max_elements(self._vtable)
+        try:
+            seq = int(manifest["seq"])
+            valid = (
+                manifest.get("table") == self._vtable
+                and int(manifest["vector_dim"]) == self.vector_dim
+                and (stored_max is None or int(manifest["max_elements"]) == stored_max)
+                and pruned <= seq <= current
+                and int(manifest["size"]) == path.stat().st_size
+                and manifest.get("sha256") == _file_sha256(path)
             )
-            """
-        )
+        except Exception:
+            valid = False
+        if not valid:
+            print(f"WARNING: discarding image search index file that doesn't match its manifest: {path}")
+            self._discard_index_file(self._vtable)
+            return None
+        self.max_elements = int(manifest["max_elements"])
+        return seq
+
+    @_locked
+    def _catch_up_index(self, *, since: int) -> None:
+        # Bring a loaded index file up to date with image_vectors, then check it really
+        # holds exactly the stored vectors before trusting it.
+        path = index_file_path(self.db_path, self._vtable)
+        manifest = read_index_manifest(path) or {}
+        self._index_elements = int(manifest.get("vector_count", 0))
+        self._tombstones = int(manifest.get("tombstones", 0))
+        changed = [
+            int(r[0])
+            for r in self.conn.execute(
+                "SELECT DISTINCT internal_id FROM vector_changes WHERE seq > ? ORDER BY internal_id", (since,)
+            )
+        ]
+        consistent = self._index_elements + len(changed) <= self.max_elements
+        if consistent:
+            for i in range(0, len(changed), self.rebuild_chunk_size):
+                chunk = changed[i : i + self.rebuild_chunk_size]
+                placeholders = ",".join("?" for _ in chunk)
+                rows = self.conn.execute(
+                    f"SELECT internal_id, embedding FROM image_vectors WHERE internal_id IN ({placeholders})",
+                    tuple(chunk),
+                ).fetchall()
+                present = {int(rowid) for rowid, _ in rows}
+                with self.conn:
+                    self._index_remove([rowid for rowid in chunk if rowid not in present])
+                    if rows:
+                        self._index_put(self._decoded_rows(rows))
+            consistent = self._index_elements == self._vector_count() and self._spot_check_index()
+
+        if not consistent:
+            print(f"WARNING: image search index file is out of sync with image_vectors, rebuilding: {path}")
+            with self.conn:
+                self._recreate_virtual_table()
+            self._index_elements = 0
+            self._index_seq = None
+            return
+        print(f"Loaded image search index file: {path} vectors={self._index_elements} replayed={len(changed)}")
+
+    def _spot_check_index(self, *, samples: int = 32) -> bool:
+        row = self.conn.execute("SELECT MIN(internal_id), MAX(internal_id) FROM image_vectors").fetchone()
+        if not row or row[0] is None:
+            return True
+        lo, hi = int(row[0]), int(row[1])
+        probes = {lo, hi, *(random.randint(lo, hi) for _ in range(samples))}
+        for probe in probes:
+            found = self.conn.execute(
+                "SELECT internal_id FROM image_vectors WHERE internal_id >= ? ORDER BY internal_id LIMIT 1", (probe,)
+            ).fetchone()
+            if found is not None and not self._index_has_rowid(int(found[0])):
+                return False
+        return True
+
+    @_locked
+    def persist_index(self) -> dict | None:
+        """Save the HNSW graph to its index file and write the manifest; returns the manifest.
+
+        vectorlite only writes the file when the owning connection closes, so this closes
+        and reopens the writer connection (kNN searches wait for the reload). Returns None
+        when index files are off or while an index build is in flight. Also prunes the
+        vector_changes log, keeping one persist interval of history so the previously
+        uploaded index file can still be caught up.
+        """
+        if not self.index_file:
+            with self.conn:
+                self.conn.execute("DELETE FROM vector_changes")
+            return None
+        if self.rebuilding or self.swapping:
+            return None
 
-    def _recreate_virtual_table(self) -> None:
-        # Some vectorlite builds don't support bulk DELETEs; safest is drop+recreate.
-        self.conn.execute("DROP TABLE IF EXISTS v_images")
-        self._create_virtual_table_if_missing()
+        seq = self._change_seq()
+        previous = read_index_manifest(index_file_path(self.db_path, self._vtable))
+        if previous is not None and self._index_seq == seq and previous.get("seq") == seq:
+            return previous
+        vector_count = self._vector_count()
+        if self._index_elements != vector_count:
+            print(
+                f"WARNING: not persisting image search index: index_elements={self._index_elements} "
+                f"vectors={vector_count}"
+            )
+            return None
+
+        self._closed_changes += int(self.conn.total_changes)
+        self.conn.close()
+        self.conn = self._open_writer()
+        manifest = self._write_index_manifest(seq=seq, vector_count=vector_count)
+        if previous is not None and manifest is not None:
+            with self.conn:
+                self.conn.execute("DELETE FROM vector_changes WHERE seq <= ?", (int(previous.get("seq", 0)),))
+        self._index_seq = seq
+        return manifest
+
+    def _write_index_manifest(self, *, seq: int, vector_count: int) -> dict | None:
+        path = index_file_path(self.db_path, self._vtable)
+        if not path.exists():
+            return None
+        manifest = {
+            "table": self._vtable,
+            "seq": int(seq),
+            "vector_count": int(vector_count),
+            "max_elements": int(self.max_elements),
+            "vector_dim": self.vector_dim,
+            "tombstones": int(self._tombstones),
+            "size": path.stat().st_size,
+            "sha256": _file_sha256(path),
+        }
+        manifest_path = index_manifest_path(path)
+        tmp = manifest_path.with_name(f"{manifest_path.name}.tmp")
+        tmp.write_text(json.dumps(manifest), encoding="utf-8")
+        tmp.replace(manifest_path)
+        return manifest
+
+    def _stored_max_elements(self, table: str) -> int | None:
+        row = self.conn.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)).fetchone()
+        if not row or not row[0]:
+            return None
+        match = re.search(r"max_elements\s*=\s*(\d+)", str(row[0]))
+        return int(match.group(1)) if match else None
+
+    def _stored_build_params(self, table: str) -> tuple[int, int] | None:
+        """(M, ef_construction) the table was built with; vectorlite's defaults when unset."""
+        row = self.conn.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)).fetchone()
+        if not row or not row[0]:
+            return None
+        sql = str(row[0])
+        m = re.search(r"\bM\s*=\s*(\d+)", sql)
+        ef_construction = re.search(r"ef_construction\s*=\s*(\d+)", sql)
+        return (int(m.group(1)) if m else 16, int(ef_construction.group(1)) if ef_construction else 200)
+
+    @_locked
+    def needs_reshape(self) -> bool:
+        """True when the active HNSW was built with other M / ef_construction than configured."""
+        if self.rebuilding or self._shadow_table is not None:
+            return False
+        stored = self._stored_build_params(self._vtable)
+        return stored is not None and stored != (self.hnsw_m, self.hnsw_ef_construction)
+
+    def iter_reshape_vector_index(self, *, chunk_size: int | None = None) -> Iterator[tuple[int, int]]:
+        """Online swap rebuild with the configured M / ef_construction (same capacity)."""
+        return self.iter_swap_rebuild_vector_index(max_elements=self.max_elements, chunk_size=chunk_size)
+
+    @property
+    def index_elements(self) -> int:
+        return self._index_elements
+
+    @property
+    def tombstones(self) -> int:
+        return self._tombstones
+
+    @property
+    def tombstone_ratio(self) -> float:
+        return self._tombstones / max(1, self._index_elements + self._tombstones)
+
+    @_locked
+    def needs_compaction(self) -> bool:
+        """True when scheduled compaction is on and enough of the HNSW is deleted nodes."""
+        if self.compact_threshold <= 0 or self.rebuilding or self._shadow_table is not None:
+            return False
+        return self._tombstones >= self.compact_min_tombstones and self.tombstone_ratio >= self.compact_threshold
+
+    def iter_compact_vector_index(self, *, chunk_size: int | None = None) -> Iterator[tuple[int, int]]:
+        """Online swap rebuild that drops the active HNSW's tombstones (same capacity)."""
+        return self.iter_swap_rebuild_vector_index(max_elements=self.max_elements, chunk_size=chunk_size)
+
+    def _clamp_ef(self, ef: int) -> int:
+        return min(max(1, int(ef)), self.max_ef_search)
+
+    def _capacity_for(self, count: int, *, start: int | None = None) -> int:
+        capacity = max(1, int(start or self.max_elements))
+        while count >= capacity * self.grow_threshold:
+            capacity *= 2
+        return capacity
+
+    @property
+    def fill_ratio(self) -> float:
+        return self._index_elements / max(1, self.max_elements)
+
+    def needs_growth(self) -> bool:
+        if self.rebuilding or self._shadow_table is not None:
+            return False
+        return self._index_elements >= self.max_elements * self.grow_threshold
 
     def _vector_count(self) -> int:
         try:
@@ -179,37 +963,249 @@ class VectorliteVectorIndex:
         except Exception:
             return 0
 
-    def _index_count(self) -> int:
+    def _index_has_rowid(self, rowid: int) -> bool:
+        # vectorlite can't answer COUNT(*) (no query plan for a full scan), but rowid lookups work.
         try:
-            row = self.conn.execute("SELECT COUNT(*) FROM v_images").fetchone()
-            return int(row[0] if row else 0)
+            row = self.conn.execute(f"SELECT rowid FROM {self._vtable} WHERE rowid = ?", (int(rowid),)).fetchone()
+            return row is not None
         except Exception:
-            return 0
+            return False
 
-    def _ensure_vector_index_materialized(self) -> None:
+    @_locked
+    def needs_rebuild(self) -> bool:
         # If we have persisted vectors but the virtual index is empty (common after restore
-        # if the extension stores data out-of-band), rebuild it.
-        vec_count = self._vector_count()
-        if vec_count <= 0:
-            return
+        # if the extension stores data out-of-band), it must be rebuilt.
+        row = self.conn.execute("SELECT MAX(internal_id) FROM image_vectors").fetchone()
+        if not row or row[0] is None:
+            return False
+        return not self._index_has_rowid(int(row[0]))
+
+    @property
+    def rebuilding(self) -> bool:
+        return self._rebuild_cursor is not None
+
+    def _index_covers(self, rowid: int) -> bool:
+        # During a rebuild, rows past the cursor are only written to image_vectors; the
+        # rebuild picks them up (or never sees them, if deleted) when it gets there.
+        return self._rebuild_cursor is None or int(rowid) <= self._rebuild_cursor
+
+    def iter_rebuild_vector_index_from_vectors(self, *, chunk_size: int | None = None) -> Iterator[tuple[int, int]]:
+        """Rebuild v_images from image_vectors in bounded chunks, yielding (done, total).
+
+        Rows are paged by internal_id (keyset), so memory stays constant regardless of DB
+        size. Each step is a short transaction; callers may interleave other writes between
+        steps (they must not run concurrently with a step).
+        """
+        return self._locked_steps(self._rebuild_steps(chunk_size=chunk_size))
+
+    def _rebuild_steps(self, *, chunk_size: int | None) -> Iterator[tuple[int, int]]:
+        chunk_size = max(1, int(chunk_size or self.rebuild_chunk_size))
+        total = self._vector_count()
+        done = 0
+        self._rebuild_cursor = -1
+        self.rebuild_progress = (done, total)
+        self.max_elements = self._capacity_for(total)
+        self._index_elements = 0
+        with self.conn:
+            self._recreate_virtual_table()
+        yield self.rebuild_progress
+
+        # If this generator fails or is abandoned midway, the cursor stays put: the index
+        # keeps reporting `rebuilding` (exact search) and remains consistent up to the cursor.
+        while True:
+            rows = self.conn.execute(
+                "SELECT internal_id, embedding FROM image_vectors WHERE internal_id > ? ORDER BY internal_id LIMIT ?",
+                (self._rebuild_cursor, chunk_size),
+            ).fetchall()
+            if not rows:
+                break
+            with self.conn:
+                self.conn.executemany(
+                    f"INSERT INTO {self._vtable}(rowid, embedding) VALUES (?, ?)", self._decoded_rows(rows)
+                )
+            self._index_elements += len(rows)
+            self._rebuild_cursor = int(rows[-1][0])
+            done += len(rows)
+            # Writes during the rebuild can add rows, so total is a moving target.
+            total = max(total, done)
+            self.rebuild_progress = (done, total)
+            yield self.rebuild_progress
+
+        self._rebuild_cursor = None
+
+    def rebuild_vector_index_from_vectors(
+        self, *, chunk_size: int | None = None, progress: Callable[[int, int], None] | None = None
+    ) -> None:
+        for done, total in self.iter_rebuild_vector_index_from_vectors(chunk_size=chunk_size):
+            if progress is not None:
+                progress(done, total)
+
+    @property
+    def swapping(self) -> bool:
+        return self._shadow_table is not None
+
+    def iter_swap_rebuild_vector_index(
+        self, *, max_elements: int | None = None, chunk_size: int | None = None
+    ) -> Iterator[tuple[int, int]]:
+        """Build a fresh HNSW in the inactive virtual table and swap it in, yielding (done, total).
+
+        Searches keep using the active table until the swap. Writes made while the build
+        runs go to the active table as usual and are mirrored into the new one for rowids
+        it has already copied; later rowids are picked up by the copy itself. The last step
+        drops the old table and repoints the index; like every step, callers run it under
+        the writer lock, so the swap itself is a single short critical section.
+        """
+        return self._locked_steps(self._swap_rebuild_steps(max_elements=max_elements, chunk_size=chunk_size))
 
-        idx_count = self._index_count()
-        if idx_count > 0:
-            return
+    def _swap_rebuild_steps(self, *, max_elements: int | None, chunk_size: int | None) -> Iterator[tuple[int, int]]:
+        if self.rebuilding or self._shadow_table is not None:
+            raise RuntimeError("Vector index rebuild already in progress")
 
-        self.rebuild_vector_index_from_vectors()
+        chunk_size = max(1, int(chunk_size or self.rebuild_chunk_size))
+        total = self._vector_count()
+        new_max = int(max_elements or self._capacity_for(total))
+        shadow = "v_images_next" if self._vtable == "v_images" else "v_images"
+        done = 0
 
-    def rebuild_vector_index_from_vectors(self) -> None:
-        rows = self.conn.execute("SELECT internal_id, embedding FROM image_vectors").fetchall()
-        if not rows:
+        with self.conn:
+            self.conn.execute(f"DROP TABLE IF EXISTS {shadow}")
+            self._discard_index_file(shadow)
+            self._create_virtual_table_if_missing(table=shadow, max_elements=new_max)
+        self._shadow_table = shadow
+        self._shadow_cursor = -1
+        self._shadow_tombstones = 0
+        swapped = False
+        try:
+            yield (done, total)
+
+            while self._shadow_table == shadow:
+                rows = self.conn.execute(
+                    "SELECT internal_id, embedding FROM image_vectors WHERE internal_id > ? ORDER BY internal_id LIMIT ?",
+                    (self._shadow_cursor, chunk_size),
+                ).fetchall()
+                if not rows:
+                    break
+                with self.conn:
+                    self.conn.executemany(f"INSERT INTO {shadow}(rowid, embedding) VALUES (?, ?)", self._decoded_rows(rows))
+                self._shadow_cursor = int(rows[-1][0])
+                done += len(rows)
+                total = max(total, done)
+                yield (done, total)
+
+            if self._shadow_table != shadow:
+                # Aborted from under us (see _abort_swap_rebuild).
+                return
+
+            with self.conn:
+                self.conn.execute(f"DROP TABLE IF EXISTS {self._vtable}")
+            self._discard_index_file(self._vtable)
+            self._vtable = shadow
+            self.max_elements = new_max
+            self._index_elements = self._vector_count()
+            self._tombstones = self._shadow_tombstones
+            swapped = True
+        finally:
+            if not swapped and self._shadow_table == shadow:
+                self._abort_swap_rebuild()
+            elif swapped:
+                self._shadow_table = None
+                self._shadow_cursor = -1
+
+    def iter_grow_vector_index(self, *, chunk_size: int | None = None) -> Iterator[tuple[int, int]]:
+        """Online capacity growth: swap in an HNSW with (at least) double max_elements."""
+        new_max = self._capacity_for(self._vector_count(), start=self.max_elements * 2)
+        return self.iter_swap_rebuild_vector_index(max_elements=new_max, chunk_size=chunk_size)
+
+    def _abort_swap_rebuild(self) -> None:
+        shadow = self._shadow_table
+        self._shadow_table = None
+        self._shadow_cursor = -1
+        if shadow is not None:
+            with self.conn:
+                self.conn.execute(f"DROP TABLE IF EXISTS {shadow}")
+            self._discard_index_file(shadow)
+
+    def _ensure_capacity(self, *, extra: int) -> None:
+        # Safety net when background growth didn't keep up: grow synchronously rather than
+        # letting vectorlite reject the insert ("number of elements exceeds the specified limit").
+        if self.rebuilding or self._index_elements + int(extra) <= self.max_elements:
             return
+        self._abort_swap_rebuild()
+        new_max = self._capacity_for(self._vector_count() + int(extra), start=self.max_elements * 2)
+        for _ in self.iter_swap_rebuild_vector_index(max_elements=new_max):
+            pass
 
-        with self.conn:
-            # Clear existing index.
-            self._recreate_virtual_table()
-            for internal_id, embedding_blob in rows:
-                rowid = int(internal_id)
-                self.conn.execute("INSERT INTO v_images(rowid, embedding) VALUES (?, ?)", (rowid, embedding_blob))
+    def _decoded_rows(self, rows: list[tuple[int, bytes]]) -> list[tuple[int, bytes]]:
+        if all(len(blob) == 4 * self.vector_dim for _, blob in rows):
+            return rows
+        return [(int(rowid), decode_vector(blob, dim=self.vector_dim).tobytes()) for rowid, blob in rows]
+
+    @_locked
+    def needs_recode(self) -> bool:
+        expected = len(encode_vector(np.zeros(self.vector_dim, dtype=np.float32), codec=self.vector_codec))
+        row = self.conn.execute("SELECT 1 FROM image_vectors WHERE length(embedding) != ? LIMIT 1", (expected,)).fetchone()
+        return row is not None
+
+    def iter_recode_vectors(self, *, chunk_size: int | None = None) -> Iterator[tuple[int, int]]:
+        """Re-encode stored vectors into the configured codec in bounded chunks, yielding (done, total)."""
+        return self._locked_steps(self._recode_steps(chunk_size=chunk_size))
+
+    def _recode_steps(self, *, chunk_size: int | None) -> Iterator[tuple[int, int]]:
+        chunk_size = max(1, int(chunk_size or self.rebuild_chunk_size))
+        total = self._vector_count()
+        expected = len(encode_vector(np.zeros(self.vector_dim, dtype=np.float32), codec=self.vector_codec))
+        cursor = -1
+        done = 0
+        while True:
+            rows = self.conn.execute(
+                "SELECT internal_id, embedding FROM image_vectors WHERE internal_id > ? ORDER BY internal_id LIMIT ?",
+                (cursor, chunk_size),
+            ).fetchall()
+            if not rows:
+                break
+            recoded = [
+                (encode_vector(decode_vector(blob, dim=self.vector_dim), codec=self.vector_codec), int(rowid))
+                for rowid, blob in rows
+                if len(blob) != expected
+            ]
+            if recoded:
+                with self.conn:
+                    self.conn.executemany("UPDATE image_vectors SET embedding = ? WHERE internal_id = ?", recoded)
+            cursor = int(rows[-1][0])
+            done += len(rows)
+            yield (done, max(total, done))
+
+    def _index_put(self, rows: list[tuple[int, bytes]]) -> None:
+        active = [(rowid, blob) for rowid, blob in rows if self._index_covers(rowid)]
+        if active:
+            added = sum(1 for rowid, _ in active if not self._index_has_rowid(rowid))
+            self.conn.executemany(f"DELETE FROM {self._vtable} WHERE rowid = ?", [(rowid,) for rowid, _ in active])
+            self.conn.executemany(f"INSERT INTO {self._vtable}(rowid, embedding) VALUES (?, ?)", active)
+            self._index_elements += added
+            self._tombstones += len(active) - added
+
+        if self._shadow_table is not None:
+            shadow = [(rowid, blob) for rowid, blob in rows if rowid <= self._shadow_cursor]
+            if shadow:
+                self.conn.executemany(
+                    f"DELETE FROM {self._shadow_table} WHERE rowid = ?", [(rowid,) for rowid, _ in shadow]
+                )
+                self.conn.executemany(f"INSERT INTO {self._shadow_table}(rowid, embedding) VALUES (?, ?)", shadow)
+                self._shadow_tombstones += len(shadow)
+
+    def _index_remove(self, rowids: list[int]) -> None:
+        active = [rowid for rowid in rowids if self._index_covers(rowid)]
+        if active:
+            removed = sum(1 for rowid in active if self._index_has_rowid(rowid))
+            self.conn.executemany(f"DELETE FROM {self._vtable} WHERE rowid = ?", [(rowid,) for rowid in active])
+            self._index_elements = max(0, self._index_elements - removed)
+            self._tombstones += removed
+
+        if self._shadow_table is not None:
+            shadow = [rowid for rowid in rowids if rowid <= self._shadow_cursor]
+            if shadow:
+                self.conn.executemany(f"DELETE FROM {self._shadow_table} WHERE rowid = ?", [(rowid,) for rowid in shadow])
+                self._shadow_tombstones += len(shadow)
 
     def _rowid_for_image_id(self, *, project_id: str, image_id: str) -> int | None:
         row = self.conn.execute(
@@ -231,35 +1227,38 @@ class VectorliteVectorIndex:
             raise RuntimeError("Failed to allocate rowid for image_id")
         return rowid
 
+    @_locked
     def upsert_image(self, *, record: ImageRecord, vector: np.ndarray) -> None:
         vec = vector.astype(np.float32, copy=False)
         if vec.ndim != 1 or vec.shape[0] != self.vector_dim:
             raise ValueError(f"Unexpected vector shape: {tuple(vec.shape)}")
 
         blob = vec.tobytes()
+        self._ensure_capacity(extra=1)
+        mirrored = self._numpy_begin([record.project_id])
 
         # One transaction: vector + metadata.
         with self.conn:
             self.ensure_project(project_id=record.project_id)
             rowid = self._ensure_rowid(project_id=record.project_id, image_id=record.id)
-            self.conn.execute("DELETE FROM v_images WHERE rowid = ?", (rowid,))
-            self.conn.execute("INSERT INTO v_images(rowid, embedding) VALUES (?, ?)", (rowid, blob))
+            self._index_put([(rowid, blob)])
             self.conn.execute(
                 """
                 INSERT INTO image_vectors(internal_id, embedding) VALUES (?, ?)
                 ON CONFLICT(internal_id) DO UPDATE SET embedding=excluded.embedding
                 """,
-                (rowid, blob),
+                (rowid, encode_vector(vec, codec=self.vector_codec)),
             )
             self.conn.execute(
                 """
-                INSERT INTO image_records(internal_id, r2_key, content_type, original_filename, size_bytes)
-                VALUES (?, ?, ?, ?, ?)
+                INSERT INTO image_records(internal_id, r2_key, content_type, original_filename, size_bytes, sha256)
+                VALUES (?, ?, ?, ?, ?, ?)
                 ON CONFLICT(internal_id) DO UPDATE SET
                     r2_key=excluded.r2_key,
                     content_type=excluded.content_type,
                     original_filename=excluded.original_filename,
-                    size_bytes=excluded.size_bytes
+                    size_bytes=excluded.size_bytes,
+                    sha256=excluded.sha256
                 """,
                 (
                     rowid,
@@ -267,19 +1266,113 @@ class VectorliteVectorIndex:
                     record.content_type,
                     record.original_filename,
                     int(record.size_bytes),
+                    record.sha256,
                 ),
             )
 
+        if mirrored:
+            self.numpy_index.upsert(project_id=record.project_id, rowid=rowid, vector=vec)
+            self._numpy_commit(mirrored)
+
+    @_locked
+    def upsert_images(self, *, items: list[tuple[ImageRecord, np.ndarray]]) -> None:
+        """Bulk variant of upsert_image(): every row is written in a single transaction."""
+        if not items:
+            return
+
+        blobs: list[bytes] = []
+        stored: list[bytes] = []
+        for _record, vector in items:
+            vec = vector.astype(np.float32, copy=False)
+            if vec.ndim != 1 or vec.shape[0] != self.vector_dim:
+                raise ValueError(f"Unexpected vector shape: {tuple(vec.shape)}")
+            blobs.append(vec.tobytes())
+            stored.append(encode_vector(vec, codec=self.vector_codec))
+        self._ensure_capacity(extra=len(items))
+        mirrored = self._numpy_begin([record.project_id for record, _ in items])
+
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO projects(project_id) VALUES (?)",
+                sorted({(record.project_id,) for record, _ in items}),
+            )
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO image_ids(project_id, image_id) VALUES (?, ?)",
+                [(record.project_id, record.id) for record, _ in items],
+            )
+            rowids: list[int] = []
+            for record, _ in items:
+                rowid = self._rowid_for_image_id(project_id=record.project_id, image_id=record.id)
+                if rowid is None:
+                    raise RuntimeError("Failed to allocate rowid for image_id")
+                rowids.append(rowid)
+
+            self._index_put(list(zip(rowids, blobs)))
+            self.conn.executemany(
+                """
+                INSERT INTO image_vectors(internal_id, embedding) VALUES (?, ?)
+                ON CONFLICT(internal_id) DO UPDATE SET embedding=excluded.embedding
+                """,
+                list(zip(rowids, stored)),
+            )
+            self.conn.executemany(
+                """
+                INSERT INTO image_records(internal_id, r2_key, content_type, original_filename, size_bytes, sha256)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT(internal_id) DO UPDATE SET
+                    r2_key=excluded.r2_key,
+                    content_type=excluded.content_type,
+                    original_filename=excluded.original_filename,
+                    size_bytes=excluded.size_bytes,
+                    sha256=excluded.sha256
+                """,
+                [
+                    (
+                        rowid,
+                        record.r2_key,
+                        record.content_type,
+                        record.original_filename,
+                        int(record.size_bytes),
+                        record.sha256,
+                    )
+                    for rowid, (record, _) in zip(rowids, items)
+                ],
+            )
+
+        if mirrored:
+            for rowid, (record, vector) in zip(rowids, items):
+                if record.project_id in mirrored:
+                    self.numpy_index.upsert(project_id=record.project_id, rowid=rowid, vector=vector)
+            self._numpy_commit(mirrored)
+
+    def _numpy_begin(self, project_ids: list[str]) -> list[str]:
+        # Mark the mirrored projects dirty before the DB commit (see NumpyVectorIndex).
+        mirrored = sorted({p for p in project_ids if self._uses_numpy(p)})
+        if mirrored:
+            self.numpy_index.mark_dirty(project_ids=mirrored)
+        return mirrored
+
+    def _numpy_commit(self, project_ids: list[str]) -> None:
+        self.numpy_index.mark_synced(project_ids=project_ids, seq=self._change_seq())
+
+    @_locked
     def delete_image(self, *, project_id: str, image_id: str) -> None:
+        mirrored = self._numpy_begin([project_id])
         # One transaction: vector + metadata.
         with self.conn:
             rowid = self._rowid_for_image_id(project_id=project_id, image_id=image_id)
             if rowid is not None:
-                self.conn.execute("DELETE FROM v_images WHERE rowid = ?", (rowid,))
+                self._index_remove([rowid])
                 self.conn.execute("DELETE FROM image_ids WHERE internal_id = ?", (rowid,))
                 self.conn.execute("DELETE FROM image_vectors WHERE internal_id = ?", (rowid,))
                 self.conn.execute("DELETE FROM image_records WHERE internal_id = ?", (rowid,))
 
+        if mirrored:
+            if rowid is not None:
+                self.numpy_index.delete(project_id=project_id, rowid=rowid)
+            self._numpy_commit(mirrored)
+
+    @_locked
     def upsert(self, *, item_id: str, vector: np.ndarray) -> None:
         vec = vector.astype(np.float32, copy=False)
         if vec.ndim != 1 or vec.shape[0] != self.vector_dim:
@@ -289,39 +1382,42 @@ class VectorliteVectorIndex:
         rowid = self._ensure_rowid(project_id="default", image_id=item_id)
 
         blob = vec.tobytes()
+        self._ensure_capacity(extra=1)
         with self.conn:
-            self.conn.execute("DELETE FROM v_images WHERE rowid = ?", (rowid,))
-            self.conn.execute("INSERT INTO v_images(rowid, embedding) VALUES (?, ?)", (rowid, blob))
+            self._index_put([(rowid, blob)])
             self.conn.execute(
                 """
                 INSERT INTO image_vectors(internal_id, embedding) VALUES (?, ?)
                 ON CONFLICT(internal_id) DO UPDATE SET embedding=excluded.embedding
                 """,
-                (rowid, blob),
+                (rowid, encode_vector(vec, codec=self.vector_codec)),
             )
 
+    @_locked
     def delete(self, *, item_id: str) -> None:
         rowid = self._rowid_for_image_id(project_id="default", image_id=item_id)
         if rowid is None:
             return
         with self.conn:
-            self.conn.execute("DELETE FROM v_images WHERE rowid = ?", (rowid,))
+            self._index_remove([rowid])
             self.conn.execute("DELETE FROM image_ids WHERE internal_id = ?", (rowid,))
             self.conn.execute("DELETE FROM image_vectors WHERE internal_id = ?", (rowid,))
 
+    @_locked
     def upsert_record(self, record: ImageRecord) -> None:
         with self.conn:
             self.ensure_project(project_id=record.project_id)
             rowid = self._ensure_rowid(project_id=record.project_id, image_id=record.id)
             self.conn.execute(
                 """
-                INSERT INTO image_records(internal_id, r2_key, content_type, original_filename, size_bytes)
-                VALUES (?, ?, ?, ?, ?)
+                INSERT INTO image_records(internal_id, r2_key, content_type, original_filename, size_bytes, sha256)
+                VALUES (?, ?, ?, ?, ?, ?)
                 ON CONFLICT(internal_id) DO UPDATE SET
                     r2_key=excluded.r2_key,
                     content_type=excluded.content_type,
                     original_filename=excluded.original_filename,
-                    size_bytes=excluded.size_bytes
+                    size_bytes=excluded.size_bytes,
+                    sha256=excluded.sha256
                 """,
                 (
                     rowid,
@@ -329,31 +1425,27 @@ class VectorliteVectorIndex:
                     record.content_type,
                     record.original_filename,
                     int(record.size_bytes),
+                    record.sha256,
                 ),
             )
 
     def get_record(self, *, project_id: str, image_id: str) -> ImageRecord | None:
-        row = self.conn.execute(
-            """
-            SELECT ids.project_id, ids.image_id, rec.r2_key, rec.content_type, rec.original_filename, rec.size_bytes
-            FROM image_ids ids
-            JOIN image_records rec ON rec.internal_id = ids.internal_id
-            WHERE ids.project_id = ? AND ids.image_id = ?
-            """,
-            (project_id, image_id),
-        ).fetchone()
+        with self._reader() as conn:
+            row = conn.execute(
+                """
+                SELECT ids.project_id, ids.image_id, rec.r2_key, rec.content_type, rec.original_filename, rec.size_bytes,
+                       rec.sha256
+                FROM image_ids ids
+                JOIN image_records rec ON rec.internal_id = ids.internal_id
+                WHERE ids.project_id = ? AND ids.image_id = ?
+                """,
+                (project_id, image_id),
+            ).fetchone()
         if not row:
             return None
-        project_id_s, image_id_s, r2_key, content_type, original_filename, size_bytes = row
-        return ImageRecord(
-            project_id=str(project_id_s),
-            id=str(image_id_s),
-            r2_key=str(r2_key),
-            content_type=str(content_type),
-            original_filename=(None if original_filename is None else str(original_filename)),
-            size_bytes=int(size_bytes),
-        )
+        return _record_from_row(row)
 
+    @_locked
     def delete_record(self, *, project_id: str, image_id: str) -> None:
         with self.conn:
             rowid = self._rowid_for_image_id(project_id=project_id, image_id=image_id)
@@ -361,31 +1453,68 @@ class VectorliteVectorIndex:
                 return
             self.conn.execute("DELETE FROM image_records WHERE internal_id = ?", (rowid,))
 
-    def list_records(self, *, project_id: str) -> list[ImageRecord]:
-        rows = self.conn.execute(
-            """
-            SELECT ids.project_id, ids.image_id, rec.r2_key, rec.content_type, rec.original_filename, rec.size_bytes
+    def list_records(
+        self, *, project_id: str, limit: int | None = None, after: str | None = None
+    ) -> list[ImageRecord]:
+        """Records of a project ordered by image_id; `after`/`limit` page through them (keyset).
+
+        The UNIQUE(project_id, image_id) index serves both the filter and the order, so a
+        page costs O(limit) however deep into the project it starts.
+        """
+        sql = """
+            SELECT ids.project_id, ids.image_id, rec.r2_key, rec.content_type, rec.original_filename, rec.size_bytes,
+                   rec.sha256
             FROM image_ids ids
             JOIN image_records rec ON rec.internal_id = ids.internal_id
             WHERE ids.project_id = ?
-            ORDER BY ids.image_id
-            """,
-            (project_id,),
-        ).fetchall()
-        out: list[ImageRecord] = []
-        for project_id_s, image_id, r2_key, content_type, original_filename, size_bytes in rows:
-            out.append(
-                ImageRecord(
-                    project_id=str(project_id_s),
-                    id=str(image_id),
-                    r2_key=str(r2_key),
-                    content_type=str(content_type),
-                    original_filename=(None if original_filename is None else str(original_filename)),
-                    size_bytes=int(size_bytes),
+        """
+        params: list[object] = [project_id]
+        if after is not None:
+            sql += " AND ids.image_id > ?"
+            params.append(after)
+        sql += " ORDER BY ids.image_id"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(int(limit))
+        with self._reader() as conn:
+            rows = conn.execute(sql, params).fetchall()
+        return [_record_from_row(row) for row in rows]
+
+    def iter_project_export(
+        self, *, project_id: str, chunk_size: int | None = None
+    ) -> Iterator[list[tuple[ImageRecord, bytes]]]:
+        """Pages of (record, stored vector blob) for a whole project, all from one read snapshot.
+
+        Blobs are returned as stored (any codec); see decode_matrix.
+        """
+        chunk_size = max(1, int(chunk_size or self.rebuild_chunk_size))
+        with self._reader() as conn:
+            own_txn = not conn.in_transaction
+            if own_txn:
+                conn.execute("BEGIN")
+            try:
+                cursor = conn.execute(
+                    """
+                    SELECT ids.project_id, ids.image_id, rec.r2_key, rec.content_type, rec.original_filename,
+                           rec.size_bytes, rec.sha256, vec.embedding
+                    FROM image_ids ids
+                    JOIN image_records rec ON rec.internal_id = ids.internal_id
+                    JOIN image_vectors vec ON vec.internal_id = ids.internal_id
+                    WHERE ids.project_id = ?
+                    ORDER BY ids.internal_id
+                    """,
+                    (project_id,),
                 )
-            )
-        return out
-
+                while True:
+                    rows = cursor.fetchmany(chunk_size)
+                    if not rows:
+                        break
+                    yield [(_record_from_row(row[:7]), bytes(row[7])) for row in rows]
+            finally:
+                if own_txn:
+                    conn.execute("COMMIT")
+
+    @_locked
     def search(self, *, vector: np.ndarray, limit: int) -> list[tuple[str, float]]:
         if limit <= 0:
             return []
@@ -396,9 +1525,9 @@ class VectorliteVectorIndex:
 
         query_blob = vec.tobytes()
 
-        sql = """
+        sql = f"""
             SELECT ids.image_id, rec.r2_key, rec.content_type, rec.original_filename, rec.size_bytes, v.distance
-            FROM v_images v
+            FROM {self._vtable} v
             JOIN image_ids ids ON v.rowid = ids.internal_id
             JOIN image_records rec ON rec.internal_id = ids.internal_id
             WHERE knn_search(v.embedding, knn_param(?, ?))
@@ -415,73 +1544,517 @@ class VectorliteVectorIndex:
         results.sort(key=lambda x: x[1], reverse=True)
         return results
 
-    def search_records(self, *, project_id: str, vector: np.ndarray, limit: int) -> list[tuple[ImageRecord, float]]:
+    def search_records(
+        self, *, project_id: str, vector: np.ndarray, limit: int, ef: int | None = None
+    ) -> list[tuple[ImageRecord, float]]:
+        return self.search_records_many(project_id=project_id, vectors=[vector], limit=limit, ef=ef)[0]
+
+    def search_records_many(
+        self, *, project_id: str, vectors: list[np.ndarray], limit: int, ef: int | None = None
+    ) -> list[list[tuple[ImageRecord, float]]]:
+        """search_records for several query vectors in one project; one result list per vector.
+
+        `ef` overrides the HNSW search breadth (capped at max_ef_search); exact paths ignore it.
+
+        The queries share the project size lookup, the exact-scan matrix (scored with a single
+        matrix product) and the record lookup.
+        """
+        vecs: list[np.ndarray] = []
+        for vector in vectors:
+            vec = vector.astype(np.float32, copy=False)
+            if vec.ndim != 1 or vec.shape[0] != self.vector_dim:
+                raise ValueError(f"Unexpected vector shape: {tuple(vec.shape)}")
+            vecs.append(vec)
+        if limit <= 0 or not vecs:
+            return [[] for _ in vecs]
+
+        project_size = self._project_size(project_id=project_id)
+        k = min(int(limit), project_size)
+        if k <= 0:
+            return [[] for _ in vecs]
+
+        if self._uses_numpy(project_id):
+            scored = [
+                self._search_project_numpy(project_id=project_id, vector=vec, limit=k, project_size=project_size)
+                for vec in vecs
+            ]
+        elif self.rebuilding or project_size <= self.exact_search_max_project_size:
+            scored = self._search_project_exact_many(project_id=project_id, vectors=vecs, limit=k)
+        else:
+            scored = [self._search_project_hnsw(project_id=project_id, vector=vec, limit=k, ef=ef) for vec in vecs]
+            # HNSW is approximate; never return a short page when the project has more.
+            self._rescore_exact(project_id, vecs, scored, [i for i, hits in enumerate(scored) if len(hits) < k], k)
+
+        records = self._records_for_rowids(sorted({rowid for hits in scored for rowid, _ in hits}))
+        stale = [i for i, hits in enumerate(scored) if any(rowid not in records for rowid, _ in hits)]
+        if stale:
+            # Hits deleted between the kNN walk and the record lookup (reads don't hold the
+            # writer lock): rescore exactly rather than return a short page.
+            self._rescore_exact(project_id, vecs, scored, stale, k)
+            records = self._records_for_rowids(sorted({rowid for hits in scored for rowid, _ in hits}))
+
+        out: list[list[tuple[ImageRecord, float]]] = []
+        for hits in scored:
+            found = [(records[rowid], sim) for rowid, sim in hits if rowid in records]
+            found.sort(key=lambda x: x[1], reverse=True)
+            out.append(found)
+        return out
+
+    def _rescore_exact(
+        self,
+        project_id: str,
+        vecs: list[np.ndarray],
+        scored: list[list[tuple[int, float]]],
+        which: list[int],
+        limit: int,
+    ) -> None:
+        if not which:
+            return
+        exact = self._search_project_exact_many(project_id=project_id, vectors=[vecs[i] for i in which], limit=limit)
+        for i, hits in zip(which, exact):
+            scored[i] = hits
+
+    def search_records_text(self, *, project_id: str, query: str, limit: int) -> list[tuple[ImageRecord, float]]:
+        """BM25 search over record metadata (filename, content type); score is -bm25, higher is better."""
+        match = fts_query(query)
+        if match is None or limit <= 0:
+            return []
+        with self._reader() as conn:
+            rows = conn.execute(
+                """
+                SELECT ids.project_id, ids.image_id, rec.r2_key, rec.content_type, rec.original_filename,
+                       rec.size_bytes, rec.sha256, bm25(image_records_fts, 10.0, 1.0) AS rank
+                FROM image_records_fts
+                JOIN image_ids ids ON ids.internal_id = image_records_fts.rowid
+                JOIN image_records rec ON rec.internal_id = ids.internal_id
+                WHERE image_records_fts MATCH ? AND ids.project_id = ?
+                ORDER BY rank
+                LIMIT ?
+                """,
+                (match, project_id, int(limit)),
+            ).fetchall()
+        return [(_record_from_row(row[:7]), -float(row[7])) for row in rows]
+
+    def search_records_hybrid(
+        self,
+        *,
+        project_id: str,
+        query: str,
+        vector: np.ndarray,
+        limit: int,
+        candidates: int = 100,
+        rrf_k: int = 60,
+        ef: int | None = None,
+    ) -> list[tuple[ImageRecord, float]]:
+        """Reciprocal rank fusion of BM25 metadata hits and CLIP similarity hits.
+
+        Each side contributes its top `candidates`; a record scores sum(1 / (rrf_k + rank))
+        over the sides it appears in, so neither side's raw score scale matters.
+        """
         if limit <= 0:
             return []
+        n = max(int(limit), int(candidates))
+        lexical = self.search_records_text(project_id=project_id, query=query, limit=n)
+        semantic = self.search_records(project_id=project_id, vector=vector, limit=n, ef=ef)
+
+        fused: dict[str, list] = {}
+        for hits in (semantic, lexical):
+            for rank, (record, _score) in enumerate(hits, start=1):
+                entry = fused.setdefault(record.id, [record, 0.0])
+                entry[1] += 1.0 / (rrf_k + rank)
+        out = sorted(((record, score) for record, score in fused.values()), key=lambda x: x[1], reverse=True)
+        return out[: int(limit)]
+
+    def _uses_numpy(self, project_id: str) -> bool:
+        if self.numpy_index is None:
+            return False
+        return self.numpy_projects is None or project_id in self.numpy_projects
+
+    def _search_project_numpy(
+        self, *, project_id: str, vector: np.ndarray, limit: int, project_size: int
+    ) -> list[tuple[int, float]]:
+        # An open matrix that matches the committed row count is searched without the writer
+        # lock. Anything else (first open, or a write between our count and the mirror
+        # update) is settled under the writer lock, where the mirror and the DB agree.
+        hits = self.numpy_index.search_open(
+            project_id=project_id, vector=vector, limit=limit, expected_count=project_size
+        )
+        if hits is not None:
+            return hits
+        with self._write_lock:
+            return self._search_project_numpy_locked(project_id=project_id, vector=vector, limit=limit)
+
+    def _search_project_numpy_locked(
+        self, *, project_id: str, vector: np.ndarray, limit: int
+    ) -> list[tuple[int, float]]:
+        # The matrix is a derived cache: (re)build it from image_vectors when the files on
+        # disk can't be trusted (missing, dirty, or behind the change log, e.g. after a
+        # restore or a crash between DB commit and mirror write) or the row count drifted.
+        opened = self.numpy_index.is_open(project_id=project_id)
+        if (not opened and not self._numpy_file_current(project_id)) or (
+            self.numpy_index.count(project_id=project_id) != self._project_size(project_id=project_id, conn=self.conn)
+        ):
+            rows = self.conn.execute(
+                """
+                SELECT ids.internal_id, vec.embedding
+                FROM image_ids ids
+                JOIN image_records rec ON rec.internal_id = ids.internal_id
+                JOIN image_vectors vec ON vec.internal_id = ids.internal_id
+                WHERE ids.project_id = ?
+                """,
+                (project_id,),
+            ).fetchall()
+            self.numpy_index.rebuild_project(
+                project_id=project_id,
+                rows=[(int(rowid), decode_vector(blob, dim=self.vector_dim)) for rowid, blob in rows],
+                seq=self._change_seq(),
+            )
+        return self.numpy_index.search(project_id=project_id, vector=vector, limit=limit)
 
-        vec = vector.astype(np.float32, copy=False)
-        if vec.ndim != 1 or vec.shape[0] != self.vector_dim:
-            raise ValueError(f"Unexpected vector shape: {tuple(vec.shape)}")
+    def _numpy_file_current(self, project_id: str) -> bool:
+        """Whether the project's NumPy files on disk hold exactly its stored vectors.
 
-        query_blob = vec.tobytes()
+        Same rule as the HNSW manifest: the files' seq must still be covered by the
+        vector_changes log, and no change since then may touch one of the project's rowids
+        (the file's rows, including since-deleted ones, or the project's rows in the DB).
+        """
+        seq = self.numpy_index.synced_seq(project_id=project_id)
+        if seq is None or self.numpy_index.count(project_id=project_id) is None:
+            return False
+        row = self.conn.execute("SELECT MIN(seq) FROM vector_changes").fetchone()
+        current = self._change_seq()
+        pruned = current if not row or row[0] is None else int(row[0]) - 1
+        if not pruned <= seq <= current:
+            return False
+        if seq < current:
+            changed = {
+                int(r[0])
+                for r in self.conn.execute("SELECT DISTINCT internal_id FROM vector_changes WHERE seq > ?", (seq,))
+            }
+            ours = self.numpy_index.rowids(project_id=project_id)
+            ours.update(
+                int(r[0])
+                for r in self.conn.execute("SELECT internal_id FROM image_ids WHERE project_id = ?", (project_id,))
+            )
+            if changed & ours:
+                return False
+            self.numpy_index.mark_synced(project_ids=[project_id], seq=current)
+        return True
+
+    def _project_size(self, *, project_id: str, conn: sqlite3.Connection | None = None) -> int:
         sql = """
-            SELECT ids.project_id, ids.image_id, rec.r2_key, rec.content_type, rec.original_filename, rec.size_bytes, v.distance
-            FROM v_images v
-            JOIN image_ids ids ON v.rowid = ids.internal_id
+            SELECT COUNT(*)
+            FROM image_ids ids
             JOIN image_records rec ON rec.internal_id = ids.internal_id
-            WHERE ids.project_id = ? AND knn_search(v.embedding, knn_param(?, ?))
+            JOIN image_vectors vec ON vec.internal_id = ids.internal_id
+            WHERE ids.project_id = ?
         """
-        rows = self.conn.execute(sql, (project_id, query_blob, int(limit))).fetchall()
-
-        out: list[tuple[ImageRecord, float]] = []
-        for project_id_s, image_id, r2_key, content_type, original_filename, size_bytes, distance in rows:
-            record = ImageRecord(
-                project_id=str(project_id_s),
-                id=str(image_id),
-                r2_key=str(r2_key),
-                content_type=str(content_type),
-                original_filename=(None if original_filename is None else str(original_filename)),
-                size_bytes=int(size_bytes),
-            )
+        if conn is not None:
+            row = conn.execute(sql, (project_id,)).fetchone()
+        else:
+            with self._reader() as reader:
+                row = reader.execute(sql, (project_id,)).fetchone()
+        return int(row[0] if row else 0)
+
+    @_locked
+    def _search_project_hnsw(
+        self, *, project_id: str, vector: np.ndarray, limit: int, ef: int | None = None
+    ) -> list[tuple[int, float]]:
+        # The HNSW graph lives in the writer connection (vectorlite keeps it per connection;
+        # a reader-side copy would double the memory and go stale), so these searches hold
+        # the writer lock. Filtered traversal: vectorlite only admits rowids from the
+        # IN-subquery while walking the graph, so other projects never crowd out our hits.
+        ef = self.ef_search if ef is None else self._clamp_ef(ef)
+        if ef is None:
+            knn = "knn_param(?, ?)"
+            params: tuple = (vector.tobytes(), int(limit), project_id)
+        else:
+            # hnswlib never searches narrower than k, so ef below limit is a no-op.
+            knn = "knn_param(?, ?, ?)"
+            params = (vector.tobytes(), int(limit), max(int(ef), int(limit)), project_id)
+        sql = f"""
+            SELECT v.rowid, v.distance
+            FROM {self._vtable} v
+            WHERE knn_search(v.embedding, {knn})
+              AND v.rowid IN (SELECT internal_id FROM image_ids WHERE project_id = ?)
+        """
+        rows = self.conn.execute(sql, params).fetchall()
+
+        out: list[tuple[int, float]] = []
+        for rowid, distance in rows:
             try:
                 sim = 1.0 - float(distance)
             except Exception:
                 sim = float(distance)
-            out.append((record, sim))
+            out.append((int(rowid), sim))
+        return out
+
+    def _search_project_exact(self, *, project_id: str, vector: np.ndarray, limit: int) -> list[tuple[int, float]]:
+        return self._search_project_exact_many(project_id=project_id, vectors=[vector], limit=limit)[0]
 
-        out.sort(key=lambda x: x[1], reverse=True)
+    def _search_project_exact_many(
+        self, *, project_id: str, vectors: list[np.ndarray], limit: int
+    ) -> list[list[tuple[int, float]]]:
+        with self._reader() as conn:
+            rows = conn.execute(
+                """
+                SELECT ids.internal_id, vec.embedding
+                FROM image_ids ids
+                JOIN image_records rec ON rec.internal_id = ids.internal_id
+                JOIN image_vectors vec ON vec.internal_id = ids.internal_id
+                WHERE ids.project_id = ?
+                """,
+                (project_id,),
+            ).fetchall()
+        if not rows or limit <= 0:
+            return [[] for _ in vectors]
+
+        rowids = [int(r[0]) for r in rows]
+        matrix = decode_matrix([r[1] for r in rows], dim=self.vector_dim)
+        queries = np.stack([_normalize(v) for v in vectors], axis=1)
+        sims = (matrix @ queries) / (np.linalg.norm(matrix, axis=1) + 1e-8)[:, None]
+
+        k = min(int(limit), len(rows))
+        out: list[list[tuple[int, float]]] = []
+        for col in sims.T:
+            top = np.argpartition(-col, k - 1)[:k]
+            top = top[np.argsort(-col[top])]
+            out.append([(rowids[i], float(col[i])) for i in top])
+        return out
+
+    def _records_for_rowids(self, rowids: list[int]) -> dict[int, ImageRecord]:
+        if not rowids:
+            return {}
+        placeholders = ",".join("?" for _ in rowids)
+        with self._reader() as conn:
+            rows = conn.execute(
+                f"""
+                SELECT ids.internal_id, ids.project_id, ids.image_id, rec.r2_key, rec.content_type, rec.original_filename,
+                       rec.size_bytes, rec.sha256
+                FROM image_ids ids
+                JOIN image_records rec ON rec.internal_id = ids.internal_id
+                WHERE ids.internal_id IN ({placeholders})
+                """,
+                tuple(rowids),
+            ).fetchall()
+
+        return {int(row[0]): _record_from_row(row[1:]) for row in rows}
+
+    def find_records_by_sha256(self, *, project_id: str, sha256s: list[str]) -> dict[str, ImageRecord]:
+        """Existing records of the project per content hash (first stored wins on duplicates)."""
+        if not sha256s:
+            return {}
+        placeholders = ",".join("?" for _ in sha256s)
+        with self._reader() as conn:
+            rows = conn.execute(
+                f"""
+                SELECT ids.project_id, ids.image_id, rec.r2_key, rec.content_type, rec.original_filename,
+                       rec.size_bytes, rec.sha256
+                FROM image_records rec
+                JOIN image_ids ids ON ids.internal_id = rec.internal_id
+                WHERE rec.sha256 IN ({placeholders}) AND ids.project_id = ?
+                ORDER BY rec.internal_id
+                """,
+                (*sha256s, project_id),
+            ).fetchall()
+        out: dict[str, ImageRecord] = {}
+        for row in rows:
+            out.setdefault(str(row[6]), _record_from_row(row))
+        return out
+
+    def get_vector(self, *, project_id: str, image_id: str) -> np.ndarray | None:
+        """The stored embedding of one image (decoded to float32), or None if it doesn't exist."""
+        with self._reader() as conn:
+            row = conn.execute(
+                """
+                SELECT vec.embedding
+                FROM image_ids ids
+                JOIN image_vectors vec ON vec.internal_id = ids.internal_id
+                WHERE ids.project_id = ? AND ids.image_id = ?
+                """,
+                (project_id, image_id),
+            ).fetchone()
+        return None if row is None else decode_vector(row[0], dim=self.vector_dim)
+
+    def vectors_by_sha256(self, sha256s: list[str]) -> dict[str, np.ndarray]:
+        """A stored embedding per content hash, from any project (reused instead of re-embedding)."""
+        if not sha256s:
+            return {}
+        placeholders = ",".join("?" for _ in sha256s)
+        with self._reader() as conn:
+            rows = conn.execute(
+                f"""
+                SELECT rec.sha256, vec.embedding
+                FROM image_records rec
+                JOIN image_vectors vec ON vec.internal_id = rec.internal_id
+                WHERE rec.sha256 IN ({placeholders})
+                """,
+                tuple(sha256s),
+            ).fetchall()
+        out: dict[str, np.ndarray] = {}
+        for sha256, blob in rows:
+            if str(sha256) not in out:
+                out[str(sha256)] = decode_vector(blob, dim=self.vector_dim)
         return out
 
     def ids(self) -> list[str]:
-        rows = self.conn.execute("SELECT image_id FROM image_ids").fetchall()
+        with self._reader() as conn:
+            rows = conn.execute("SELECT image_id FROM image_ids").fetchall()
         return [str(r[0]) for r in rows]
 
+    @_locked
     def ensure_project(self, *, project_id: str) -> None:
         self.conn.execute("INSERT OR IGNORE INTO projects(project_id) VALUES (?)", (project_id,))
 
     def project_exists(self, *, project_id: str) -> bool:
-        row = self.conn.execute("SELECT 1 FROM projects WHERE project_id = ?", (project_id,)).fetchone()
+        with self._reader() as conn:
+            row = conn.execute("SELECT 1 FROM projects WHERE project_id = ?", (project_id,)).fetchone()
         return row is not None
 
-    def close(self) -> None:
-        try:
-            self.conn.close()
-        except Exception:
-            pass
+    @_locked
+    def delete_project(self, *, project_id: str) -> int | None:
+        """Drop a project and all its images in one transaction; returns the image count.
 
-    def backup_to_path(self, *, dest_path: Path) -> None:
-        """Write a consistent SQLite snapshot to dest_path."""
-        # Ensure pending transactions are flushed.
-        try:
-            self.conn.commit()
-        except Exception:
-            pass
+        The images' R2 keys are queued in r2_purge_queue by the same transaction (see
+        purge_batch), except keys another project's records still point at. Returns None
+        when the project doesn't exist.
+        """
+        with self.conn:
+            if self.conn.execute("SELECT 1 FROM projects WHERE project_id = ?", (project_id,)).fetchone() is None:
+                return None
+            self.conn.execute(
+                """
+                INSERT INTO r2_purge_queue(project_id, r2_key)
+                SELECT ids.project_id, r.r2_key
+                FROM image_ids ids
+                JOIN image_records r ON r.internal_id = ids.internal_id
+                WHERE ids.project_id = ? AND r.r2_key != ''
+                  AND NOT EXISTS (
+                      SELECT 1
+                      FROM image_records other
+                      JOIN image_ids other_ids ON other_ids.internal_id = other.internal_id
+                      WHERE other.r2_key = r.r2_key AND other_ids.project_id != ids.project_id
+                  )
+                ORDER BY ids.internal_id
+                """,
+                (project_id,),
+            )
+            rowids = [
+                int(r[0])
+                for r in self.conn.execute(
+                    "SELECT internal_id FROM image_ids WHERE project_id = ? ORDER BY internal_id", (project_id,)
+                )
+            ]
+            for i in range(0, len(rowids), self.rebuild_chunk_size):
+                chunk = rowids[i : i + self.rebuild_chunk_size]
+                placeholders = ",".join("?" for _ in chunk)
+                self._index_remove(chunk)
+                self.conn.execute(f"DELETE FROM image_vectors WHERE internal_id IN ({placeholders})", tuple(chunk))
+                self.conn.execute(f"DELETE FROM image_records WHERE internal_id IN ({placeholders})", tuple(chunk))
+            self.conn.execute("DELETE FROM image_ids WHERE project_id = ?", (project_id,))
+            self.conn.execute("DELETE FROM projects WHERE project_id = ?", (project_id,))
+
+        if self.numpy_index is not None:
+            self.numpy_index.drop_project(project_id=project_id)
+        return len(rowids)
+
+    def purge_batch(self, *, limit: int = 1000) -> list[tuple[int, str]]:
+        """Oldest queued (id, r2_key) pairs of deleted projects, least-retried first."""
+        with self._reader() as conn:
+            rows = conn.execute(
+                "SELECT id, r2_key FROM r2_purge_queue ORDER BY attempts, id LIMIT ?", (int(limit),)
+            ).fetchall()
+        return [(int(row[0]), str(row[1])) for row in rows]
+
+    @_locked
+    def purge_done(self, *, purged: list[int], failed: list[int]) -> None:
+        with self.conn:
+            self.conn.executemany("DELETE FROM r2_purge_queue WHERE id = ?", [(i,) for i in purged])
+            self.conn.executemany("UPDATE r2_purge_queue SET attempts = attempts + 1 WHERE id = ?", [(i,) for i in failed])
+
+    def r2_keys_in_use(self, r2_keys: list[str]) -> set[str]:
+        """The subset of `r2_keys` that some image record still points at."""
+        out: set[str] = set()
+        with self._reader() as conn:
+            for i in range(0, len(r2_keys), 500):
+                chunk = r2_keys[i : i + 500]
+                placeholders = ",".join("?" for _ in chunk)
+                rows = conn.execute(
+                    f"SELECT DISTINCT r2_key FROM image_records WHERE r2_key IN ({placeholders})", tuple(chunk)
+                ).fetchall()
+                out.update(str(row[0]) for row in rows)
+        return out
 
+    def purge_pending(self, *, project_id: str | None = None) -> int:
+        with self._reader() as conn:
+            if project_id is None:
+                row = conn.execute("SELECT COUNT(*) FROM r2_purge_queue").fetchone()
+            else:
+                row = conn.execute(
+                    "SELECT COUNT(*) FROM r2_purge_queue WHERE project_id = ?", (project_id,)
+                ).fetchone()
+        return int(row[0]) if row else 0
+
+    def close(self) -> None:
+        if self.numpy_index is not None:
+            self.numpy_index.close()
+        for conn in self._reader_conns:
+            try:
+                conn.close()
+            except Exception:
+                pass
+        self._reader_conns = []
+
+        with self._write_lock:
+            # Closing the writer makes vectorlite save the graph; bless it with a manifest only
+            # when it is complete, otherwise make sure the next start doesn't trust the file.
+            persist = False
+            try:
+                if self.index_file and not self.rebuilding and not self.swapping:
+                    seq = self._change_seq()
+                    persist = self._index_elements == self._vector_count()
+            except Exception:
+                persist = False
+            try:
+                self.conn.close()
+            except Exception:
+                pass
+            if persist:
+                try:
+                    self._write_index_manifest(seq=seq, vector_count=self._index_elements)
+                    return
+                except Exception as exc:
+                    print(f"WARNING: failed to write image search index manifest: error={exc!r}")
+            self._discard_index_file(self._vtable)
+
+    def change_counter(self) -> int:
+        """Rows changed through the writer since startup (backups skip when unchanged)."""
+        return self._closed_changes + int(self.conn.total_changes)
+
+    def backup_to_path(self, *, dest_path: Path, compact: bool = True) -> None:
+        """Write a consistent SQLite snapshot to dest_path.
+
+        With compact=False the snapshot is a page-for-page copy of the live DB, which is
+        what page-delta replication needs.
+        """
         dest_path.parent.mkdir(parents=True, exist_ok=True)
+
+        # Runs on a read connection: the snapshot is the last committed state and does not
+        # block writers or searches.
+        # VACUUM INTO writes a compacted copy (free pages left behind by deletes or a codec
+        # change are dropped); fall back to the online backup API if it isn't available.
+        if compact and (not dest_path.exists() or dest_path.stat().st_size == 0):
+            try:
+                with self._reader() as conn:
+                    conn.execute("VACUUM INTO ?", (str(dest_path),))
+                return
+            except sqlite3.Error:
+                dest_path.unlink(missing_ok=True)
+
         dest_conn = sqlite3.connect(str(dest_path), check_same_thread=False)
         try:
-            with dest_conn:
-                self.conn.backup(dest_conn)
+            with dest_conn, self._reader() as conn:
+                conn.backup(dest_conn)
         finally:
             try:
                 dest_conn.close()
@@ -2,6 +2,7 @@ from __future__ import annotations
 
 from contextlib import asynccontextmanager
 
+import json
 import os
 import tempfile
 from functools import partial
@@ -28,6 +29,121 @@ def _env_int(name: str, default: str) -> int:
         return int(default)
 
 
+def _image_search_backup_mode() -> str:
+    mode = (os.getenv("IMAGE_SEARCH_DB_BACKUP_MODE") or "snapshot").strip().lower()
+    return mode if mode in {"snapshot", "incremental"} else "snapshot"
+
+
+def _image_search_shard_count() -> int:
+    return max(1, _env_int("IMAGE_SEARCH_SHARDS", "1"))
+
+
+def _image_search_layout(app: FastAPI) -> list[tuple[Path, str]]:
+    # (local DB path, R2 key) per shard; a single shard keeps the unsharded names.
+    layout = getattr(app.state, "image_search_shards", None)
+    if layout:
+        return layout
+
+    from app.domains.image_search.model import resolve_db_path_from_env, resolve_project_root
+    from app.domains.image_search.sharding import shard_db_path, shard_name
+
+    db_path = getattr(app.state, "image_search_db_path", None)
+    if not isinstance(db_path, Path):
+        db_path = resolve_db_path_from_env(project_root=resolve_project_root())
+    r2_key = getattr(app.state, "image_search_db_r2_key", None) or (os.getenv("IMAGE_SEARCH_DB_R2_KEY") or "").strip()
+    if not r2_key:
+        r2_key = "image_search.db"
+    shards = _image_search_shard_count()
+    return [(shard_db_path(db_path, i, shards), shard_name(r2_key, i, shards)) for i in range(shards)]
+
+
+def _image_search_replica(app: FastAPI, *, r2_key: str, db_path: Path, shard: int = 0):
+    from app.domains.image_search.replication import R2PageReplica
+
+    prefix = (os.getenv("IMAGE_SEARCH_DB_REPLICA_PREFIX") or "").strip()
+    if not prefix:
+        prefix = f"{r2_key}.replica/"
+    elif _image_search_shard_count() > 1:
+        prefix = f"{prefix.rstrip('/')}/shard-{shard}/"
+    return R2PageReplica(
+        r2=app.state.r2,
+        prefix=prefix,
+        state_dir=db_path.with_name(f"{db_path.name}.replica"),
+        compact_every=max(1, _env_int("IMAGE_SEARCH_DB_REPLICA_COMPACT_EVERY", "360")),
+    )
+
+
+def _image_search_index_r2_keys(r2_key: str) -> tuple[str, str]:
+    # Persisted HNSW graph + its manifest, uploaded next to the DB snapshot.
+    return f"{r2_key}.hnsw", f"{r2_key}.hnsw.json"
+
+
+async def _image_search_restore_index_from_r2(app: FastAPI, *, r2_key: str, db_path: Path) -> None:
+    # Best-effort: without an index file the HNSW is rebuilt from image_vectors. The file is
+    # only trusted after the index validates it against the manifest and the restored DB.
+    if not _env_truthy("IMAGE_SEARCH_HNSW_PERSIST", "1"):
+        return
+
+    from app.domains.image_search.vectordb import VectorliteVectorIndex, index_file_path, index_manifest_path
+
+    r2 = app.state.r2
+    file_key, manifest_key = _image_search_index_r2_keys(r2_key)
+    try:
+        raw = await anyio.to_thread.run_sync(partial(r2.download_bytes, key=manifest_key))
+        table = str(json.loads(raw)["table"])
+    except Exception:
+        return
+    if table not in VectorliteVectorIndex.VIRTUAL_TABLES:
+        return
+
+    index_path = index_file_path(db_path, table)
+    tmp_path = index_path.with_name(f"{index_path.name}.download")
+    try:
+        await anyio.to_thread.run_sync(partial(r2.download_file, key=file_key, path=str(tmp_path)))
+        tmp_path.replace(index_path)
+        index_manifest_path(index_path).write_bytes(raw)
+    except Exception as exc:
+        tmp_path.unlink(missing_ok=True)
+        print(f"WARNING: Failed to restore image search index file: error={exc!r}")
+        return
+    print(f"Restored image search index file from R2: key={file_key} -> {index_path}")
+
+
+async def _image_search_upload_index_to_r2(app: FastAPI) -> None:
+    if getattr(app.state, "r2", None) is None:
+        return
+    for shard, (db_path, r2_key) in enumerate(_image_search_layout(app)):
+        try:
+            await _image_search_upload_shard_index_to_r2(app, shard=shard, r2_key=r2_key, db_path=db_path)
+        except Exception as exc:
+            print(f"WARNING: Failed to back up image search index file: key={r2_key} error={exc!r}")
+
+
+async def _image_search_upload_shard_index_to_r2(app: FastAPI, *, shard: int, r2_key: str, db_path: Path) -> None:
+    from app.domains.image_search.vectordb import persisted_index_files
+
+    r2 = app.state.r2
+    files = persisted_index_files(db_path)
+    if files is None:
+        return
+    index_path, manifest_path = files
+    manifest = manifest_path.read_bytes()
+    uploaded = getattr(app.state, "image_search_index_uploaded", None)
+    if not isinstance(uploaded, dict):
+        uploaded = app.state.image_search_index_uploaded = {}
+    if manifest == uploaded.get(shard):
+        return
+
+    # Manifest last: a restore that sees the new manifest also gets the file it describes.
+    file_key, manifest_key = _image_search_index_r2_keys(r2_key)
+    await anyio.to_thread.run_sync(partial(r2.upload_file, path=str(index_path), key=file_key))
+    await anyio.to_thread.run_sync(
+        partial(r2.upload_bytes, key=manifest_key, data=manifest, content_type="application/json")
+    )
+    uploaded[shard] = manifest
+    print(f"Backed up image search index file to R2: {index_path} -> key={file_key}")
+
+
 async def _image_search_restore_db_from_r2(app: FastAPI) -> None:
     r2 = getattr(app.state, "r2", None)
     if r2 is None:
@@ -44,6 +160,15 @@ async def _image_search_restore_db_from_r2(app: FastAPI) -> None:
 
     app.state.image_search_db_path = db_path
     app.state.image_search_db_r2_key = r2_key
+    app.state.image_search_shards = _image_search_layout(app)
+
+    # Shards restore independently; each one is only downloaded when its local file is missing.
+    for shard, (shard_path, shard_key) in enumerate(app.state.image_search_shards):
+        await _image_search_restore_shard_from_r2(app, shard=shard, r2_key=shard_key, db_path=shard_path)
+
+
+async def _image_search_restore_shard_from_r2(app: FastAPI, *, shard: int, r2_key: str, db_path: Path) -> None:
+    r2 = app.state.r2
 
     # Only download when the local DB does not exist.
     if db_path.exists() and db_path.stat().st_size > 0:
@@ -51,6 +176,27 @@ async def _image_search_restore_db_from_r2(app: FastAPI) -> None:
 
     db_path.parent.mkdir(parents=True, exist_ok=True)
 
+    # A WAL/shm left behind by a deleted DB must not be replayed onto the restored file.
+    for suffix in ("-wal", "-shm"):
+        Path(f"{db_path}{suffix}").unlink(missing_ok=True)
+
+    if _image_search_backup_mode() == "incremental":
+        # Replay base snapshot + page deltas; fall back to the full snapshot key if there is no replica.
+        replica = _image_search_replica(app, r2_key=r2_key, db_path=db_path, shard=shard)
+        replica.reset()
+        try:
+            result = await anyio.to_thread.run_sync(partial(replica.restore, db_path))
+        except Exception as exc:
+            print(f"WARNING: Failed to restore image search DB replica: error={exc!r}")
+            result = None
+        if result is not None:
+            print(
+                f"Restored image search DB from R2 replica: generation={result['generation']} "
+                f"deltas={result['seq']} complete={result['complete']} -> {db_path}"
+            )
+            await _image_search_restore_index_from_r2(app, r2_key=r2_key, db_path=db_path)
+            return
+
     # Download to a temp file first, then atomically replace.
     with tempfile.NamedTemporaryFile(suffix=".db", delete=False) as tmp:
         tmp_path = tmp.name
@@ -67,6 +213,7 @@ async def _image_search_restore_db_from_r2(app: FastAPI) -> None:
 
     await anyio.to_thread.run_sync(partial(Path(tmp_path).replace, db_path))
     print(f"Restored image search DB from R2: key={r2_key} -> {db_path}")
+    await _image_search_restore_index_from_r2(app, r2_key=r2_key, db_path=db_path)
 
 
 async def _image_search_backup_db_to_r2(app: FastAPI) -> None:
@@ -78,25 +225,52 @@ async def _image_search_backup_db_to_r2(app: FastAPI) -> None:
     if state is None:
         return
 
-    r2_key = getattr(app.state, "image_search_db_r2_key", None) or (os.getenv("IMAGE_SEARCH_DB_R2_KEY") or "").strip()
-    if not r2_key:
-        r2_key = "image_search.db"
+    # Shards back up independently: a failing shard doesn't hold back the others.
+    errors: list[Exception] = []
+    for shard, (db_path, r2_key) in enumerate(_image_search_layout(app)):
+        try:
+            await _image_search_backup_shard_to_r2(app, shard=shard, r2_key=r2_key, db_path=db_path)
+        except Exception as exc:
+            errors.append(exc)
+    if errors:
+        raise errors[0]
 
-    db_path = getattr(app.state, "image_search_db_path", None)
-    if not isinstance(db_path, Path):
-        from app.domains.image_search.model import resolve_db_path_from_env, resolve_project_root
 
-        db_path = resolve_db_path_from_env(project_root=resolve_project_root())
+async def _image_search_backup_shard_to_r2(app: FastAPI, *, shard: int, r2_key: str, db_path: Path) -> None:
+    r2 = app.state.r2
+    state = app.state.image_search
+    index = state.db.index(shard)
+    backed_up = getattr(app.state, "image_search_backup_changes", None)
+    if not isinstance(backed_up, dict):
+        backed_up = app.state.image_search_backup_changes = {}
+
+    # Nothing written since the last successful backup: skip the snapshot and upload.
+    if index.change_counter() == backed_up.get(shard):
+        return
+
+    incremental = _image_search_backup_mode() == "incremental"
 
     # Snapshot to temp file to avoid uploading a partially-written DB.
     with tempfile.NamedTemporaryFile(suffix=".db", delete=False) as tmp:
         snapshot_path = Path(tmp.name)
 
     try:
-        async with state.lock:
-            await anyio.to_thread.run_sync(partial(state.vector_index.backup_to_path, dest_path=snapshot_path))
-        await anyio.to_thread.run_sync(partial(r2.upload_file, path=str(snapshot_path), key=r2_key))
-        print(f"Backed up image search DB to R2: {snapshot_path} -> key={r2_key}")
+        # The snapshot is taken on a read connection, so it doesn't need the writer lock.
+        changes = index.change_counter()
+        await state.db.backup_to_path(dest_path=snapshot_path, compact=not incremental, shard=shard)
+        if incremental:
+            replica = _image_search_replica(app, r2_key=r2_key, db_path=db_path, shard=shard)
+            result = await anyio.to_thread.run_sync(partial(replica.sync, snapshot_path))
+            if result["kind"] != "noop":
+                print(
+                    f"Replicated image search DB to R2: key={r2_key} kind={result['kind']} "
+                    f"generation={result['generation']} seq={result['seq']} pages={result['pages']} "
+                    f"bytes={result['bytes']}"
+                )
+        else:
+            await anyio.to_thread.run_sync(partial(r2.upload_file, path=str(snapshot_path), key=r2_key))
+            print(f"Backed up image search DB to R2: {snapshot_path} -> key={r2_key}")
+        backed_up[shard] = changes
     finally:
         try:
             snapshot_path.unlink(missing_ok=True)
@@ -105,9 +279,15 @@ async def _image_search_backup_db_to_r2(app: FastAPI) -> None:
 
 
 async def _image_search_periodic_backup_task(app: FastAPI) -> None:
-    interval = _env_int("IMAGE_SEARCH_DB_BACKUP_INTERVAL_SECONDS", "1800")
-    if interval < 60:
-        interval = 60
+    if _image_search_backup_mode() == "incremental":
+        # Page deltas are small, so replicate often (minute-level RPO).
+        interval = _env_int("IMAGE_SEARCH_DB_REPLICA_INTERVAL_SECONDS", "60")
+        if interval < 10:
+            interval = 10
+    else:
+        interval = _env_int("IMAGE_SEARCH_DB_BACKUP_INTERVAL_SECONDS", "1800")
+        if interval < 60:
+            interval = 60
     while True:
         await anyio.sleep(float(interval))
         try:
@@ -117,6 +297,224 @@ async def _image_search_periodic_backup_task(app: FastAPI) -> None:
             pass
 
 
+async def _image_search_index_persist_task(app: FastAPI) -> None:
+    # Save the HNSW graph to its index file (and R2) so a restart only replays the writes
+    # made since, instead of rebuilding the whole index.
+    interval = _env_int("IMAGE_SEARCH_HNSW_PERSIST_INTERVAL_SECONDS", "1800")
+    if interval < 60:
+        interval = 60
+    while True:
+        await anyio.sleep(float(interval))
+        state = getattr(app.state, "image_search", None)
+        if state is None:
+            continue
+        try:
+            persisted = False
+            for shard in range(state.db.shard_count):
+                async with state.shard_locks[shard]:
+                    manifest = await state.db.write("persist_index", state.db.index(shard).persist_index, shard=shard)
+                persisted = persisted or manifest is not None
+            if not persisted:
+                continue
+            if _env_truthy("IMAGE_SEARCH_DB_BACKUP_ENABLED", "1"):
+                await _image_search_upload_index_to_r2(app)
+        except Exception as exc:
+            print(f"WARNING: Failed to persist image search index: error={exc!r}")
+
+
+async def _image_search_r2_purge_task(app: FastAPI) -> None:
+    # Remove the R2 objects of deleted projects, queued in each shard's DB. Woken right
+    # after a project delete; keys that failed are retried every interval.
+    interval = _env_int("IMAGE_SEARCH_R2_PURGE_INTERVAL_SECONDS", "60")
+    if interval < 1:
+        interval = 1
+    while True:
+        state = getattr(app.state, "image_search", None)
+        if state is None:
+            await anyio.sleep(float(interval))
+            continue
+        for shard in range(state.db.shard_count):
+            try:
+                await _image_search_purge_shard(app, shard)
+            except Exception as exc:
+                print(f"WARNING: Failed to purge deleted image search objects from R2: error={exc!r}")
+        with anyio.move_on_after(float(interval)):
+            await state.purge_event.wait()
+        state.purge_event.clear()
+
+
+async def _image_search_purge_shard(app: FastAPI, shard: int) -> None:
+    state = app.state.image_search
+    r2 = app.state.r2
+    stats = state.purge_stats
+    while True:
+        batch = await state.db.purge_batch(shard=shard, limit=1000)
+        if not batch:
+            return
+        # A key that a live record (on any shard) points at again is only dropped from the
+        # queue, never deleted from R2.
+        in_use = await state.db.r2_keys_in_use(r2_keys=sorted({key for _, key in batch}))
+        keys = sorted({key for _, key in batch if key not in in_use})
+        failed_keys = set(await anyio.to_thread.run_sync(partial(r2.delete_many, keys=keys))) if keys else set()
+        purged = [i for i, key in batch if key not in failed_keys]
+        failed = [i for i, key in batch if key in failed_keys]
+        await state.db.purge_done(shard=shard, purged=purged, failed=failed)
+        stats["purged"] += len(purged)
+        stats["failed"] += len(failed)
+        pending = await state.db.purge_pending()
+        print(
+            f"Purged deleted image search objects from R2: purged={len(purged)} failed={len(failed)} "
+            f"pending={pending}"
+        )
+        if failed:
+            # Leave the rest of this round to the next interval rather than hammering R2.
+            return
+
+
+async def _image_search_warm_text_cache_task(app: FastAPI) -> None:
+    # Load the most used query embeddings into memory; queries only known under another
+    # model (after a model change) are embedded now rather than on the first search.
+    state = getattr(app.state, "image_search", None)
+    cache = getattr(state, "text_cache", None)
+    if cache is None:
+        return
+    warm = _env_int("IMAGE_SEARCH_TEXT_CACHE_WARM", "1000")
+    if warm <= 0:
+        return
+
+    from app.domains.image_search.model import IMAGE_SEARCH_KEY
+
+    model_name = str(getattr(state.embedder, "model_name", ""))
+    try:
+        missing = await anyio.to_thread.run_sync(partial(cache.warm, model_name=model_name, limit=warm))
+    except Exception as exc:
+        print(f"WARNING: Failed to warm image search text cache: error={exc!r}")
+        return
+    print(f"Warmed image search text cache: entries={cache.stats()['entries']} to_embed={len(missing)}")
+
+    embedded = 0
+    try:
+        for text in missing:
+            # One query per semaphore hold, so live searches interleave.
+            async with app.state.limits.get(IMAGE_SEARCH_KEY).semaphore:
+                vec = await anyio.to_thread.run_sync(state.embedder.embed_text, text)
+            await anyio.to_thread.run_sync(partial(cache.put, model_name=model_name, text=text, vector=vec))
+            embedded += 1
+    except Exception as exc:
+        print(f"WARNING: Failed to embed warm-up queries: error={exc!r}")
+    if embedded:
+        print(f"Embedded {embedded} warm-up queries for {model_name}")
+
+
+async def _image_search_run_index_steps(app: FastAPI, steps, *, label: str, shard: int = 0) -> None:
+    # Step through a chunked index build one chunk at a time, holding the shard's lock only
+    # per chunk so uploads/deletes interleave with it.
+    state = app.state.image_search
+    lock = state.shard_locks[shard]
+    if state.db.shard_count > 1:
+        label = f"{label} (shard {shard})"
+    last_report = 0.0
+    done = 0
+    try:
+        while True:
+            async with lock:
+                progress = await state.db.step("index_step", steps, shard=shard)
+            if progress is None:
+                break
+            done, total = progress
+            now = anyio.current_time()
+            if now - last_report >= 5.0:
+                last_report = now
+                print(f"{label} image search index: {done}/{total}")
+        print(f"{label} image search index: done ({done} vectors)")
+    except Exception as exc:
+        print(f"WARNING: {label} image search index failed: error={exc!r}")
+    finally:
+        async with lock:
+            await state.db.close_steps("index_step", steps, shard=shard)
+
+
+async def _image_search_rebuild_task(app: FastAPI, shard: int = 0) -> None:
+    state = getattr(app.state, "image_search", None)
+    if state is None or not state.db.index(shard).rebuilding:
+        return
+
+    # Search keeps working (exact scoring) while the index is `rebuilding`.
+    steps = state.db.index(shard).iter_rebuild_vector_index_from_vectors()
+    await _image_search_run_index_steps(app, steps, label="Rebuilding", shard=shard)
+
+
+async def _image_search_index_maintenance_task(app: FastAPI) -> None:
+    interval = _env_int("IMAGE_SEARCH_MAINTENANCE_INTERVAL_SECONDS", "10")
+    if interval < 1:
+        interval = 1
+
+    # One-off: re-encode stored vectors after IMAGE_SEARCH_VECTOR_CODEC changed.
+    state = getattr(app.state, "image_search", None)
+    if state is not None:
+        for shard in range(state.db.shard_count):
+            index = state.db.index(shard)
+            try:
+                async with state.shard_locks[shard]:
+                    needs_recode = await state.db.write("needs_recode", index.needs_recode, shard=shard)
+                if needs_recode:
+                    steps = index.iter_recode_vectors()
+                    label = f"Re-encoding ({index.vector_codec})"
+                    await _image_search_run_index_steps(app, steps, label=label, shard=shard)
+            except Exception:
+                pass
+
+    while True:
+        await anyio.sleep(float(interval))
+        state = getattr(app.state, "image_search", None)
+        if state is None:
+            continue
+        for shard in range(state.db.shard_count):
+            try:
+                await _image_search_maintain_shard(app, shard)
+            except Exception:
+                # Best-effort maintenance.
+                pass
+
+
+async def _image_search_maintain_shard(app: FastAPI, shard: int) -> None:
+    # Every swap rebuild (growth, reshape, compaction) starts from image_vectors, so one
+    # also settles a pending compaction request.
+    state = app.state.image_search
+    index = state.db.index(shard)
+    if index.rebuilding or index.swapping:
+        return
+    if index.needs_growth():
+        print(f"Growing image search index: fill={index.fill_ratio:.2f} max_elements={index.max_elements}")
+        state.compact_requested.discard(shard)
+        await _image_search_run_index_steps(app, index.iter_grow_vector_index(), label="Growing", shard=shard)
+        return
+
+    async with state.shard_locks[shard]:
+        needs_reshape = await state.db.write("needs_reshape", index.needs_reshape, shard=shard)
+    if needs_reshape:
+        print(
+            "Rebuilding image search index with new HNSW params: "
+            f"M={index.hnsw_m} ef_construction={index.hnsw_ef_construction}"
+        )
+        state.compact_requested.discard(shard)
+        steps = index.iter_reshape_vector_index()
+        await _image_search_run_index_steps(app, steps, label="Reshaping", shard=shard)
+        return
+
+    requested = shard in state.compact_requested
+    if not requested:
+        async with state.shard_locks[shard]:
+            requested = await state.db.write("needs_compaction", index.needs_compaction, shard=shard)
+    if requested:
+        print(
+            f"Compacting image search index: tombstones={index.tombstones} "
+            f"ratio={index.tombstone_ratio:.2f} vectors={index.index_elements}"
+        )
+        state.compact_requested.discard(shard)
+        await _image_search_run_index_steps(app, index.iter_compact_vector_index(), label="Compacting", shard=shard)
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     app.state.models = {}
@@ -142,7 +540,7 @@ async def lifespan(app: FastAPI):
 
     # Optional image-search state (enabled by default).
     app.state.image_search = None
-    app.state.image_search_backup_tg = None
+    app.state.image_search_tg = None
     try:
         from app.domains.image_search.model import IMAGE_SEARCH_KEY, create_state_from_env, enabled_from_env
 
@@ -156,12 +554,22 @@ async def lifespan(app: FastAPI):
             app.state.limits.register(IMAGE_SEARCH_KEY, max_concurrency=1)
             print("Initialized image search")
 
-            # Start periodic DB backups when R2 is available.
-            if getattr(app.state, "r2", None) is not None and _env_truthy("IMAGE_SEARCH_DB_BACKUP_ENABLED", "1"):
-                tg = anyio.create_task_group()
-                await tg.__aenter__()
-                app.state.image_search_backup_tg = tg
-                tg.start_soon(_image_search_periodic_backup_task, app)
+            # Background work: HNSW rebuild (if deferred) and periodic DB backups.
+            tg = anyio.create_task_group()
+            await tg.__aenter__()
+            app.state.image_search_tg = tg
+            for shard in range(image_search_state.db.shard_count):
+                if image_search_state.db.index(shard).rebuilding:
+                    tg.start_soon(_image_search_rebuild_task, app, shard)
+            tg.start_soon(_image_search_index_maintenance_task, app)
+            tg.start_soon(_image_search_index_persist_task, app)
+            tg.start_soon(_image_search_warm_text_cache_task, app)
+
+            # Start periodic DB backups (and the purge of deleted projects' objects) when R2 is available.
+            if getattr(app.state, "r2", None) is not None:
+                tg.start_soon(_image_search_r2_purge_task, app)
+                if _env_truthy("IMAGE_SEARCH_DB_BACKUP_ENABLED", "1"):
+                    tg.start_soon(_image_search_periodic_backup_task, app)
     except Exception as exc:
         # Fail fast if image-search was expected to be enabled.
         try:
@@ -202,7 +610,7 @@ async def lifespan(app: FastAPI):
 
     # Best-effort final backup of image search DB.
     try:
-        tg = getattr(app.state, "image_search_backup_tg", None)
+        tg = getattr(app.state, "image_search_tg", None)
         if tg is not None:
             tg.cancel_scope.cancel()
             await tg.__aexit__(None, None, None)
@@ -216,7 +624,7 @@ async def lifespan(app: FastAPI):
     except Exception:
         pass
 
-    # Best-effort cleanup for image search.
+    # Best-effort cleanup for image search (closing the index also saves its HNSW file).
     image_search_state = getattr(app.state, "image_search", None)
     if image_search_state is not None:
         try:
@@ -224,6 +632,12 @@ async def lifespan(app: FastAPI):
         except Exception:
             pass
 
+        try:
+            if getattr(app.state, "r2", None) is not None and _env_truthy("IMAGE_SEARCH_DB_BACKUP_ENABLED", "1"):
+                await _image_search_upload_index_to_r2(app)
+        except Exception as exc:
+            print(f"WARNING: Failed to back up image search index file: error={exc!r}")
+
     # Best-effort cleanup.
     image_model = app.state.models.get("zimage_turbo")
     if image_model is not None:
@@ -42,13 +42,28 @@ def create_app() -> FastAPI:
         models = getattr(app.state, "models", None)
         zimage_turbo_ready = bool(models and models.get("zimage_turbo"))
         qwen3_tts_ready = bool(models and models.get("qwen3_tts"))
-        image_search_ready = bool(getattr(app.state, "image_search", None))
-        return {
+        image_search = getattr(app.state, "image_search", None)
+        image_search_status = "disabled"
+        if image_search is not None:
+            image_search_status = "rebuilding" if image_search.vector_index.rebuilding else "ready"
+        image_search_ready = image_search_status == "ready"
+        payload = {
             "server_ready": zimage_turbo_ready or qwen3_tts_ready or image_search_ready,
             "zimage_turbo_ready": zimage_turbo_ready,
             "qwen3_tts_ready": qwen3_tts_ready,
             "image_search_ready": image_search_ready,
+            "image_search_status": image_search_status,
         }
+        if image_search_status == "rebuilding":
+            done, total = image_search.vector_index.rebuild_progress
+            payload["image_search_rebuild_progress"] = {"done": done, "total": total}
+        if image_search is not None:
+            # Per-call DB timings (queue wait / run time) from the image search DB executor.
+            payload["image_search_db"] = image_search.db.stats()
+            payload["image_search_cache"] = image_search.search_cache.stats()
+            if image_search.text_cache is not None:
+                payload["image_search_text_cache"] = image_search.text_cache.stats()
+        return payload
 
     return app
 
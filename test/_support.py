@@ -0,0 +1,178 @@
+"""Shared fixtures for the image search test scripts (no GPU, no R2, no network).
+
+Each `test/image_search_*.py` script runs on its own from the repo root:
+
+    python test/image_search_codec.py
+"""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import shutil
+import sys
+import tempfile
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+import numpy as np  # noqa: E402
+
+from app.domains.image_search.vectordb import ImageRecord, VectorliteVectorIndex  # noqa: E402
+
+DIM = 16
+
+
+def unit(v: np.ndarray) -> np.ndarray:
+    v = np.asarray(v, dtype=np.float32)
+    return v / (np.linalg.norm(v, axis=-1, keepdims=True) + 1e-8)
+
+
+def random_vectors(n: int, *, dim: int = DIM, seed: int = 0) -> np.ndarray:
+    return unit(np.random.default_rng(seed).standard_normal((n, dim)).astype(np.float32))
+
+
+def record(project_id: str, image_id: str, *, r2_key: str | None = None, sha256: str | None = None) -> ImageRecord:
+    return ImageRecord(
+        project_id=project_id,
+        id=image_id,
+        r2_key=r2_key or f"AI/SEARCH/{project_id}/{image_id}.jpg",
+        content_type="image/jpeg",
+        original_filename=f"{image_id}.jpg",
+        size_bytes=10,
+        sha256=sha256,
+    )
+
+
+class TempDir:
+    def __init__(self) -> None:
+        self.path = Path(tempfile.mkdtemp(prefix="image_search_test_"))
+
+    def __enter__(self) -> Path:
+        return self.path
+
+    def __exit__(self, *exc) -> None:
+        shutil.rmtree(self.path, ignore_errors=True)
+
+
+def open_index(db_path: Path, **kwargs) -> VectorliteVectorIndex:
+    kwargs.setdefault("vector_dim", DIM)
+    kwargs.setdefault("max_elements", 10000)
+    return VectorliteVectorIndex(db_path=db_path, **kwargs)
+
+
+class FakeEmbedder:
+    """Deterministic stand-in for ClipEmbedder: the vector is a hash of the input."""
+
+    model_name = "fake-clip"
+
+    def __init__(self) -> None:
+        self.calls: list[tuple[str, int]] = []
+
+    def _vec(self, raw: bytes) -> np.ndarray:
+        digest = np.frombuffer(hashlib.sha256(raw).digest() * 2, dtype=np.uint8)[:DIM]
+        return digest.astype(np.float32) - 128.0
+
+    def embed_image_path(self, path: str) -> np.ndarray:
+        return self.embed_image_bytes(Path(path).read_bytes())
+
+    def embed_image_paths(self, paths: list[str], *, batch_size: int = 16) -> np.ndarray:
+        return self.embed_images_bytes([Path(p).read_bytes() for p in paths], batch_size=batch_size)
+
+    def embed_image_bytes(self, raw: bytes) -> np.ndarray:
+        self.calls.append(("image", 1))
+        return self._vec(raw)
+
+    def embed_images_bytes(self, raws: list[bytes], *, batch_size: int = 16) -> np.ndarray:
+        self.calls.append(("images", len(raws)))
+        return np.stack([self._vec(raw) for raw in raws])
+
+    def embed_text(self, text: str) -> np.ndarray:
+        self.calls.append(("text", 1))
+        return self._vec(text.encode("utf-8"))
+
+    def embed_texts(self, texts: list[str], *, batch_size: int = 64) -> np.ndarray:
+        self.calls.append(("texts", len(texts)))
+        return np.stack([self._vec(t.encode("utf-8")) for t in texts])
+
+    def close(self) -> None:
+        pass
+
+
+class FakeR2:
+    """In-memory R2Storage with the methods the image search code uses."""
+
+    def __init__(self) -> None:
+        self.objects: dict[str, bytes] = {}
+        self.fail_keys: set[str] = set()
+
+    def upload_bytes(self, *, key: str, data: bytes, content_type: str | None = None, **_) -> None:
+        self.objects[key] = bytes(data)
+
+    def upload_file(self, *, path: str, key: str) -> None:
+        self.objects[key] = Path(path).read_bytes()
+
+    def download_bytes(self, *, key: str) -> bytes:
+        return self.objects[key]
+
+    def download_file(self, *, key: str, path: str) -> None:
+        Path(path).write_bytes(self.objects[key])
+
+    def copy(self, *, src_key: str, dest_key: str) -> None:
+        if src_key in self.fail_keys or src_key not in self.objects:
+            raise KeyError(src_key)
+        self.objects[dest_key] = self.objects[src_key]
+
+    def delete(self, *, key: str) -> None:
+        self.objects.pop(key, None)
+
+    def delete_many(self, *, keys) -> list[str]:
+        failed = []
+        for key in keys:
+            if key in self.fail_keys:
+                failed.append(key)
+            else:
+                self.objects.pop(key, None)
+        return failed
+
+    def exists(self, *, key: str) -> bool:
+        return key in self.objects
+
+    def list_keys(self, *, prefix: str | None = None, limit: int = 1000) -> list[str]:
+        return [k for k in sorted(self.objects) if not prefix or k.startswith(prefix)][:limit]
+
+    def presigned_get_url(self, *, key: str, expires_in: int = 86400) -> str:
+        return f"https://r2.example/{key}"
+
+
+def make_app(index, *, embedder: FakeEmbedder | None = None, r2: FakeR2 | None = None):
+    """A FastAPI app with only the image search router, wired to `index` and the fakes."""
+    from fastapi import FastAPI
+
+    from app.core.concurrency.limits import ModelSemaphoreRegistry
+    from app.core.errors.handlers import register_exception_handlers
+    from app.domains.image_search.model import IMAGE_SEARCH_KEY, ImageSearchState
+    from app.domains.image_search.router import router
+
+    app = FastAPI()
+    register_exception_handlers(app)
+    app.include_router(router, prefix="/v1")
+    app.state.limits = ModelSemaphoreRegistry()
+    app.state.limits.register(IMAGE_SEARCH_KEY, max_concurrency=1)
+    app.state.r2 = r2 if r2 is not None else FakeR2()
+    app.state.image_search = ImageSearchState(
+        vector_index=index,
+        record_store=index,
+        embedder=embedder if embedder is not None else FakeEmbedder(),
+        lock=asyncio.Lock(),
+    )
+    return app
+
+
+def run(*checks) -> None:
+    """Run each check function in order and report; exits non-zero on the first failure."""
+    for check in checks:
+        check()
+        print(f"ok  {check.__name__}")
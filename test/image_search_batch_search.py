@@ -0,0 +1,86 @@
+"""Multi-query batch search (user-016).
+
+Invariants: each result list equals what a single search for that query returns, in request
+order (repeats included); uncached queries are embedded in one batched call; queries already
+in the result cache are not embedded again; oversize batches and missing projects are rejected.
+"""
+
+from __future__ import annotations
+
+import os
+
+from _support import FakeEmbedder, TempDir, make_app, open_index, random_vectors, record, run, unit
+
+
+def _client(index, embedder):
+    from fastapi.testclient import TestClient
+
+    return TestClient(make_app(index, embedder=embedder))
+
+
+def check_matches_single_searches() -> None:
+    for exact_max in (10000, 0):  # exact matrix scan, then HNSW
+        with TempDir() as tmp:
+            index = open_index(tmp / "db.sqlite", exact_search_max_project_size=exact_max)
+            try:
+                index.upsert_images(
+                    items=[(record("p", f"p-{i}"), v) for i, v in enumerate(random_vectors(300, seed=1))]
+                )
+                queries = ["red poster", "blue sky", "red poster", "cat"]
+                vectors = [unit(FakeEmbedder()._vec(q.encode("utf-8"))) for q in dict.fromkeys(queries)]
+                many = index.search_records_many(project_id="p", vectors=vectors, limit=7)
+                single = [index.search_records(project_id="p", vector=v, limit=7) for v in vectors]
+                ids = [[r.id for r, _ in hits] for hits in many]
+                assert ids == [[r.id for r, _ in hits] for hits in single]
+                for hits, expected in zip(many, single):
+                    assert all(abs(s - e) < 1e-5 for (_, s), (_, e) in zip(hits, expected))
+
+                embedder = FakeEmbedder()
+                body = _client(index, embedder).post(
+                    "/v1/projects/p/images/search:batch", json={"queries": queries, "limit": 7}
+                ).json()
+                got = [[hit["id"] for hit in hits] for hits in body["results"]]
+                assert got == [ids[0], ids[1], ids[0], ids[2]], got
+                assert embedder.calls == [("texts", 3)]
+            finally:
+                index.close()
+
+
+def check_cached_queries_are_not_embedded() -> None:
+    with TempDir() as tmp:
+        index = open_index(tmp / "db.sqlite")
+        embedder = FakeEmbedder()
+        try:
+            client = _client(index, embedder)
+            index.upsert_images(items=[(record("p", f"p-{i}"), v) for i, v in enumerate(random_vectors(20, seed=2))])
+            single = client.post("/v1/projects/p/images/search", json={"query": "cat", "limit": 3}).json()
+            body = client.post("/v1/projects/p/images/search:batch", json={"queries": ["dog", "cat"], "limit": 3})
+            assert body.json()["results"][1] == single["results"]
+            assert embedder.calls == [("text", 1), ("text", 1)]
+        finally:
+            index.close()
+
+
+def check_rejections() -> None:
+    with TempDir() as tmp:
+        index = open_index(tmp / "db.sqlite")
+        os.environ["IMAGE_SEARCH_MAX_BATCH_QUERIES"] = "2"
+        try:
+            client = _client(index, FakeEmbedder())
+            index.upsert_images(items=[(record("p", "p-0"), random_vectors(1, seed=3)[0])])
+            resp = client.post("/v1/projects/p/images/search:batch", json={"queries": ["a", "b", "c"]})
+            assert resp.status_code == 413 and resp.json()["error"]["code"] == "BATCH_TOO_LARGE"
+            assert client.post("/v1/projects/p/images/search:batch", json={"queries": []}).status_code == 422
+            resp = client.post("/v1/projects/missing/images/search:batch", json={"queries": ["a"]})
+            assert resp.status_code == 404
+        finally:
+            del os.environ["IMAGE_SEARCH_MAX_BATCH_QUERIES"]
+            index.close()
+
+
+if __name__ == "__main__":
+    run(
+        check_matches_single_searches,
+        check_cached_queries_are_not_embedded,
+        check_rejections,
+    )
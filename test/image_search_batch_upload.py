@@ -0,0 +1,91 @@
+"""Batch image registration (user-002).
+
+Invariants: one request registers every file with one batched embed call and one DB
+transaction; a bad file or a failed R2 upload leaves nothing behind (no rows, no objects).
+"""
+
+from __future__ import annotations
+
+import os
+
+from _support import FakeEmbedder, FakeR2, TempDir, make_app, open_index, run
+
+
+class FlakyR2(FakeR2):
+    def upload_bytes(self, *, key: str, data: bytes, content_type: str | None = None, **_) -> None:
+        if data.startswith(b"fail"):
+            raise ConnectionError(key)
+        super().upload_bytes(key=key, data=data, content_type=content_type)
+
+
+def _files(*payloads: bytes, content_type: str = "image/jpeg") -> list[tuple[str, tuple[str, bytes, str]]]:
+    return [("files", (f"img{i}.jpg", raw, content_type)) for i, raw in enumerate(payloads)]
+
+
+def _client(index, **kwargs):
+    from fastapi.testclient import TestClient
+
+    return TestClient(make_app(index, **kwargs))
+
+
+def check_batch_registers_everything_at_once() -> None:
+    with TempDir() as tmp:
+        index = open_index(tmp / "db.sqlite")
+        r2, embedder = FakeR2(), FakeEmbedder()
+        try:
+            client = _client(index, r2=r2, embedder=embedder)
+            resp = client.post("/v1/projects/p/images:batch", files=_files(*(b"img-%d" % i for i in range(5))))
+            assert resp.status_code == 200, resp.text
+            images = resp.json()["images"]
+            assert [img["original_filename"] for img in images] == [f"img{i}.jpg" for i in range(5)]
+            assert embedder.calls == [("images", 5)]
+            assert {r.id for r in index.list_records(project_id="p")} == {img["id"] for img in images}
+            assert set(r2.objects) == {img["r2_key"] for img in images}
+            assert all(key.startswith("AI/SEARCH/p/") and key.endswith(".jpg") for key in r2.objects)
+        finally:
+            index.close()
+
+
+def check_bad_file_rejects_the_whole_batch() -> None:
+    with TempDir() as tmp:
+        index = open_index(tmp / "db.sqlite")
+        r2 = FakeR2()
+        try:
+            client = _client(index, r2=r2)
+            files = _files(b"a", b"b") + [("files", ("notes.txt", b"text", "text/plain"))]
+            resp = client.post("/v1/projects/p/images:batch", files=files)
+            assert resp.status_code == 400 and resp.json()["error"]["code"] == "INVALID_IMAGE"
+            resp = client.post("/v1/projects/p/images:batch", files=_files(b"a", b""))
+            assert resp.status_code == 400 and resp.json()["error"]["code"] == "EMPTY_FILE"
+
+            os.environ["IMAGE_SEARCH_MAX_BATCH_FILES"] = "2"
+            try:
+                resp = client.post("/v1/projects/p/images:batch", files=_files(b"a", b"b", b"c"))
+                assert resp.status_code == 413 and resp.json()["error"]["code"] == "BATCH_TOO_LARGE"
+            finally:
+                del os.environ["IMAGE_SEARCH_MAX_BATCH_FILES"]
+            assert r2.objects == {} and index.list_records(project_id="p") == []
+        finally:
+            index.close()
+
+
+def check_upload_failure_cleans_up() -> None:
+    with TempDir() as tmp:
+        index = open_index(tmp / "db.sqlite")
+        r2, embedder = FlakyR2(), FakeEmbedder()
+        try:
+            client = _client(index, r2=r2, embedder=embedder)
+            resp = client.post("/v1/projects/p/images:batch", files=_files(b"ok-1", b"fail", b"ok-2"))
+            assert resp.status_code == 502 and resp.json()["error"]["code"] == "R2_UPLOAD_FAILED"
+            assert r2.objects == {} and index.list_records(project_id="p") == []
+            assert embedder.calls == []
+        finally:
+            index.close()
+
+
+if __name__ == "__main__":
+    run(
+        check_batch_registers_everything_at_once,
+        check_bad_file_rejects_the_whole_batch,
+        check_upload_failure_cleans_up,
+    )
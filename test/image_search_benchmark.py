@@ -0,0 +1,78 @@
+"""Vector index benchmark (user-019).
+
+Invariants: the synthetic data is deterministic per seed and made of unit vectors; the
+chunked ground truth equals a brute-force top-k over the full matrix (with and without the
+project filter); a small end-to-end run reports every (filtered, ef) pair with sane recall.
+"""
+
+from __future__ import annotations
+
+import contextlib
+import io
+import json
+
+import numpy as np
+
+from _support import TempDir, run
+
+
+def _data(**kwargs):
+    from app.domains.image_search.benchmark import SyntheticVectors
+
+    kwargs = {"dim": 16, "clusters": 8, "spread": 1.0, "projects": 3, "seed": 5, "chunk": 64, **kwargs}
+    return SyntheticVectors(**kwargs)
+
+
+def check_data_is_deterministic() -> None:
+    a = np.concatenate([chunk for _, chunk in _data().chunks(300)])
+    b = np.concatenate([chunk for _, chunk in _data().chunks(300)])
+    assert a.shape == (300, 16) and np.array_equal(a, b)
+    assert np.allclose(np.linalg.norm(a, axis=1), 1.0, atol=1e-5)
+    assert not np.array_equal(a, np.concatenate([chunk for _, chunk in _data(seed=6).chunks(300)]))
+    assert [_data().project_of(row) for row in range(4)] == ["bench-0", "bench-1", "bench-2", "bench-0"]
+
+
+def check_ground_truth_matches_brute_force() -> None:
+    from app.domains.image_search.benchmark import _ground_truth
+
+    data = _data()
+    matrix = np.concatenate([chunk for _, chunk in data.chunks(300)])
+    queries = data.queries(12)
+    projects = [i % data.projects for i in range(len(queries))]
+    for filtered in (False, True):
+        truth = _ground_truth(data, 300, queries, k=5, query_projects=projects if filtered else None)
+        for i, query in enumerate(queries):
+            sims = matrix @ query
+            if filtered:
+                sims[np.arange(300) % data.projects != projects[i]] = -np.inf
+            assert truth[i] == set(np.argsort(-sims)[:5].tolist()), (filtered, i)
+
+
+def check_small_end_to_end_run() -> None:
+    from app.domains.image_search.benchmark import main
+
+    with TempDir() as tmp:
+        out = tmp / "bench.json"
+        argv = ["--sizes", "400", "--dim", "16", "--clusters", "8", "--projects", "4", "--queries", "20"]
+        argv += ["-k", "5", "--ef", "default,200", "--batch-size", "150", "--workdir", str(tmp), "--out", str(out)]
+        with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+            main(argv)
+
+        report = json.loads(out.read_text(encoding="utf-8"))
+        assert report["meta"]["k"] == 5 and len(report["results"]) == 1
+        result = report["results"][0]
+        assert result["vectors"] == 400 and result["db_bytes"] > 0
+        pairs = [(s["filtered"], s["ef"]) for s in result["searches"]]
+        assert pairs == [(False, None), (False, 200), (True, None), (True, 200)]
+        for stats in result["searches"]:
+            assert stats["queries"] == 20 and 0 < stats["p50_ms"] <= stats["p99_ms"]
+            if stats["ef"] == 200:
+                assert stats["recall"] >= 0.95, stats
+
+
+if __name__ == "__main__":
+    run(
+        check_data_is_deterministic,
+        check_ground_truth_matches_brute_force,
+        check_small_end_to_end_run,
+    )
@@ -0,0 +1,187 @@
+"""Project export/import bundles (user-023).
+
+Invariants: export -> import reproduces the project (records, vectors, search results)
+without embedding anything; the imported records get their own R2 objects, so deleting
+either side never removes what the other one serves; malformed bundles are rejected.
+"""
+
+from __future__ import annotations
+
+import io
+import tarfile
+import uuid
+
+import numpy as np
+
+from _support import FakeEmbedder, FakeR2, TempDir, make_app, open_index, random_vectors, record, run
+
+
+def _client(index, **kwargs):
+    from fastapi.testclient import TestClient
+
+    return TestClient(make_app(index, **kwargs))
+
+
+def _seed(index, r2: FakeR2, project_id: str, n: int) -> list[str]:
+    ids = [str(uuid.UUID(int=i + 1)) for i in range(n)]
+    recs = [record(project_id, image_id, sha256=f"{i:064x}") for i, image_id in enumerate(ids)]
+    index.upsert_images(items=list(zip(recs, random_vectors(n, seed=7))))
+    for rec in recs:
+        r2.upload_bytes(key=rec.r2_key, data=rec.id.encode())
+    return ids
+
+
+def _search(client, project_id: str, vector: np.ndarray) -> list[tuple[str, float]]:
+    state = client.app.state.image_search
+    hits = state.vector_index.search_records(project_id=project_id, vector=vector, limit=5)
+    return [(r.id, round(s, 4)) for r, s in hits]
+
+
+def check_roundtrip_without_embedding() -> None:
+    with TempDir() as tmp:
+        r2 = FakeR2()
+        src = open_index(tmp / "src.sqlite", vector_codec="float16")
+        dst = open_index(tmp / "dst.sqlite")
+        try:
+            embedder = FakeEmbedder()
+            ids = _seed(src, r2, "p", 30)
+            a, b = _client(src, r2=r2), _client(dst, r2=r2, embedder=embedder)
+
+            resp = a.get("/v1/projects/p/export")
+            assert resp.status_code == 200 and resp.headers["x-image-count"] == "30"
+            names = tarfile.open(fileobj=io.BytesIO(resp.content)).getnames()
+            assert names == ["manifest.json", "records.jsonl", "vectors.npy"], names
+
+            imp = b.post("/v1/projects/q/import", files={"file": ("p.tar", io.BytesIO(resp.content))})
+            assert imp.status_code == 200, imp.text
+            assert imp.json() == {"project_id": "q", "imported": 30}
+            assert embedder.calls == []
+
+            got = {r.id: r for r in dst.list_records(project_id="q")}
+            assert sorted(got) == sorted(ids)
+            assert all(r.sha256 == f"{ids.index(r.id):064x}" for r in got.values())
+            query = random_vectors(1, seed=99)[0]
+            assert _search(a, "p", query) == _search(b, "q", query)
+        finally:
+            src.close()
+            dst.close()
+
+
+def check_import_copies_objects() -> None:
+    with TempDir() as tmp:
+        r2 = FakeR2()
+        index = open_index(tmp / "db.sqlite")
+        try:
+            client = _client(index, r2=r2)
+            ids = _seed(index, r2, "p", 4)
+            bundle = client.get("/v1/projects/p/export").content
+            src_keys = {r.id: r.r2_key for r in index.list_records(project_id="p")}
+
+            resp = client.post("/v1/projects/q/import", files={"file": ("b.tar", io.BytesIO(bundle))})
+            assert resp.status_code == 200, resp.text
+            imported = {r.id: r.r2_key for r in index.list_records(project_id="q")}
+            for image_id in ids:
+                assert imported[image_id] == f"AI/SEARCH/q/{image_id}.jpg"
+                assert imported[image_id] != src_keys[image_id]
+                assert r2.objects[imported[image_id]] == r2.objects[src_keys[image_id]]
+
+            # Deleting an imported image leaves the source object, and the other way round.
+            assert client.delete(f"/v1/projects/q/images/{ids[0]}").status_code == 204
+            assert src_keys[ids[0]] in r2.objects and imported[ids[0]] not in r2.objects
+            assert client.delete(f"/v1/projects/p/images/{ids[1]}").status_code == 204
+            assert imported[ids[1]] in r2.objects and src_keys[ids[1]] not in r2.objects
+
+            # The source project's purge queue holds only its own keys.
+            client.delete("/v1/projects/p")
+            queued = {key for _, key in index.purge_batch(limit=100)}
+            assert queued == {src_keys[i] for i in ids if i != ids[1]}
+
+            # Importing a bundle back into its own project reuses the keys (nothing to copy).
+            before = dict(r2.objects)
+            own = client.get("/v1/projects/q/export").content
+            assert client.post("/v1/projects/q/import", files={"file": ("q.tar", io.BytesIO(own))}).status_code == 200
+            assert r2.objects == before
+        finally:
+            index.close()
+
+
+def check_delete_image_keeps_shared_objects() -> None:
+    # Records imported before keys were copied share the source's objects.
+    with TempDir() as tmp:
+        r2 = FakeR2()
+        index = open_index(tmp / "db.sqlite")
+        try:
+            client = _client(index, r2=r2)
+            image_id = _seed(index, r2, "p", 1)[0]
+            key = index.list_records(project_id="p")[0].r2_key
+            index.upsert_images(items=[(record("legacy", image_id, r2_key=key), random_vectors(1)[0])])
+            assert client.delete(f"/v1/projects/legacy/images/{image_id}").status_code == 204
+            assert key in r2.objects
+            assert client.delete(f"/v1/projects/p/images/{image_id}").status_code == 204
+            assert key not in r2.objects
+        finally:
+            index.close()
+
+
+def check_copy_failure_imports_nothing_of_the_chunk() -> None:
+    with TempDir() as tmp:
+        r2 = FakeR2()
+        index = open_index(tmp / "db.sqlite")
+        try:
+            client = _client(index, r2=r2)
+            _seed(index, r2, "p", 5)
+            bundle = client.get("/v1/projects/p/export").content
+            r2.fail_keys = {index.list_records(project_id="p")[2].r2_key}
+            objects = set(r2.objects)
+
+            resp = client.post("/v1/projects/q/import", files={"file": ("b.tar", io.BytesIO(bundle))})
+            assert resp.status_code == 502 and resp.json()["error"]["code"] == "R2_COPY_FAILED"
+            assert index.list_records(project_id="q") == []
+            assert set(r2.objects) == objects
+        finally:
+            index.close()
+
+
+def check_invalid_bundles() -> None:
+    from app.domains.image_search.bundle import Bundle, BundleError
+
+    with TempDir() as tmp:
+        r2 = FakeR2()
+        index = open_index(tmp / "db.sqlite")
+        other_dim = open_index(tmp / "other.sqlite", vector_dim=8)
+        try:
+            client = _client(index, r2=r2)
+            _seed(index, r2, "p", 6)
+            bundle = client.get("/v1/projects/p/export").content
+
+            vectors = tarfile.open(fileobj=io.BytesIO(bundle)).getmember("vectors.npy")
+            truncated = bundle[: vectors.offset_data + 200]
+            for raw in (b"garbage", truncated):
+                resp = client.post("/v1/projects/q/import", files={"file": ("b.tar", io.BytesIO(raw))})
+                assert resp.status_code == 400 and resp.json()["error"]["code"] == "INVALID_BUNDLE", resp.text
+
+            resp = _client(other_dim, r2=r2).post(
+                "/v1/projects/q/import", files={"file": ("b.tar", io.BytesIO(bundle))}
+            )
+            assert resp.status_code == 400 and "dim" in resp.json()["error"]["message"]
+
+            try:
+                Bundle(io.BytesIO(bundle), model_name="another-model")
+            except BundleError as exc:
+                assert "model" in str(exc)
+            else:
+                raise AssertionError("a bundle from another model was accepted")
+            assert client.get("/v1/projects/nope/export").status_code == 404
+        finally:
+            index.close()
+            other_dim.close()
+
+
+if __name__ == "__main__":
+    run(
+        check_roundtrip_without_embedding,
+        check_import_copies_objects,
+        check_delete_image_keeps_shared_objects,
+        check_copy_failure_imports_nothing_of_the_chunk,
+        check_invalid_bundles,
+    )
@@ -0,0 +1,86 @@
+"""Compact vector storage (user-006).
+
+Invariants: each codec round-trips within its precision and has its documented size; the
+codec is inferred from the blob length, so rows of different codecs coexist in one DB;
+re-encoding converts old rows in place without changing search results.
+"""
+
+from __future__ import annotations
+
+import sqlite3
+
+import numpy as np
+
+from _support import DIM, TempDir, open_index, random_vectors, record, run
+
+
+def check_encode_decode() -> None:
+    from app.domains.image_search.vectordb import VECTOR_CODECS, decode_matrix, decode_vector, encode_vector
+
+    vecs = random_vectors(50, dim=512, seed=1)
+    sizes = {"float32": 4 * 512, "float16": 2 * 512, "int8": 512 + 4}
+    tolerance = {"float32": 0.0, "float16": 1e-3, "int8": 1e-2}
+    for codec in VECTOR_CODECS:
+        blobs = [encode_vector(v, codec=codec) for v in vecs]
+        assert {len(b) for b in blobs} == {sizes[codec]}, codec
+        decoded = np.stack([decode_vector(b, dim=512) for b in blobs])
+        assert decoded.dtype == np.float32
+        assert np.abs(decoded - vecs).max() <= tolerance[codec], (codec, np.abs(decoded - vecs).max())
+        cosine = np.sum(decoded * vecs, axis=1) / np.linalg.norm(decoded, axis=1)
+        assert cosine.min() > 0.999, (codec, cosine.min())
+        assert np.array_equal(decode_matrix(blobs, dim=512), decoded)
+
+    mixed = [encode_vector(v, codec=c) for v, c in zip(vecs, VECTOR_CODECS * 20)]
+    assert decode_matrix(mixed, dim=512).shape == (50, 512)
+    assert np.array_equal(decode_vector(encode_vector(np.zeros(8), codec="int8"), dim=8), np.zeros(8))
+    for bad in (b"", b"\x00" * 7):
+        try:
+            decode_vector(bad, dim=512)
+        except ValueError:
+            pass
+        else:
+            raise AssertionError("a blob of the wrong size was decoded")
+
+
+def _blob_sizes(db_path) -> set[int]:
+    conn = sqlite3.connect(str(db_path))
+    try:
+        return {int(r[0]) for r in conn.execute("SELECT DISTINCT length(embedding) FROM image_vectors")}
+    finally:
+        conn.close()
+
+
+def check_mixed_codecs_and_recode() -> None:
+    with TempDir() as tmp:
+        db = tmp / "db.sqlite"
+        vecs = random_vectors(60, seed=2)
+        index = open_index(db)
+        index.upsert_images(items=[(record("p", f"p-{i}"), vecs[i]) for i in range(30)])
+        index.close()
+
+        index = open_index(db, vector_codec="int8")
+        try:
+            index.upsert_images(items=[(record("p", f"p-{i}"), vecs[i]) for i in range(30, 60)])
+            assert _blob_sizes(db) == {4 * DIM, DIM + 4}
+            before = [
+                [r.id for r, _ in index.search_records(project_id="p", vector=v, limit=5)] for v in vecs[::7]
+            ]
+            assert [ids[0] for ids in before] == [f"p-{i}" for i in range(0, 60, 7)]
+
+            assert index.needs_recode()
+            progress = list(index.iter_recode_vectors(chunk_size=25))
+            assert progress[-1] == (60, 60) and not index.needs_recode()
+            assert _blob_sizes(db) == {DIM + 4}
+            after = [
+                [r.id for r, _ in index.search_records(project_id="p", vector=v, limit=5)] for v in vecs[::7]
+            ]
+            assert after == before
+        finally:
+            index.close()
+
+
+if __name__ == "__main__":
+    run(
+        check_encode_decode,
+        check_mixed_codecs_and_recode,
+    )
@@ -0,0 +1,99 @@
+"""Online HNSW compaction (user-021).
+
+Invariants: every delete and overwrite leaves one tombstone in the graph and the count
+survives a restart through the index file manifest; compaction swaps in a graph with only
+live vectors, and writes made while it copies (on rows already copied or not) are all in
+the new graph; the admin endpoints report and queue it per shard.
+"""
+
+from __future__ import annotations
+
+import contextlib
+import io
+
+from _support import TempDir, make_app, open_index, random_vectors, record, run
+
+
+def _fill(index, vecs, ids) -> None:
+    index.upsert_images(items=[(record("p", f"p-{i}"), vecs[i]) for i in ids])
+
+
+def _top(index, vector) -> str:
+    return index.search_records(project_id="p", vector=vector, limit=1)[0][0].id
+
+
+def check_tombstones_are_counted() -> None:
+    with TempDir() as tmp:
+        db = tmp / "db.sqlite"
+        vecs = random_vectors(140, seed=1)
+        with contextlib.redirect_stdout(io.StringIO()):
+            index = open_index(db, index_file=True, compact_threshold=0.2, compact_min_tombstones=10)
+        _fill(index, vecs, range(100))
+        assert index.tombstones == 0 and not index.needs_compaction()
+        index.upsert_images(items=[(record("p", f"p-{i}"), vecs[100 + i]) for i in range(20)])  # overwrites
+        for i in range(90, 100):
+            index.delete_image(project_id="p", image_id=f"p-{i}")
+        assert index.tombstones == 30 and index.index_elements == 90
+        assert abs(index.tombstone_ratio - 0.25) < 1e-9 and index.needs_compaction()
+        with contextlib.redirect_stdout(io.StringIO()):
+            index.close()
+            index = open_index(db, index_file=True, compact_threshold=0.2, compact_min_tombstones=10)
+        try:
+            assert index.tombstones == 30 and index.needs_compaction()
+        finally:
+            index.close()
+
+
+def check_compaction_keeps_concurrent_writes() -> None:
+    with TempDir() as tmp:
+        index = open_index(tmp / "db.sqlite", exact_search_max_project_size=0)
+        try:
+            vecs = random_vectors(260, seed=2)
+            _fill(index, vecs, range(200))
+            for i in range(0, 200, 4):
+                index.delete_image(project_id="p", image_id=f"p-{i}")
+            assert index.tombstones == 50
+
+            steps = index.iter_compact_vector_index(chunk_size=40)
+            next(steps)
+            next(steps)  # rows up to about p-52 are in the new graph
+            index.delete_image(project_id="p", image_id="p-5")  # copied
+            index.delete_image(project_id="p", image_id="p-195")  # not copied yet
+            index.upsert_images(items=[(record("p", "p-6"), vecs[250]), (record("p", "p-199"), vecs[251])])
+            _fill(index, vecs, range(200, 210))
+            for _ in steps:
+                pass
+
+            assert index.index_elements == 158 and index.tombstones == 2, (index.index_elements, index.tombstones)
+            assert _top(index, vecs[250]) == "p-6" and _top(index, vecs[251]) == "p-199"
+            assert _top(index, vecs[205]) == "p-205" and _top(index, vecs[101]) == "p-101"
+            hits = {r.id for r, _ in index.search_records(project_id="p", vector=vecs[5], limit=158)}
+            assert len(hits) == 158 and not {"p-5", "p-195", "p-0", "p-4"} & hits
+        finally:
+            index.close()
+
+
+def check_admin_endpoints() -> None:
+    from fastapi.testclient import TestClient
+
+    with TempDir() as tmp:
+        index = open_index(tmp / "db.sqlite")
+        try:
+            client = TestClient(make_app(index))
+            _fill(index, random_vectors(10, seed=3), range(10))
+            index.delete_image(project_id="p", image_id="p-0")
+            (shard,) = client.get("/v1/image-search/index").json()["shards"]
+            assert shard["vectors"] == 9 and shard["tombstones"] == 1 and not shard["compaction_pending"]
+            resp = client.post("/v1/image-search/index:compact")
+            assert resp.status_code == 202 and resp.json()["shards"][0]["compaction_pending"]
+            assert client.app.state.image_search.compact_requested == {0}
+        finally:
+            index.close()
+
+
+if __name__ == "__main__":
+    run(
+        check_tombstones_are_counted,
+        check_compaction_keeps_concurrent_writes,
+        check_admin_endpoints,
+    )
@@ -0,0 +1,131 @@
+"""Concurrent readers (user-009).
+
+Invariants: metadata reads, exact scans and NumPy searches never wait on the writer lock;
+searches queue on their own limiter, so searches stuck behind the writer (HNSW kNN) never
+hold up metadata reads; concurrent NumPy searches and writes always see a consistent matrix.
+"""
+
+from __future__ import annotations
+
+import threading
+from functools import partial
+
+import anyio
+
+from _support import TempDir, open_index, random_vectors, record, run
+
+
+def _in_thread(fn, *, timeout: float = 5.0):
+    out: dict = {}
+
+    def target() -> None:
+        try:
+            out["value"] = fn()
+        except BaseException as exc:  # re-raised in the caller
+            out["error"] = exc
+
+    thread = threading.Thread(target=target, daemon=True)
+    thread.start()
+    thread.join(timeout)
+    assert not thread.is_alive(), f"{getattr(fn, '__name__', fn)} blocked"
+    if "error" in out:
+        raise out["error"]
+    return out["value"]
+
+
+def _numpy_index(tmp):
+    from app.domains.image_search.vectordb import NumpyVectorIndex
+
+    return open_index(tmp / "db.sqlite", numpy_index=NumpyVectorIndex(root_dir=tmp / "numpy", vector_dim=16))
+
+
+def check_reads_do_not_wait_on_the_writer() -> None:
+    with TempDir() as tmp:
+        index = _numpy_index(tmp)
+        try:
+            vecs = random_vectors(50, seed=1)
+            index.upsert_images(items=[(record("p", f"p-{i}"), v) for i, v in enumerate(vecs)])
+            index.search_records(project_id="p", vector=vecs[0], limit=5)  # opens the matrix
+
+            with index._write_lock:
+                hits = _in_thread(lambda: index.search_records(project_id="p", vector=vecs[4], limit=3))
+                assert hits[0][0].id == "p-4"
+                assert _in_thread(lambda: index.get_record(project_id="p", image_id="p-1")).id == "p-1"
+                assert len(_in_thread(lambda: index.list_records(project_id="p", limit=10))) == 10
+        finally:
+            index.close()
+
+
+def check_numpy_searches_during_writes() -> None:
+    with TempDir() as tmp:
+        index = _numpy_index(tmp)
+        try:
+            vecs = random_vectors(400, seed=2)
+            index.upsert_images(items=[(record("p", f"p-{i}"), v) for i, v in enumerate(vecs[:200])])
+            errors: list[BaseException] = []
+            done = threading.Event()
+
+            def searcher(seed: int) -> None:
+                try:
+                    for query in random_vectors(100, seed=seed):
+                        hits = index.search_records(project_id="p", vector=query, limit=10)
+                        ids = [r.id for r, _ in hits]
+                        assert len(ids) == len(set(ids)) == 10, ids
+                        scores = [s for _, s in hits]
+                        assert scores == sorted(scores, reverse=True)
+                        if done.is_set():
+                            return
+                except BaseException as exc:
+                    errors.append(exc)
+
+            threads = [threading.Thread(target=searcher, args=(seed,)) for seed in range(4)]
+            for thread in threads:
+                thread.start()
+            for i in range(200, 400):
+                index.upsert_image(record=record("p", f"p-{i}"), vector=vecs[i])
+                index.delete_image(project_id="p", image_id=f"p-{i - 200}")
+            done.set()
+            for thread in threads:
+                thread.join()
+            assert not errors, errors[0]
+
+            hits = index.search_records(project_id="p", vector=vecs[399], limit=1)
+            assert hits[0][0].id == "p-399"
+            assert index.numpy_index.count(project_id="p") == 200
+        finally:
+            index.close()
+
+
+def check_searches_do_not_use_up_read_threads() -> None:
+    from app.domains.image_search.executor import DBExecutor
+
+    with TempDir() as tmp:
+        index = open_index(tmp / "db.sqlite")
+        try:
+            index.upsert_images(items=[(record("p", "a"), random_vectors(1)[0])])
+            db = DBExecutor(vector_index=index, read_concurrency=1, search_concurrency=1)
+            release = threading.Event()
+
+            async def main() -> None:
+                async with anyio.create_task_group() as tg:
+                    # A search stuck behind the writer, plus one queued behind it.
+                    for name in ("blocked", "queued"):
+                        tg.start_soon(partial(db.search, name, lambda: release.wait(10), project_id="p"))
+                    await anyio.sleep(0.1)
+                    assert db.stats()["queued"]["search"] == 2
+                    with anyio.fail_after(2):
+                        assert (await db.get_record(project_id="p", image_id="a")).id == "a"
+                    release.set()
+
+            anyio.run(main)
+            assert db.stats()["calls"]["blocked"]["calls"] == 1
+        finally:
+            index.close()
+
+
+if __name__ == "__main__":
+    run(
+        check_reads_do_not_wait_on_the_writer,
+        check_numpy_searches_during_writes,
+        check_searches_do_not_use_up_read_threads,
+    )
@@ -0,0 +1,119 @@
+"""Upload dedup by content hash (user-015).
+
+Invariants: uploading bytes already stored in the project returns the stored image (no R2
+object, no embedding); the same bytes in another project get a new image that reuses the
+stored vector; batch responses stay aligned with the request files; an upload that loses a
+race to the same bytes returns the winner and removes its own blob.
+"""
+
+from __future__ import annotations
+
+import hashlib
+
+from _support import FakeEmbedder, FakeR2, TempDir, make_app, open_index, record, run, unit
+
+
+def _client(index, **kwargs):
+    from fastapi.testclient import TestClient
+
+    return TestClient(make_app(index, **kwargs))
+
+
+def _upload(client, project_id: str, raw: bytes, name: str = "a.jpg") -> dict:
+    resp = client.post(f"/v1/projects/{project_id}/images", files={"file": (name, raw, "image/jpeg")})
+    assert resp.status_code == 200, resp.text
+    return resp.json()
+
+
+def check_same_project_returns_the_stored_image() -> None:
+    with TempDir() as tmp:
+        index = open_index(tmp / "db.sqlite")
+        r2, embedder = FakeR2(), FakeEmbedder()
+        try:
+            client = _client(index, r2=r2, embedder=embedder)
+            first = _upload(client, "p", b"poster bytes")
+            assert first["sha256"] == hashlib.sha256(b"poster bytes").hexdigest()
+            again = _upload(client, "p", b"poster bytes", name="copy.jpg")
+            assert again == first
+            assert len(r2.objects) == 1 and embedder.calls == [("image", 1)]
+            assert len(index.list_records(project_id="p")) == 1
+        finally:
+            index.close()
+
+
+def check_other_project_reuses_the_vector() -> None:
+    with TempDir() as tmp:
+        index = open_index(tmp / "db.sqlite")
+        r2, embedder = FakeR2(), FakeEmbedder()
+        try:
+            client = _client(index, r2=r2, embedder=embedder)
+            first = _upload(client, "p", b"poster bytes")
+            other = _upload(client, "q", b"poster bytes")
+            assert other["id"] != first["id"] and other["sha256"] == first["sha256"]
+            assert other["r2_key"].startswith("AI/SEARCH/q/") and len(r2.objects) == 2
+            assert embedder.calls == [("image", 1)]
+
+            vec = unit(embedder._vec(b"poster bytes"))
+            hits = index.search_records(project_id="q", vector=vec, limit=1)
+            assert hits[0][0].id == other["id"] and hits[0][1] > 0.999
+            # Deleting the source image leaves the copy's vector in place.
+            index.delete_image(project_id="p", image_id=first["id"])
+            assert index.search_records(project_id="q", vector=vec, limit=1)[0][0].id == other["id"]
+        finally:
+            index.close()
+
+
+def check_batch_stays_aligned() -> None:
+    with TempDir() as tmp:
+        index = open_index(tmp / "db.sqlite")
+        r2, embedder = FakeR2(), FakeEmbedder()
+        try:
+            client = _client(index, r2=r2, embedder=embedder)
+            stored = _upload(client, "p", b"old")
+            payloads = [b"new", b"old", b"other", b"new"]
+            files = [("files", (f"img{i}.jpg", raw, "image/jpeg")) for i, raw in enumerate(payloads)]
+            images = client.post("/v1/projects/p/images:batch", files=files).json()["images"]
+            ids = [img["id"] for img in images]
+            assert ids[1] == stored["id"] and ids[0] == ids[3] and len(set(ids)) == 3
+            assert [img["sha256"] for img in images] == [hashlib.sha256(raw).hexdigest() for raw in payloads]
+            assert embedder.calls == [("image", 1), ("images", 2)]
+            assert len(index.list_records(project_id="p")) == 3 and len(r2.objects) == 3
+        finally:
+            index.close()
+
+
+class RacingR2(FakeR2):
+    """Stores the same bytes under another image while our upload is in flight."""
+
+    def __init__(self, index) -> None:
+        super().__init__()
+        self.index = index
+
+    def upload_bytes(self, *, key: str, data: bytes, content_type: str | None = None, **_) -> None:
+        super().upload_bytes(key=key, data=data, content_type=content_type)
+        winner = record("p", "winner", sha256=hashlib.sha256(data).hexdigest())
+        self.objects[winner.r2_key] = data
+        self.index.upsert_image(record=winner, vector=FakeEmbedder()._vec(data))
+
+
+def check_lost_race_returns_the_winner() -> None:
+    with TempDir() as tmp:
+        index = open_index(tmp / "db.sqlite")
+        r2 = RacingR2(index)
+        try:
+            client = _client(index, r2=r2)
+            image = _upload(client, "p", b"poster bytes")
+            assert image["id"] == "winner"
+            assert [r.id for r in index.list_records(project_id="p")] == ["winner"]
+            assert list(r2.objects) == ["AI/SEARCH/p/winner.jpg"]
+        finally:
+            index.close()
+
+
+if __name__ == "__main__":
+    run(
+        check_same_project_returns_the_stored_image,
+        check_other_project_reuses_the_vector,
+        check_batch_stays_aligned,
+        check_lost_race_returns_the_winner,
+    )
@@ -0,0 +1,127 @@
+"""DB executor (user-010).
+
+Invariants: SQLite work runs on worker threads, so the event loop keeps running while a
+call blocks; writes to one shard run one at a time; beyond max_queue in-flight calls of a
+kind, callers get DB_BUSY (503) instead of queueing; every call is timed per name.
+"""
+
+from __future__ import annotations
+
+import contextlib
+import io
+import threading
+import time
+from functools import partial
+
+import anyio
+
+from _support import TempDir, open_index, random_vectors, record, run
+
+
+def _executor(tmp, **kwargs):
+    from app.domains.image_search.executor import DBExecutor
+
+    index = open_index(tmp / "db.sqlite")
+    return index, DBExecutor(vector_index=index, **kwargs)
+
+
+def check_event_loop_keeps_running() -> None:
+    with TempDir() as tmp:
+        index, db = _executor(tmp)
+        try:
+            ticks = 0
+
+            async def ticker() -> None:
+                nonlocal ticks
+                while True:
+                    ticks += 1
+                    await anyio.sleep(0.01)
+
+            async def main() -> None:
+                async with anyio.create_task_group() as tg:
+                    tg.start_soon(ticker)
+                    await db.read("slow", partial(time.sleep, 0.3))
+                    tg.cancel_scope.cancel()
+
+            anyio.run(main)
+            assert ticks >= 10, ticks
+        finally:
+            index.close()
+
+
+def check_writes_run_one_at_a_time() -> None:
+    with TempDir() as tmp:
+        index, db = _executor(tmp)
+        try:
+            running = 0
+            peak = 0
+            guard = threading.Lock()
+
+            def write() -> None:
+                nonlocal running, peak
+                with guard:
+                    running += 1
+                    peak = max(peak, running)
+                time.sleep(0.02)
+                with guard:
+                    running -= 1
+
+            async def main() -> None:
+                async with anyio.create_task_group() as tg:
+                    for _ in range(6):
+                        tg.start_soon(db.write, "w", write)
+                    for i in range(4):
+                        tg.start_soon(
+                            partial(db.upsert_image, record=record("p", f"p-{i}"), vector=random_vectors(1, seed=i)[0])
+                        )
+
+            anyio.run(main)
+            assert peak == 1
+            assert len(index.list_records(project_id="p")) == 4
+            stats = db.stats()["calls"]
+            assert stats["w"]["calls"] == 6 and stats["upsert_image"]["calls"] == 4
+        finally:
+            index.close()
+
+
+def check_full_queue_is_rejected() -> None:
+    from app.core.errors.exceptions import AppError
+
+    with TempDir() as tmp:
+        index, db = _executor(tmp, max_queue=2, slow_ms=50)
+        try:
+            release = threading.Event()
+            out = io.StringIO()
+
+            async def main() -> None:
+                async with anyio.create_task_group() as tg:
+                    for _ in range(2):
+                        tg.start_soon(db.read, "held", partial(release.wait, 5))
+                    await anyio.sleep(0.1)
+                    try:
+                        await db.read("extra", lambda: None)
+                    except AppError as exc:
+                        assert exc.code == "DB_BUSY" and exc.http_status == 503
+                    else:
+                        raise AssertionError("a call beyond max_queue was accepted")
+                    # Writes have their own queue.
+                    await db.write("write", lambda: None)
+                    release.set()
+
+            with contextlib.redirect_stdout(out):
+                anyio.run(main)
+            stats = db.stats()
+            assert stats["queued"] == {"read": 0, "search": 0, "write": 0}
+            assert stats["calls"]["extra"]["rejected"] == 1 and stats["calls"]["held"]["calls"] == 2
+            assert stats["calls"]["held"]["run_ms_max"] >= 50
+            assert "WARNING: slow image search DB call: held" in out.getvalue()
+        finally:
+            index.close()
+
+
+if __name__ == "__main__":
+    run(
+        check_event_loop_keeps_running,
+        check_writes_run_one_at_a_time,
+        check_full_queue_is_rejected,
+    )
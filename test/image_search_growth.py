@@ -0,0 +1,63 @@
+"""Automatic HNSW capacity growth (user-005).
+
+Invariants: inserts never hit vectorlite's max_elements ceiling (capacity at least doubles
+synchronously as a safety net); background growth swaps in a bigger graph online, and
+writes made while it copies are in the new graph.
+"""
+
+from __future__ import annotations
+
+from _support import TempDir, open_index, random_vectors, record, run
+
+
+def _search_top(index, vector) -> str:
+    return index.search_records(project_id="p", vector=vector, limit=1)[0][0].id
+
+
+def check_inserts_past_capacity() -> None:
+    with TempDir() as tmp:
+        index = open_index(tmp / "db.sqlite", max_elements=100, exact_search_max_project_size=0)
+        try:
+            vecs = random_vectors(450, seed=1)
+            for start in range(0, 450, 150):
+                items = [(record("p", f"p-{i}"), vecs[i]) for i in range(start, start + 150)]
+                index.upsert_images(items=items)
+            assert index.index_elements == 450 and index.max_elements >= 450, index.max_elements
+            assert _search_top(index, vecs[449]) == "p-449"
+        finally:
+            index.close()
+
+
+def check_online_growth() -> None:
+    with TempDir() as tmp:
+        index = open_index(tmp / "db.sqlite", max_elements=100, exact_search_max_project_size=0)
+        try:
+            vecs = random_vectors(120, seed=2)
+            index.upsert_images(items=[(record("p", f"p-{i}"), vecs[i]) for i in range(85)])
+            assert index.needs_growth() and index.fill_ratio >= 0.8
+
+            steps = index.iter_grow_vector_index(chunk_size=20)
+            next(steps)
+            next(steps)
+            assert index.swapping and index.max_elements == 100
+            assert _search_top(index, vecs[3]) == "p-3"
+            # Written while the new graph is half copied: before and after its cursor.
+            index.upsert_images(items=[(record("p", f"p-{i}"), vecs[i]) for i in range(85, 95)])
+            index.delete_image(project_id="p", image_id="p-0")
+            for _ in steps:
+                pass
+
+            assert not index.swapping and not index.needs_growth()
+            assert index.max_elements == 200 and index.index_elements == 94
+            for i in (1, 50, 84, 94):
+                assert _search_top(index, vecs[i]) == f"p-{i}"
+            assert "p-0" not in [r.id for r, _ in index.search_records(project_id="p", vector=vecs[0], limit=5)]
+        finally:
+            index.close()
+
+
+if __name__ == "__main__":
+    run(
+        check_inserts_past_capacity,
+        check_online_growth,
+    )
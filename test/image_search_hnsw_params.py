@@ -0,0 +1,96 @@
+"""HNSW build params and per-query ef (user-018).
+
+Invariants: M / ef_construction are recorded in the vtable definition, and an index opened
+with other params is swapped for a rebuilt one without losing vectors; a per-query ef is
+raised to at least limit and capped at max_ef_search; ef is part of the result cache key.
+"""
+
+from __future__ import annotations
+
+import contextlib
+import io
+import re
+
+from _support import FakeEmbedder, TempDir, make_app, open_index, random_vectors, record, run
+
+
+def _knn_ef(index, **search) -> int | None:
+    statements: list[str] = []
+    index.conn.set_trace_callback(statements.append)
+    try:
+        index.search_records(project_id="p", **search)
+    finally:
+        index.conn.set_trace_callback(None)
+    (sql,) = [s for s in statements if "knn_search" in s]
+    args = re.search(r"knn_param\(x'[0-9a-f]+', (\d+)(?:, (\d+))?\)", sql)
+    return None if args.group(2) is None else int(args.group(2))
+
+
+def _open_persisted(db, **kwargs):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return open_index(db, index_file=True, exact_search_max_project_size=0, **kwargs)
+
+
+def check_per_query_ef_is_clamped() -> None:
+    with TempDir() as tmp:
+        index = open_index(tmp / "db.sqlite", exact_search_max_project_size=0, max_ef_search=50)
+        try:
+            vecs = random_vectors(200, seed=1)
+            index.upsert_images(items=[(record("p", f"p-{i}"), v) for i, v in enumerate(vecs)])
+            assert _knn_ef(index, vector=vecs[0], limit=5) is None
+            assert _knn_ef(index, vector=vecs[0], limit=5, ef=30) == 30
+            assert _knn_ef(index, vector=vecs[0], limit=5, ef=10_000) == 50
+            assert _knn_ef(index, vector=vecs[0], limit=20, ef=3) == 20
+            index.ef_search = 40
+            assert _knn_ef(index, vector=vecs[0], limit=5) == 40
+        finally:
+            index.close()
+
+
+def check_changed_build_params_are_rebuilt() -> None:
+    with TempDir() as tmp:
+        db = tmp / "db.sqlite"
+        vecs = random_vectors(300, seed=2)
+        index = _open_persisted(db, hnsw_m=8, hnsw_ef_construction=40)
+        index.upsert_images(items=[(record("p", f"p-{i}"), v) for i, v in enumerate(vecs)])
+        assert index._stored_build_params(index._vtable) == (8, 40) and not index.needs_reshape()
+        index.close()
+
+        # Without an index file every start builds a fresh graph; a loaded file keeps its params.
+        index = _open_persisted(db, hnsw_m=24, hnsw_ef_construction=120)
+        try:
+            assert index._stored_build_params(index._vtable) == (8, 40) and index.needs_reshape()
+            for _ in index.iter_reshape_vector_index(chunk_size=64):
+                pass
+            assert index._stored_build_params(index._vtable) == (24, 120) and not index.needs_reshape()
+            assert index.index_elements == 300
+            assert index.search_records(project_id="p", vector=vecs[77], limit=1)[0][0].id == "p-77"
+        finally:
+            index.close()
+
+
+def check_ef_is_part_of_the_cache_key() -> None:
+    from fastapi.testclient import TestClient
+
+    with TempDir() as tmp:
+        index = open_index(tmp / "db.sqlite", exact_search_max_project_size=0)
+        embedder = FakeEmbedder()
+        try:
+            client = TestClient(make_app(index, embedder=embedder))
+            index.upsert_images(items=[(record("p", f"p-{i}"), v) for i, v in enumerate(random_vectors(50, seed=3))])
+            for ef in (None, 64, 64, 200):
+                body = {"query": "cat", "limit": 5} if ef is None else {"query": "cat", "limit": 5, "ef": ef}
+                assert client.post("/v1/projects/p/images/search", json=body).status_code == 200
+            stats = client.app.state.image_search.search_cache.stats()
+            assert stats["hits"] == 1 and stats["entries"] == 3
+            assert client.post("/v1/projects/p/images/search", json={"query": "cat", "ef": 0}).status_code == 422
+        finally:
+            index.close()
+
+
+if __name__ == "__main__":
+    run(
+        check_per_query_ef_is_clamped,
+        check_changed_build_params_are_rebuilt,
+        check_ef_is_part_of_the_cache_key,
+    )
@@ -0,0 +1,95 @@
+"""Metadata full-text and hybrid search (user-017).
+
+Invariants: the FTS index follows inserts, renames and deletes, stays within the project
+and treats user input as words, never FTS5 syntax; hybrid scores are reciprocal rank fusion
+of the BM25 and CLIP rankings; mode=text never runs the embedder.
+"""
+
+from __future__ import annotations
+
+import dataclasses
+
+from _support import FakeEmbedder, TempDir, make_app, open_index, random_vectors, record, run
+
+
+def _named(project_id: str, image_id: str, filename: str):
+    return dataclasses.replace(record(project_id, image_id), original_filename=filename)
+
+
+def _ids(hits) -> list[str]:
+    return [r.id for r, _ in hits]
+
+
+def check_fts_follows_writes() -> None:
+    with TempDir() as tmp:
+        index = open_index(tmp / "db.sqlite")
+        try:
+            vecs = random_vectors(4, seed=1)
+            names = ["summer_beach.jpg", "winter_poster.png", "beach_poster.jpg"]
+            index.upsert_images(items=[(_named("p", f"p-{i}", n), vecs[i]) for i, n in enumerate(names)])
+            index.upsert_images(items=[(_named("q", "q-0", "beach.jpg"), vecs[3])])
+
+            assert set(_ids(index.search_records_text(project_id="p", query="beach", limit=10))) == {"p-0", "p-2"}
+            # Prefix terms, OR'ed; records matching both words rank first.
+            assert _ids(index.search_records_text(project_id="p", query="bea post", limit=10))[0] == "p-2"
+            for hostile in ('"', "beach OR (", "NEAR(", "*", ""):
+                index.search_records_text(project_id="p", query=hostile, limit=10)
+
+            index.upsert_image(record=_named("p", "p-0", "autumn.jpg"), vector=vecs[0])
+            index.delete_image(project_id="p", image_id="p-2")
+            assert index.search_records_text(project_id="p", query="beach", limit=10) == []
+            assert _ids(index.search_records_text(project_id="p", query="autumn", limit=10)) == ["p-0"]
+        finally:
+            index.close()
+
+
+def check_hybrid_is_rank_fusion() -> None:
+    with TempDir() as tmp:
+        index = open_index(tmp / "db.sqlite")
+        try:
+            vecs = random_vectors(30, seed=2)
+            items = [(_named("p", f"p-{i}", f"img_{i}.jpg"), v) for i, v in enumerate(vecs)]
+            items[5] = (_named("p", "p-5", "red_poster.jpg"), vecs[5])
+            items[9] = (_named("p", "p-9", "red_poster_final.jpg"), vecs[9])
+            index.upsert_images(items=items)
+
+            query = vecs[5] + 0.05 * vecs[9]
+            lexical = _ids(index.search_records_text(project_id="p", query="red poster", limit=30))
+            semantic = _ids(index.search_records(project_id="p", vector=query, limit=30))
+            hits = index.search_records_hybrid(project_id="p", query="red poster", vector=query, limit=3, rrf_k=60)
+
+            def rrf(image_id: str) -> float:
+                return sum(1.0 / (60 + ranks.index(image_id) + 1) for ranks in (lexical, semantic) if image_id in ranks)
+
+            assert _ids(hits)[0] == "p-5"
+            for r, score in hits:
+                assert abs(score - rrf(r.id)) < 1e-12
+            assert [s for _, s in hits] == sorted((s for _, s in hits), reverse=True)
+        finally:
+            index.close()
+
+
+def check_text_mode_skips_the_embedder() -> None:
+    from fastapi.testclient import TestClient
+
+    with TempDir() as tmp:
+        index = open_index(tmp / "db.sqlite")
+        embedder = FakeEmbedder()
+        try:
+            client = TestClient(make_app(index, embedder=embedder))
+            index.upsert_images(items=[(_named("p", "p-0", "cat_photo.jpg"), random_vectors(1, seed=3)[0])])
+            body = client.post("/v1/projects/p/images/search", json={"query": "cat", "mode": "text"}).json()
+            assert [hit["id"] for hit in body["results"]] == ["p-0"] and body["results"][0]["score"] > 0
+            assert embedder.calls == []
+            body = client.post("/v1/projects/p/images/search", json={"query": "cat", "mode": "hybrid"}).json()
+            assert [hit["id"] for hit in body["results"]] == ["p-0"] and embedder.calls == [("text", 1)]
+        finally:
+            index.close()
+
+
+if __name__ == "__main__":
+    run(
+        check_fts_follows_writes,
+        check_hybrid_is_rank_fusion,
+        check_text_mode_skips_the_embedder,
+    )
@@ -0,0 +1,96 @@
+"""Search by an uploaded image (user-025).
+
+Invariants: an image query stores nothing (no R2 object, no row, no change to the index);
+bytes already stored reuse their vector, other bytes are embedded once, in memory, and a
+re-sent image is served from the result cache; uploads and image queries never go through
+temp files or path-based embedding.
+"""
+
+from __future__ import annotations
+
+import contextlib
+import tempfile
+
+from _support import FakeEmbedder, FakeR2, TempDir, make_app, open_index, run
+
+
+class InMemoryEmbedder(FakeEmbedder):
+    def embed_image_path(self, path: str):
+        raise AssertionError(f"embedded from a path: {path}")
+
+    def embed_image_paths(self, paths: list[str], *, batch_size: int = 16):
+        raise AssertionError(f"embedded from paths: {paths}")
+
+
+@contextlib.contextmanager
+def _no_temp_files():
+    def refuse(*args, **kwargs):
+        raise AssertionError("temp file created")
+
+    saved = {name: getattr(tempfile, name) for name in ("NamedTemporaryFile", "TemporaryDirectory", "mkstemp")}
+    for name in saved:
+        setattr(tempfile, name, refuse)
+    try:
+        yield
+    finally:
+        for name, fn in saved.items():
+            setattr(tempfile, name, fn)
+
+
+def _search(client, project_id: str, raw: bytes, **params):
+    files = {"file": ("query.jpg", raw, "image/jpeg")}
+    return client.post(f"/v1/projects/{project_id}/images/search:image", files=files, params=params)
+
+
+def check_image_query_stores_nothing() -> None:
+    from fastapi.testclient import TestClient
+
+    with TempDir() as tmp:
+        index = open_index(tmp / "db.sqlite")
+        r2, embedder = FakeR2(), InMemoryEmbedder()
+        try:
+            client = TestClient(make_app(index, r2=r2, embedder=embedder))
+            with _no_temp_files():
+                stored = client.post("/v1/projects/p/images", files={"file": ("a.jpg", b"stored", "image/jpeg")}).json()
+                batch = [("files", (f"b{i}.jpg", b"batch-%d" % i, "image/jpeg")) for i in range(3)]
+                assert client.post("/v1/projects/p/images:batch", files=batch).status_code == 200
+                objects, counter = dict(r2.objects), index.change_counter()
+                calls = len(embedder.calls)
+
+                top = _search(client, "p", b"stored", limit=2).json()["results"][0]
+                assert top["id"] == stored["id"] and top["score"] > 0.999
+                assert len(embedder.calls) == calls  # stored bytes: vector reused
+
+                first = _search(client, "p", b"new query", limit=4).json()
+                assert _search(client, "p", b"new query", limit=4).json() == first
+                assert embedder.calls[calls:] == [("image", 1)]
+                assert len(first["results"]) == 4
+
+            assert r2.objects == objects and index.change_counter() == counter
+            assert len(index.list_records(project_id="p")) == 4
+        finally:
+            index.close()
+
+
+def check_rejections() -> None:
+    from fastapi.testclient import TestClient
+
+    with TempDir() as tmp:
+        index = open_index(tmp / "db.sqlite")
+        try:
+            client = TestClient(make_app(index))
+            client.post("/v1/projects/p/images", files={"file": ("a.jpg", b"stored", "image/jpeg")})
+            resp = client.post("/v1/projects/p/images/search:image", files={"file": ("a.txt", b"x", "text/plain")})
+            assert resp.json()["error"]["code"] == "INVALID_IMAGE"
+            assert _search(client, "p", b"").json()["error"]["code"] == "EMPTY_FILE"
+            assert _search(client, "missing", b"stored").status_code == 404
+            assert _search(client, "p", b"stored", limit=0).status_code == 422
+        finally:
+            index.close()
+
+
+if __name__ == "__main__":
+    run(
+        check_image_query_stores_nothing,
+        check_rejections,
+    )
@@ -0,0 +1,118 @@
+"""Persisted HNSW graph (user-012).
+
+Invariants: a clean shutdown leaves an index file + manifest that the next start loads
+instead of rebuilding; a file that is behind the DB is caught up from vector_changes; a
+file that doesn't match its manifest is discarded (never handed to vectorlite) and the
+index is rebuilt from image_vectors.
+"""
+
+from __future__ import annotations
+
+import contextlib
+import io
+import shutil
+
+from _support import TempDir, open_index, random_vectors, record, run
+
+
+def _open(db, **kwargs):
+    out = io.StringIO()
+    with contextlib.redirect_stdout(out):
+        index = open_index(db, index_file=True, exact_search_max_project_size=0, **kwargs)
+    return index, out.getvalue()
+
+
+def _fill(index, vecs, start: int, stop: int) -> None:
+    index.upsert_images(items=[(record("p", f"p-{i}"), vecs[i]) for i in range(start, stop)])
+
+
+def _top(index, vector) -> str:
+    return index.search_records(project_id="p", vector=vector, limit=1)[0][0].id
+
+
+def check_loads_instead_of_rebuilding() -> None:
+    from app.domains.image_search.vectordb import index_file_path, read_index_manifest
+
+    with TempDir() as tmp:
+        db = tmp / "db.sqlite"
+        vecs = random_vectors(300, seed=1)
+        index, _ = _open(db)
+        _fill(index, vecs, 0, 300)
+        index.close()
+
+        manifest = read_index_manifest(index_file_path(db, "v_images"))
+        assert manifest is not None and manifest["vector_count"] == 300
+        index, log = _open(db)
+        try:
+            assert "Loaded image search index file" in log and "replayed=0" in log, log
+            assert not index.rebuilding and index.index_elements == 300
+            assert _top(index, vecs[123]) == "p-123"
+        finally:
+            index.close()
+
+
+def check_stale_file_is_caught_up() -> None:
+    from app.domains.image_search.vectordb import index_file_path, index_manifest_path
+
+    with TempDir() as tmp:
+        db = tmp / "db.sqlite"
+        vecs = random_vectors(300, seed=2)
+        index, _ = _open(db)
+        _fill(index, vecs, 0, 200)
+        assert index.persist_index()["vector_count"] == 200
+        path = index_file_path(db, "v_images")
+        shutil.copy(path, tmp / "old.hnsw")
+        shutil.copy(index_manifest_path(path), tmp / "old.json")
+
+        _fill(index, vecs, 200, 300)
+        index.delete_image(project_id="p", image_id="p-5")
+        index.upsert_images(items=[(record("p", "p-7"), vecs[299])])
+        index.close()
+        # As if the process died after the first persist: the file is behind the DB.
+        shutil.copy(tmp / "old.hnsw", path)
+        shutil.copy(tmp / "old.json", index_manifest_path(path))
+
+        index, log = _open(db)
+        try:
+            assert "Loaded image search index file" in log and "replayed=102" in log, log
+            assert index.index_elements == 299
+            assert _top(index, vecs[250]) == "p-250"
+            ids = [r.id for r, _ in index.search_records(project_id="p", vector=vecs[5], limit=5)]
+            assert "p-5" not in ids
+            assert {r.id for r, _ in index.search_records(project_id="p", vector=vecs[299], limit=2)} == {
+                "p-7",
+                "p-299",
+            }
+        finally:
+            index.close()
+
+
+def check_mismatched_file_is_discarded() -> None:
+    from app.domains.image_search.vectordb import index_file_path
+
+    with TempDir() as tmp:
+        db = tmp / "db.sqlite"
+        vecs = random_vectors(100, seed=3)
+        index, _ = _open(db)
+        _fill(index, vecs, 0, 100)
+        index.close()
+
+        path = index_file_path(db, "v_images")
+        raw = bytearray(path.read_bytes())
+        raw[len(raw) // 2] ^= 0xFF
+        path.write_bytes(bytes(raw))
+
+        index, log = _open(db)
+        try:
+            assert "WARNING: discarding image search index file" in log, log
+            assert index.index_elements == 100 and _top(index, vecs[42]) == "p-42"
+        finally:
+            index.close()
+
+
+if __name__ == "__main__":
+    run(
+        check_loads_instead_of_rebuilding,
+        check_stale_file_is_caught_up,
+        check_mismatched_file_is_discarded,
+    )
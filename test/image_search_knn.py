@@ -0,0 +1,63 @@
+"""Project-scoped kNN (user-001).
+
+Invariants: a search returns min(k, project size) hits, all from the searched project,
+even when the project is a tiny slice of a large shared HNSW graph; small projects are
+scored exactly.
+"""
+
+from __future__ import annotations
+
+import numpy as np
+
+from _support import TempDir, open_index, random_vectors, record, run, unit
+
+
+def _fill(index, project_id: str, vecs: np.ndarray) -> list[str]:
+    ids = [f"{project_id}-{i}" for i in range(len(vecs))]
+    index.upsert_images(items=[(record(project_id, image_id), v) for image_id, v in zip(ids, vecs)])
+    return ids
+
+
+def check_small_project_in_large_db_returns_k() -> None:
+    with TempDir() as tmp:
+        # exact_search_max_project_size=0 forces the filtered HNSW walk for every project.
+        index = open_index(tmp / "db.sqlite", exact_search_max_project_size=0)
+        try:
+            _fill(index, "big", random_vectors(3000, seed=1))
+            small = random_vectors(12, seed=2)
+            ids = _fill(index, "small", small)
+
+            for query in random_vectors(20, seed=3):
+                hits = index.search_records(project_id="small", vector=query, limit=10)
+                assert len(hits) == 10, len(hits)
+                assert {r.project_id for r, _ in hits} == {"small"}
+            hits = index.search_records(project_id="small", vector=small[5], limit=50)
+            assert len(hits) == 12
+            assert hits[0][0].id == ids[5] and hits[0][1] > 0.999
+            assert index.search_records(project_id="nope", vector=small[0], limit=10) == []
+        finally:
+            index.close()
+
+
+def check_small_projects_are_exact() -> None:
+    with TempDir() as tmp:
+        index = open_index(tmp / "db.sqlite")
+        try:
+            _fill(index, "big", random_vectors(3000, seed=1))
+            vecs = random_vectors(200, seed=4)
+            ids = _fill(index, "p", vecs)
+            for query in random_vectors(5, seed=5):
+                expected = [ids[i] for i in np.argsort(-(vecs @ unit(query)))[:10]]
+                hits = index.search_records(project_id="p", vector=query, limit=10)
+                assert [r.id for r, _ in hits] == expected
+                scores = [s for _, s in hits]
+                assert np.allclose(scores, np.sort(vecs @ unit(query))[::-1][:10], atol=1e-4)
+        finally:
+            index.close()
+
+
+if __name__ == "__main__":
+    run(
+        check_small_project_in_large_db_returns_k,
+        check_small_projects_are_exact,
+    )
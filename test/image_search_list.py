@@ -0,0 +1,82 @@
+"""Keyset-paginated, streaming list_images (user-011).
+
+Invariants: following next_after visits every image exactly once in id order, even with
+writes between pages; the streamed (unpaginated JSON and NDJSON) bodies list the same
+images as the pages; a missing project is a 404 before any body is sent.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+
+from _support import TempDir, make_app, open_index, random_vectors, record, run
+
+
+def _client(index):
+    from fastapi.testclient import TestClient
+
+    return TestClient(make_app(index))
+
+
+def _fill(index, ids: list[str]) -> None:
+    vecs = random_vectors(len(ids), seed=len(ids))
+    index.upsert_images(items=[(record("p", image_id), v) for image_id, v in zip(ids, vecs)])
+
+
+def check_pages_cover_everything_once() -> None:
+    with TempDir() as tmp:
+        index = open_index(tmp / "db.sqlite")
+        try:
+            client = _client(index)
+            ids = [f"{i:04d}" for i in range(0, 250, 2)]
+            _fill(index, ids)
+
+            seen: list[str] = []
+            after = None
+            while True:
+                params = {"limit": 40} if after is None else {"limit": 40, "after": after}
+                body = client.get("/v1/projects/p/images", params=params).json()
+                seen += [img["id"] for img in body["images"]]
+                if len(seen) == 40:
+                    # Written between pages: before the cursor (skipped) and after it (listed).
+                    _fill(index, ["0001", "0201"])
+                after = body["next_after"]
+                if after is None:
+                    break
+            assert seen == sorted(ids + ["0201"]), seen
+        finally:
+            index.close()
+
+
+def check_streamed_bodies_match() -> None:
+    with TempDir() as tmp:
+        index = open_index(tmp / "db.sqlite")
+        os.environ["IMAGE_SEARCH_LIST_PAGE_SIZE"] = "7"
+        try:
+            client = _client(index)
+            ids = [f"img-{i:03d}" for i in range(30)]
+            _fill(index, ids)
+
+            body = client.get("/v1/projects/p/images").json()
+            assert [img["id"] for img in body["images"]] == ids and body["next_after"] is None
+
+            resp = client.get("/v1/projects/p/images", params={"format": "ndjson"})
+            assert resp.headers["content-type"].startswith("application/x-ndjson")
+            assert [json.loads(line)["id"] for line in resp.text.splitlines()] == ids
+
+            resp = client.get("/v1/projects/p/images", params={"format": "ndjson", "after": ids[9], "limit": 15})
+            assert [json.loads(line)["id"] for line in resp.text.splitlines()] == ids[10:25]
+
+            assert client.get("/v1/projects/missing/images").status_code == 404
+            assert client.get("/v1/projects/missing/images", params={"format": "ndjson"}).status_code == 404
+        finally:
+            del os.environ["IMAGE_SEARCH_LIST_PAGE_SIZE"]
+            index.close()
+
+
+if __name__ == "__main__":
+    run(
+        check_pages_cover_everything_once,
+        check_streamed_bodies_match,
+    )
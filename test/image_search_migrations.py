@@ -0,0 +1,143 @@
+"""Non-destructive schema migrations (user-008).
+
+Invariants: a DB written by the last release before migrations (schema v4) is upgraded in
+place step by step with every row and vector kept; --dry-run runs the steps but leaves
+the DB untouched; downgrades and pre-baseline schemas are refused.
+"""
+
+from __future__ import annotations
+
+import contextlib
+import io
+import sqlite3
+from pathlib import Path
+
+from _support import DIM, TempDir, open_index, random_vectors, run
+
+
+def _v4_fixture(path: Path, vecs) -> None:
+    # The schema exactly as v4 created it (the old hard-reset _init_schema).
+    conn = sqlite3.connect(str(path))
+    conn.executescript(
+        """
+        CREATE TABLE schema_version (id INTEGER PRIMARY KEY CHECK (id = 1), version INTEGER NOT NULL);
+        INSERT INTO schema_version(id, version) VALUES (1, 4);
+        CREATE TABLE projects (project_id TEXT PRIMARY KEY, created_at TEXT NOT NULL DEFAULT (CURRENT_TIMESTAMP));
+        CREATE TABLE image_ids (
+            internal_id INTEGER PRIMARY KEY, project_id TEXT NOT NULL, image_id TEXT NOT NULL,
+            UNIQUE(project_id, image_id)
+        );
+        CREATE TABLE image_records (
+            internal_id INTEGER PRIMARY KEY, r2_key TEXT NOT NULL, content_type TEXT NOT NULL,
+            original_filename TEXT, size_bytes INTEGER NOT NULL
+        );
+        CREATE TABLE image_vectors (internal_id INTEGER PRIMARY KEY, embedding BLOB NOT NULL);
+        """
+    )
+    with conn:
+        conn.execute("INSERT INTO projects(project_id) VALUES ('p')")
+        for i, vec in enumerate(vecs, start=1):
+            conn.execute("INSERT INTO image_ids VALUES (?, 'p', ?)", (i, f"img-{i}"))
+            conn.execute(
+                "INSERT INTO image_records VALUES (?, ?, 'image/jpeg', ?, 10)",
+                (i, f"AI/SEARCH/p/img-{i}.jpg", f"poster_{i}.jpg"),
+            )
+            conn.execute("INSERT INTO image_vectors VALUES (?, ?)", (i, vec.tobytes()))
+    conn.close()
+
+
+def _tables(path: Path) -> set[str]:
+    conn = sqlite3.connect(str(path))
+    try:
+        return {r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type IN ('table', 'index')")}
+    finally:
+        conn.close()
+
+
+def check_upgrade_from_v4() -> None:
+    from app.domains.image_search.migrations import LATEST_VERSION, MIGRATIONS, migrate, schema_version
+
+    with TempDir() as tmp:
+        db = tmp / "db.sqlite"
+        vecs = random_vectors(40, seed=1)
+        _v4_fixture(db, vecs)
+
+        conn = sqlite3.connect(str(db))
+        try:
+            results = migrate(conn, target=6)
+            assert [r.version for r in results] == [5, 6] and schema_version(conn) == 6
+            results = migrate(conn)
+            assert [r.version for r in results] == [m.version for m in MIGRATIONS if m.version > 6]
+            assert schema_version(conn) == LATEST_VERSION
+            assert migrate(conn) == []
+            blobs = [r[0] for r in conn.execute("SELECT embedding FROM image_vectors ORDER BY internal_id")]
+            assert blobs == [v.tobytes() for v in vecs]
+            assert conn.execute("SELECT COUNT(*) FROM image_records WHERE sha256 IS NULL").fetchone()[0] == 40
+        finally:
+            conn.close()
+
+        # The upgraded DB serves the old rows: vectors (HNSW rebuilt from them) and metadata.
+        index = open_index(db, exact_search_max_project_size=0)
+        try:
+            hits = index.search_records(project_id="p", vector=vecs[7], limit=3)
+            assert hits[0][0].id == "img-8" and hits[0][1] > 0.999
+            assert [r.id for r, _ in index.search_records_text(project_id="p", query="poster_12", limit=1)] == [
+                "img-12"
+            ]
+            assert len(index.list_records(project_id="p")) == 40
+        finally:
+            index.close()
+
+
+def check_dry_run_leaves_the_db_alone() -> None:
+    from app.domains.image_search.migrations import LATEST_VERSION, main
+
+    with TempDir() as tmp:
+        db = tmp / "db.sqlite"
+        _v4_fixture(db, random_vectors(5, seed=2))
+        before = _tables(db)
+        raw = db.read_bytes()
+
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            main(["--db", str(db), "--dry-run"])
+        lines = out.getvalue().splitlines()
+        assert lines[0].endswith(f"schema v4 -> v{LATEST_VERSION}"), lines
+        assert lines[-1].strip() == "dry run: rolled back"
+        assert len(lines) == 2 + LATEST_VERSION - 4
+        assert _tables(db) == before and db.read_bytes() == raw
+
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            main(["--db", str(db)])
+        assert "vector_changes" in _tables(db)
+
+
+def check_refuses_unknown_versions() -> None:
+    from app.domains.image_search.migrations import LATEST_VERSION, SchemaMigrationError, migrate
+
+    for version in (LATEST_VERSION + 1, 2):
+        with TempDir() as tmp:
+            db = tmp / "db.sqlite"
+            _v4_fixture(db, random_vectors(2, dim=DIM, seed=3))
+            conn = sqlite3.connect(str(db))
+            try:
+                with conn:
+                    conn.execute("UPDATE schema_version SET version = ?", (version,))
+                try:
+                    migrate(conn)
+                except SchemaMigrationError:
+                    pass
+                else:
+                    raise AssertionError(f"schema v{version} was migrated")
+                assert conn.execute("SELECT COUNT(*) FROM image_vectors").fetchone()[0] == 2
+            finally:
+                conn.close()
+
+
+if __name__ == "__main__":
+    run(
+        check_upgrade_from_v4,
+        check_dry_run_leaves_the_db_alone,
+        check_refuses_unknown_versions,
+    )
@@ -0,0 +1,153 @@
+"""NumPy exact index mirror (user-003).
+
+Invariants: searches return the exact top-k; the memory-mapped files are only trusted when
+their recorded vector_changes seq shows they hold exactly image_vectors, so an overwritten
+vector (same row count) or a crash between the DB commit and the mirror write never leaves
+a stale vector being served.
+"""
+
+from __future__ import annotations
+
+import numpy as np
+
+from _support import TempDir, open_index, random_vectors, record, run, unit
+
+
+def _open(tmp, *, numpy: bool = True):
+    from app.domains.image_search.vectordb import NumpyVectorIndex
+
+    kwargs = {}
+    if numpy:
+        kwargs["numpy_index"] = NumpyVectorIndex(root_dir=tmp / "numpy", vector_dim=16)
+    return open_index(tmp / "db.sqlite", **kwargs)
+
+
+def _fill(index, project_id: str, vecs: np.ndarray) -> list[str]:
+    ids = [f"{project_id}-{i}" for i in range(len(vecs))]
+    index.upsert_images(items=[(record(project_id, image_id), v) for image_id, v in zip(ids, vecs)])
+    return ids
+
+
+def _top(index, project_id: str, vector: np.ndarray, limit: int = 5) -> list[str]:
+    return [r.id for r, _ in index.search_records(project_id=project_id, vector=vector, limit=limit)]
+
+
+def _count_rebuilds(index) -> list[str]:
+    calls: list[str] = []
+    original = index.numpy_index.rebuild_project
+
+    def rebuild_project(*, project_id, rows, seq):
+        calls.append(project_id)
+        return original(project_id=project_id, rows=rows, seq=seq)
+
+    index.numpy_index.rebuild_project = rebuild_project
+    return calls
+
+
+def check_exact_results() -> None:
+    with TempDir() as tmp:
+        index = _open(tmp)
+        try:
+            vecs = random_vectors(300, seed=1)
+            ids = _fill(index, "p", vecs)
+            _fill(index, "q", random_vectors(50, seed=2))
+            for query in random_vectors(5, seed=3):
+                expected = [ids[i] for i in np.argsort(-(vecs @ unit(query)))[:10]]
+                assert _top(index, "p", query, 10) == expected
+        finally:
+            index.close()
+
+
+def check_overwrite_without_mirror_is_detected() -> None:
+    with TempDir() as tmp:
+        vecs = random_vectors(20, seed=1)
+        index = _open(tmp)
+        ids = _fill(index, "p", vecs)
+        assert _top(index, "p", vecs[3])[0] == ids[3]
+        index.close()
+
+        # Overwrite one vector while the mirror isn't loaded: the row count stays the same.
+        fresh = random_vectors(1, seed=42)[0]
+        index = _open(tmp, numpy=False)
+        index.upsert_images(items=[(record("p", ids[3]), fresh)])
+        index.close()
+
+        index = _open(tmp)
+        try:
+            rebuilds = _count_rebuilds(index)
+            hits = index.search_records(project_id="p", vector=fresh, limit=1)
+            assert hits[0][0].id == ids[3] and hits[0][1] > 0.999, hits
+            assert rebuilds == ["p"]
+        finally:
+            index.close()
+
+
+def check_unrelated_changes_keep_the_files() -> None:
+    with TempDir() as tmp:
+        index = _open(tmp)
+        _fill(index, "p", random_vectors(20, seed=1))
+        _top(index, "p", random_vectors(1, seed=2)[0])
+        index.close()
+
+        index = _open(tmp, numpy=False)
+        _fill(index, "other", random_vectors(5, seed=3))
+        index.close()
+
+        index = _open(tmp)
+        try:
+            rebuilds = _count_rebuilds(index)
+            _top(index, "p", random_vectors(1, seed=4)[0])
+            assert rebuilds == []
+        finally:
+            index.close()
+
+
+def check_dirty_files_are_rebuilt() -> None:
+    with TempDir() as tmp:
+        vecs = random_vectors(20, seed=1)
+        index = _open(tmp)
+        ids = _fill(index, "p", vecs)
+        _top(index, "p", vecs[0])
+        # Crash between the DB commit and the mirror write: the files stay marked dirty and
+        # hold garbage for the row being written.
+        index.numpy_index.mark_dirty(project_ids=["p"])
+        matrix = np.load(tmp / "numpy" / "p.npy", mmap_mode="r+")
+        matrix[:20] = matrix[:20][::-1].copy()
+        matrix.flush()
+        del matrix
+        index.close()
+
+        index = _open(tmp)
+        try:
+            rebuilds = _count_rebuilds(index)
+            assert _top(index, "p", vecs[7])[0] == ids[7]
+            assert rebuilds == ["p"]
+            assert index.numpy_index.synced_seq(project_id="p") is not None
+        finally:
+            index.close()
+
+
+def check_delete_keeps_rows_packed() -> None:
+    with TempDir() as tmp:
+        index = _open(tmp)
+        try:
+            vecs = random_vectors(10, seed=1)
+            ids = _fill(index, "p", vecs)
+            _top(index, "p", vecs[0])
+            index.delete_image(project_id="p", image_id=ids[2])
+            assert index.numpy_index.count(project_id="p") == 9
+            assert ids[2] not in _top(index, "p", vecs[2], 10)
+            rowids = np.load(tmp / "numpy" / "p.rowids.npy")
+            assert (rowids[:9] >= 0).all() and (rowids[9:] == -1).all()
+        finally:
+            index.close()
+
+
+if __name__ == "__main__":
+    run(
+        check_exact_results,
+        check_overwrite_without_mirror_is_detected,
+        check_unrelated_changes_keep_the_files,
+        check_dirty_files_are_rebuilt,
+        check_delete_keeps_rows_packed,
+    )
@@ -0,0 +1,105 @@
+"""Project deletion and the background R2 purge (user-022).
+
+Invariants: a project delete drops every row in one transaction and queues its R2 keys;
+the purge deletes queued objects, retries failures, and never deletes an object that a
+live record (of any project) still points at.
+"""
+
+from __future__ import annotations
+
+import asyncio
+
+from _support import FakeR2, TempDir, make_app, open_index, random_vectors, record, run
+
+
+def _fill(index, project_id: str, n: int, *, seed: int, keys: dict[int, str] | None = None) -> list[str]:
+    vecs = random_vectors(n, seed=seed)
+    recs = [record(project_id, f"{project_id}-{i}", r2_key=(keys or {}).get(i)) for i in range(n)]
+    index.upsert_images(items=list(zip(recs, vecs)))
+    return [r.r2_key for r in recs]
+
+
+def check_delete_queues_keys_in_one_transaction() -> None:
+    with TempDir() as tmp:
+        index = open_index(tmp / "db.sqlite")
+        try:
+            keys = _fill(index, "a", 5, seed=1)
+            _fill(index, "b", 3, seed=2)
+            assert index.delete_project(project_id="a") == 5
+            assert index.delete_project(project_id="a") is None
+            assert not index.project_exists(project_id="a")
+            assert index.list_records(project_id="a") == []
+            assert len(index.list_records(project_id="b")) == 3
+            assert sorted(key for _, key in index.purge_batch(limit=100)) == sorted(keys)
+            assert index.purge_pending(project_id="a") == 5
+        finally:
+            index.close()
+
+
+def check_shared_keys_are_not_queued() -> None:
+    with TempDir() as tmp:
+        index = open_index(tmp / "db.sqlite")
+        try:
+            keys = _fill(index, "a", 4, seed=1)
+            # b's image 0 points at a's object (e.g. an import from before keys were copied).
+            _fill(index, "b", 2, seed=2, keys={0: keys[0]})
+            assert index.r2_keys_in_use([keys[0], "nope"]) == {keys[0]}
+            index.delete_project(project_id="a")
+            queued = {key for _, key in index.purge_batch(limit=100)}
+            assert queued == set(keys[1:]), queued
+        finally:
+            index.close()
+
+
+def check_purge_deletes_retries_and_rechecks() -> None:
+    from app.lifespan import _image_search_purge_shard
+
+    with TempDir() as tmp:
+        index = open_index(tmp / "db.sqlite")
+        r2 = FakeR2()
+        app = make_app(index, r2=r2)
+        try:
+            keys = _fill(index, "a", 6, seed=1)
+            for key in keys:
+                r2.upload_bytes(key=key, data=b"x")
+            index.delete_project(project_id="a")
+            # A key re-referenced after it was queued must survive the purge.
+            _fill(index, "c", 1, seed=3, keys={0: keys[1]})
+            r2.fail_keys = {keys[2]}
+
+            asyncio.run(_image_search_purge_shard(app, 0))
+            assert set(r2.objects) == {keys[1], keys[2]}, sorted(r2.objects)
+            assert [key for _, key in index.purge_batch(limit=100)] == [keys[2]]
+
+            r2.fail_keys = set()
+            asyncio.run(_image_search_purge_shard(app, 0))
+            assert set(r2.objects) == {keys[1]}
+            assert index.purge_pending() == 0
+        finally:
+            index.close()
+
+
+def check_delete_endpoint() -> None:
+    from fastapi.testclient import TestClient
+
+    with TempDir() as tmp:
+        index = open_index(tmp / "db.sqlite")
+        try:
+            client = TestClient(make_app(index))
+            _fill(index, "a", 3, seed=1)
+            resp = client.delete("/v1/projects/a")
+            assert resp.status_code == 202, resp.text
+            assert resp.json() == {"project_id": "a", "deleted_images": 3, "pending_objects": 3}
+            assert client.delete("/v1/projects/a").status_code == 404
+            assert client.get("/v1/image-search/purge").json()["pending"] == 3
+        finally:
+            index.close()
+
+
+if __name__ == "__main__":
+    run(
+        check_delete_queues_keys_in_one_transaction,
+        check_shared_keys_are_not_queued,
+        check_purge_deletes_retries_and_rechecks,
+        check_delete_endpoint,
+    )
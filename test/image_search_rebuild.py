@@ -0,0 +1,69 @@
+"""Streaming, batched HNSW rebuild (user-004).
+
+Invariants: the rebuild pages image_vectors in chunks and reports (done, total); searches
+stay correct (exact) while it runs; writes interleaved between steps end up in the index.
+"""
+
+from __future__ import annotations
+
+from _support import TempDir, open_index, random_vectors, record, run
+
+
+def check_deferred_rebuild_in_chunks() -> None:
+    with TempDir() as tmp:
+        vecs = random_vectors(520, seed=1)
+        index = open_index(tmp / "db.sqlite")
+        index.upsert_images(items=[(record("p", f"p-{i}"), v) for i, v in enumerate(vecs[:500])])
+        index.close()
+
+        # The HNSW graph lives in memory; a reopened DB without an index file rebuilds it.
+        index = open_index(tmp / "db.sqlite", defer_rebuild=True, exact_search_max_project_size=0)
+        try:
+            assert index.rebuilding
+            steps = index.iter_rebuild_vector_index_from_vectors(chunk_size=100)
+            progress = [next(steps), next(steps)]
+            assert progress == [(0, 500), (100, 500)], progress
+
+            # Mid-rebuild: searches are exact, and writes land wherever the cursor is.
+            hits = index.search_records(project_id="p", vector=vecs[450], limit=3)
+            assert hits[0][0].id == "p-450" and len(hits) == 3
+            index.upsert_images(items=[(record("p", f"p-{i}"), vecs[i]) for i in range(500, 520)])
+            index.delete_image(project_id="p", image_id="p-10")
+            index.delete_image(project_id="p", image_id="p-300")
+
+            progress += list(steps)
+            assert progress[-1] == (519, 519), progress  # p-10 was copied before its delete
+            assert all(b - a <= 100 for (a, _), (b, _) in zip(progress, progress[1:]))
+            assert not index.rebuilding and index.index_elements == 518
+
+            for i in (0, 250, 499, 510, 519):
+                hits = index.search_records(project_id="p", vector=vecs[i], limit=5)
+                assert hits[0][0].id == f"p-{i}" and len(hits) == 5
+            for i in (10, 300):
+                ids = [r.id for r, _ in index.search_records(project_id="p", vector=vecs[i], limit=5)]
+                assert f"p-{i}" not in ids
+        finally:
+            index.close()
+
+
+def check_eager_rebuild_on_open() -> None:
+    with TempDir() as tmp:
+        vecs = random_vectors(300, seed=2)
+        index = open_index(tmp / "db.sqlite")
+        index.upsert_images(items=[(record("p", f"p-{i}"), v) for i, v in enumerate(vecs)])
+        index.close()
+
+        index = open_index(tmp / "db.sqlite", exact_search_max_project_size=0, rebuild_chunk_size=64)
+        try:
+            assert not index.rebuilding and not index.needs_rebuild()
+            assert index.index_elements == 300
+            assert index.search_records(project_id="p", vector=vecs[123], limit=1)[0][0].id == "p-123"
+        finally:
+            index.close()
+
+
+if __name__ == "__main__":
+    run(
+        check_deferred_rebuild_in_chunks,
+        check_eager_rebuild_on_open,
+    )
@@ -0,0 +1,95 @@
+"""Search result cache (user-013).
+
+Invariants: entries are LRU-bounded and expire after the TTL; every write to a project
+bumps its generation, so neither an entry cached before the write nor one computed by a
+search that raced it is served afterwards.
+"""
+
+from __future__ import annotations
+
+import io
+import time
+
+from _support import FakeEmbedder, TempDir, make_app, open_index, random_vectors, record, run
+
+
+def _results(*ids: str):
+    return [(record("p", image_id), 1.0) for image_id in ids]
+
+
+def check_lru_and_ttl() -> None:
+    from app.domains.image_search.cache import SearchResultCache
+
+    cache = SearchResultCache(max_entries=2, ttl_seconds=60)
+    for query in ("a", "b"):
+        cache.put(project_id="p", query=query, limit=5, generation=0, results=_results(query))
+    assert cache.get(project_id="p", query="a", limit=5) is not None  # "b" is now least recent
+    cache.put(project_id="p", query="c", limit=5, generation=0, results=_results("c"))
+    assert cache.get(project_id="p", query="b", limit=5) is None
+    assert [r.id for r, _ in cache.get(project_id="p", query="a", limit=5)] == ["a"]
+    assert cache.get(project_id="p", query="a", limit=10) is None
+    assert cache.get(project_id="p", query="a", limit=5, mode="text") is None
+    assert cache.stats()["evictions"] == 1
+
+    cache = SearchResultCache(max_entries=10, ttl_seconds=0.05)
+    cache.put(project_id="p", query="a", limit=5, generation=0, results=_results("a"))
+    assert cache.get(project_id="p", query="a", limit=5) is not None
+    time.sleep(0.1)
+    assert cache.get(project_id="p", query="a", limit=5) is None
+
+    assert not SearchResultCache(max_entries=0).enabled
+
+
+def check_generation_invalidation() -> None:
+    from app.domains.image_search.cache import SearchResultCache
+
+    cache = SearchResultCache()
+    cache.put(project_id="p", query="a", limit=5, generation=0, results=_results("a"))
+    cache.put(project_id="q", query="a", limit=5, generation=0, results=_results("a"))
+    cache.invalidate("p")
+    assert cache.get(project_id="p", query="a", limit=5) is None
+    assert cache.get(project_id="q", query="a", limit=5) is not None
+
+    # A search that read the generation, then raced a write, must not cache its results.
+    generation = cache.generation("p")
+    cache.invalidate("p")
+    cache.put(project_id="p", query="a", limit=5, generation=generation, results=_results("stale"))
+    assert cache.get(project_id="p", query="a", limit=5) is None
+
+
+def check_writes_invalidate_through_the_api() -> None:
+    from fastapi.testclient import TestClient
+
+    with TempDir() as tmp:
+        index = open_index(tmp / "db.sqlite")
+        embedder = FakeEmbedder()
+        try:
+            client = TestClient(make_app(index, embedder=embedder))
+            index.upsert_images(items=[(record("p", f"p-{i}"), v) for i, v in enumerate(random_vectors(5, seed=1))])
+            body = {"query": "red poster", "limit": 10}
+
+            first = client.post("/v1/projects/p/images/search", json=body).json()
+            assert client.post("/v1/projects/p/images/search", json=body).json() == first
+            assert embedder.calls == [("text", 1)]
+
+            files = {"file": ("new.jpg", io.BytesIO(b"new image"), "image/jpeg")}
+            new_id = client.post("/v1/projects/p/images", files=files).json()["id"]
+            after = client.post("/v1/projects/p/images/search", json=body).json()
+            assert new_id in [hit["id"] for hit in after["results"]], after
+            assert embedder.calls[-1] == ("text", 1) and len(embedder.calls) == 3
+
+            client.delete(f"/v1/projects/p/images/{new_id}")
+            final = client.post("/v1/projects/p/images/search", json=body).json()
+            assert new_id not in [hit["id"] for hit in final["results"]]
+            stats = client.app.state.image_search.search_cache.stats()
+            assert stats["hits"] == 1 and stats["invalidations"] == 2
+        finally:
+            index.close()
+
+
+if __name__ == "__main__":
+    run(
+        check_lru_and_ttl,
+        check_generation_invalidation,
+        check_writes_invalidate_through_the_api,
+    )
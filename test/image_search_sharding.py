@@ -0,0 +1,140 @@
+"""Project-hash sharding (user-020).
+
+Invariants: shard_of is a fixed function of (project_id, shard count), the same in every
+process and release; each project's rows live only in its shard's file; calls that are not
+project-scoped see every shard; writes to different shards run concurrently; startup
+refuses a DB directory laid out for another shard count.
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+
+import anyio
+
+from _support import TempDir, open_index, random_vectors, record, run
+
+
+def check_shard_of_is_stable() -> None:
+    from app.domains.image_search.sharding import shard_db_path, shard_of
+
+    # Pinned: a change here moves existing projects to files that don't hold them.
+    golden = {"default": (2, 2), "p": (3, 15), "q": (1, 5), "project-a": (0, 4), "한글": (1, 9)}
+    assert {p: (shard_of(p, 4), shard_of(p, 16)) for p in golden} == golden
+    assert {shard_of(p, 1) for p in golden} == {0} and {shard_of(p, 0) for p in golden} == {0}
+
+    spread = Counter(shard_of(f"project-{i}", 8) for i in range(8000))
+    assert set(spread) == set(range(8)) and min(spread.values()) > 850, spread
+
+    db = Path("/data/image_search.db")
+    assert shard_db_path(db, 0, 1) == db
+    assert shard_db_path(db, 3, 4) == Path("/data/image_search.shard-3-of-4.db")
+
+
+def check_shard_layout_is_enforced() -> None:
+    from app.domains.image_search.sharding import check_shard_layout, shard_db_path
+
+    with TempDir() as tmp:
+        db = tmp / "image_search.db"
+        for shards in (1, 4):
+            check_shard_layout(db, shards)  # empty directory: any count
+
+        for shard in range(4):
+            shard_db_path(db, shard, 4).write_bytes(b"x")
+        check_shard_layout(db, 4)
+        for shards in (1, 2, 8):
+            try:
+                check_shard_layout(db, shards)
+            except RuntimeError as exc:
+                assert "IMAGE_SEARCH_SHARDS=4" in str(exc)
+            else:
+                raise AssertionError(f"4-shard layout accepted for {shards} shards")
+
+        for shard in range(4):
+            shard_db_path(db, shard, 4).unlink()
+        db.write_bytes(b"")  # an empty file holds no projects
+        check_shard_layout(db, 4)
+        db.write_bytes(b"x")
+        check_shard_layout(db, 1)
+        try:
+            check_shard_layout(db, 4)
+        except RuntimeError:
+            pass
+        else:
+            raise AssertionError("unsharded DB accepted for 4 shards")
+
+
+def check_rows_live_in_their_shard() -> None:
+    from app.domains.image_search.sharding import ShardedVectorIndex, shard_db_path, shard_of
+
+    with TempDir() as tmp:
+        db = tmp / "image_search.db"
+        index = ShardedVectorIndex([open_index(shard_db_path(db, i, 4)) for i in range(4)])
+        try:
+            projects = ["default", "p", "q", "project-a"]  # shards 2, 3, 1, 0
+            vecs = random_vectors(len(projects), seed=1)
+            for project_id, vec in zip(projects, vecs):
+                index.upsert_images(items=[(record(project_id, "img", sha256=project_id), vec)])
+            for project_id in projects:
+                owner = shard_of(project_id, 4)
+                for i, shard in enumerate(index.shards):
+                    assert shard.project_exists(project_id=project_id) == (i == owner)
+                hits = index.search_records(project_id=project_id, vector=vecs[projects.index(project_id)], limit=5)
+                assert [(r.project_id, r.id) for r, _ in hits] == [(project_id, "img")]
+
+            assert set(index.vectors_by_sha256(projects + ["missing"])) == set(projects)
+            before = index.change_counter()
+            index.delete_image(project_id="q", image_id="img")
+            assert index.change_counter() > before
+            assert index.r2_keys_in_use([record(p, "img").r2_key for p in projects]) == {
+                record(p, "img").r2_key for p in projects if p != "q"
+            }
+        finally:
+            index.close()
+
+
+def check_writes_to_different_shards_overlap() -> None:
+    from app.domains.image_search.executor import DBExecutor
+    from app.domains.image_search.sharding import ShardedVectorIndex, shard_db_path
+
+    with TempDir() as tmp:
+        db = tmp / "image_search.db"
+        index = ShardedVectorIndex([open_index(shard_db_path(db, i, 2)) for i in range(2)])
+        executor = DBExecutor(vector_index=index)
+        try:
+            running = Counter()
+            peak = Counter()
+            guard = threading.Lock()
+
+            def write(shard: int) -> None:
+                with guard:
+                    running[shard] += 1
+                    running["all"] += 1
+                    peak[shard] = max(peak[shard], running[shard])
+                    peak["all"] = max(peak["all"], running["all"])
+                time.sleep(0.05)
+                with guard:
+                    running[shard] -= 1
+                    running["all"] -= 1
+
+            async def main() -> None:
+                async with anyio.create_task_group() as tg:
+                    for shard in (0, 1, 0, 1):
+                        tg.start_soon(lambda s=shard: executor.write("w", lambda: write(s), shard=s))
+
+            anyio.run(main)
+            assert peak[0] == 1 and peak[1] == 1 and peak["all"] == 2, peak
+        finally:
+            index.close()
+
+
+if __name__ == "__main__":
+    run(
+        check_shard_of_is_stable,
+        check_shard_layout_is_enforced,
+        check_rows_live_in_their_shard,
+        check_writes_to_different_shards_overlap,
+    )
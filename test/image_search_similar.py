@@ -0,0 +1,85 @@
+""""More like this" search (user-024).
+
+Invariants: results are the project's nearest neighbours of the image's stored vector,
+without the image itself and without running the embedder or touching R2; deleting a
+neighbour drops it from the next (cached) result; unknown images and projects are 404.
+"""
+
+from __future__ import annotations
+
+import uuid
+
+from _support import FakeEmbedder, FakeR2, TempDir, make_app, open_index, random_vectors, record, run
+
+
+def _uid(i: int) -> str:
+    return str(uuid.UUID(int=i + 1))
+
+
+def _similar(client, project_id: str, image_id: str, **payload):
+    return client.post(f"/v1/projects/{project_id}/images/{image_id}/similar", json=payload)
+
+
+class CountingR2(FakeR2):
+    def __init__(self) -> None:
+        super().__init__()
+        self.downloads = 0
+
+    def download_bytes(self, *, key: str) -> bytes:
+        self.downloads += 1
+        return super().download_bytes(key=key)
+
+    def download_file(self, *, key: str, path: str) -> None:
+        self.downloads += 1
+        super().download_file(key=key, path=path)
+
+
+def check_neighbours_of_the_stored_vector() -> None:
+    from fastapi.testclient import TestClient
+
+    with TempDir() as tmp:
+        index = open_index(tmp / "db.sqlite", exact_search_max_project_size=0)
+        r2, embedder = CountingR2(), FakeEmbedder()
+        try:
+            client = TestClient(make_app(index, r2=r2, embedder=embedder))
+            vecs = random_vectors(200, seed=1)
+            index.upsert_images(items=[(record("p", _uid(i)), v) for i, v in enumerate(vecs)])
+            index.upsert_images(items=[(record("q", "twin"), vecs[17])])
+
+            resp = _similar(client, "p", _uid(17), limit=5)
+            assert resp.status_code == 200, resp.text
+            ids = [hit["id"] for hit in resp.json()["results"]]
+            expected = [r.id for r, _ in index.search_records(project_id="p", vector=vecs[17], limit=6)][1:]
+            assert ids == expected and _uid(17) not in ids and len(ids) == 5
+            assert all(hit["project_id"] == "p" for hit in resp.json()["results"])
+            assert embedder.calls == [] and r2.downloads == 0
+
+            assert client.delete(f"/v1/projects/p/images/{ids[0]}").status_code == 204
+            again = [hit["id"] for hit in _similar(client, "p", _uid(17), limit=5).json()["results"]]
+            assert ids[0] not in again and again[:4] == ids[1:]
+        finally:
+            index.close()
+
+
+def check_unknown_image_or_project() -> None:
+    from fastapi.testclient import TestClient
+
+    with TempDir() as tmp:
+        index = open_index(tmp / "db.sqlite")
+        try:
+            client = TestClient(make_app(index))
+            index.upsert_images(items=[(record("p", _uid(0)), random_vectors(1, seed=2)[0])])
+            assert _similar(client, "p", _uid(0)).json()["results"] == []
+            resp = _similar(client, "p", _uid(1))
+            assert resp.status_code == 404 and resp.json()["error"]["code"] == "NOT_FOUND"
+            assert _similar(client, "missing", _uid(0)).status_code == 404
+            assert _similar(client, "p", "not-a-uuid").json()["error"]["code"] == "INVALID_ID"
+        finally:
+            index.close()
+
+
+if __name__ == "__main__":
+    run(
+        check_neighbours_of_the_stored_vector,
+        check_unknown_image_or_project,
+    )
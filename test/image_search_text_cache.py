@@ -0,0 +1,102 @@
+"""Query text embedding cache (user-014).
+
+Invariants: lookups are keyed by (model, normalized text), so whitespace/NFC variants share
+an entry and a model change never serves the old model's vectors; the SQLite store survives
+a restart; `warm` reports the most used queries the current model has no vector for; a
+cached query never reaches the embedder.
+"""
+
+from __future__ import annotations
+
+import numpy as np
+
+from _support import FakeEmbedder, TempDir, make_app, open_index, random_vectors, record, run
+
+
+def check_normalized_per_model_keys() -> None:
+    from app.domains.image_search.cache import TextEmbeddingCache
+
+    cache = TextEmbeddingCache(path=None, max_entries=2)
+    vec = random_vectors(1, seed=1)[0]
+    stored = cache.put(model_name="a", text="  red\tposter ", vector=vec)
+    assert stored.dtype == np.float32 and not stored.flags.writeable
+    assert np.array_equal(cache.get(model_name="a", text="red poster"), vec)
+    assert cache.get(model_name="a", text="cafe\u0301") is None  # decomposed; NFC makes it "caf\u00e9"
+    cache.put(model_name="a", text="caf\u00e9", vector=vec)
+    assert cache.get(model_name="a", text="cafe\u0301") is not None
+    assert cache.get(model_name="b", text="red poster") is None
+
+    # LRU: "red poster" was used least recently of the two kept entries.
+    cache.put(model_name="a", text="blue", vector=vec)
+    assert cache.get(model_name="a", text="red poster") is None
+    assert cache.stats()["entries"] == 2
+
+
+def check_store_survives_restart_and_warms() -> None:
+    from app.domains.image_search.cache import TextEmbeddingCache
+
+    with TempDir() as tmp:
+        path = tmp / "text_cache.db"
+        vecs = random_vectors(3, seed=2)
+        cache = TextEmbeddingCache(path=path, max_entries=16)
+        for text, vec, uses in zip(("rare", "common", "popular"), vecs, (0, 3, 6)):
+            cache.put(model_name="old", text=text, vector=vec)
+            for _ in range(uses):
+                cache.get(model_name="old", text=text)
+        cache.close()
+
+        cache = TextEmbeddingCache(path=path, max_entries=16)
+        try:
+            assert np.array_equal(cache.get(model_name="old", text="common"), vecs[1])
+            assert cache.stats()["disk_hits"] == 1 and cache.stats()["hits"] == 0
+            assert cache.get(model_name="old", text="common") is not None
+            assert cache.stats()["hits"] == 1
+
+            cache.put(model_name="new", text="common", vector=vecs[1])
+            assert cache.warm(model_name="new", limit=10) == ["popular", "rare"]
+            assert cache.warm(model_name="new", limit=1) == ["popular"]
+            assert cache.warm(model_name="old", limit=10) == []
+        finally:
+            cache.close()
+
+        cache = TextEmbeddingCache(path=path, max_entries=16)
+        try:
+            cache.warm(model_name="old", limit=2)
+            assert cache.get(model_name="old", text="popular") is not None
+            assert cache.stats()["hits"] == 1 and cache.stats()["disk_hits"] == 0
+        finally:
+            cache.close()
+
+
+def check_cached_queries_skip_the_embedder() -> None:
+    from fastapi.testclient import TestClient
+
+    from app.domains.image_search.cache import TextEmbeddingCache
+
+    with TempDir() as tmp:
+        index = open_index(tmp / "db.sqlite")
+        embedder = FakeEmbedder()
+        try:
+            app = make_app(index, embedder=embedder)
+            app.state.image_search.text_cache = TextEmbeddingCache(path=tmp / "text_cache.db")
+            client = TestClient(app)
+            index.upsert_images(items=[(record("p", f"p-{i}"), v) for i, v in enumerate(random_vectors(5, seed=3))])
+
+            first = client.post("/v1/projects/p/images/search", json={"query": "red  poster", "limit": 3}).json()
+            # Invalidate the result cache so the second search has to embed the query again.
+            app.state.image_search.search_cache.invalidate("p")
+            second = client.post("/v1/projects/p/images/search", json={"query": " red poster", "limit": 3}).json()
+            assert first == second
+            assert embedder.calls == [("text", 1)]
+            assert app.state.image_search.text_cache.stats()["hits"] == 1
+        finally:
+            app.state.image_search.text_cache.close()
+            index.close()
+
+
+if __name__ == "__main__":
+    run(
+        check_normalized_per_model_keys,
+        check_store_survives_restart_and_warms,
+        check_cached_queries_skip_the_embedder,
+    )